@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare JSON codecs on a big dns_records listing page and a batch
+request body.
+
+Usage::
+
+    python benchmarks/bench_codec.py [records]
+"""
+import json
+import sys
+import timeit
+
+from twindb_cloudflare.codec import CODECS
+
+
+def listing_page(records):
+    return {
+        "success": True,
+        "errors": [],
+        "messages": [],
+        "result": [
+            {
+                "id": "%032x" % i,
+                "type": "A",
+                "name": "host%d.twindb.com" % i,
+                "content": "10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255,
+                                            i & 255),
+                "proxiable": True,
+                "proxied": False,
+                "ttl": 1,
+                "locked": False,
+                "zone_id": "02cffc58027ebabbe29614c6bf6e3716",
+                "zone_name": "twindb.com",
+                "created_on": "2016-07-16T22:33:38.193745Z",
+                "modified_on": "2016-07-16T22:33:38.193745Z",
+                "meta": {"auto_added": False}
+            } for i in range(records)
+        ],
+        "result_info": {"page": 1, "per_page": records, "count": records,
+                        "total_count": records, "total_pages": 1}
+    }
+
+
+def batch_body(records):
+    return [{"name": "host%d.twindb.com" % i,
+             "content": "10.0.%d.%d" % (i >> 8 & 255, i & 255),
+             "type": "A",
+             "ttl": 1} for i in range(records)]
+
+
+def bench(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    page = listing_page(records)
+    body = batch_body(records)
+    page_bytes = json.dumps(page).encode('utf-8')
+    number = 20
+
+    print("%d records, listing page %d bytes" % (records, len(page_bytes)))
+    print("%-10s %12s %12s" % ("codec", "decode, ms", "encode, ms"))
+
+    # What the client did before codecs: str in the middle both ways
+    decode = bench(lambda: json.loads(page_bytes.decode('utf-8')), number)
+    encode = bench(lambda: json.dumps(body).encode('utf-8'), number)
+    print("%-10s %12.2f %12.2f" % ("legacy", decode * 1000, encode * 1000))
+
+    for codec_class in CODECS:
+        try:
+            codec = codec_class()
+        except ImportError:
+            print("%-10s %12s %12s" % (codec_class.name,
+                                       "n/a", "n/a"))
+            continue
+        decode = bench(lambda: codec.decode(page_bytes), number)
+        encode = bench(lambda: codec.encode(body), number)
+        print("%-10s %12.2f %12.2f" % (codec.name,
+                                       decode * 1000, encode * 1000))
+
+
+if __name__ == '__main__':
+    main()
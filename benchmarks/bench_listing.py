@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure what a big dns_records listing costs on the wire and in memory:
+response size with each content coding, decode time and the size
+of the listing kept by the caller, full and trimmed to RECORD_FIELDS.
+
+Usage::
+
+    python benchmarks/bench_listing.py [records]
+"""
+import json
+import sys
+import timeit
+import zlib
+
+from twindb_cloudflare.codec import get_codec
+from twindb_cloudflare.twindb_cloudflare import RECORD_FIELDS, \
+    _trim_records
+
+sys.path.insert(0, 'benchmarks')
+from bench_codec import listing_page  # noqa: E402
+
+
+def deep_size(obj):
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key) + deep_size(value)
+                    for key, value in obj.items())
+    elif isinstance(obj, list):
+        size += sum(deep_size(item) for item in obj)
+    return size
+
+
+def bench(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    page_bytes = json.dumps(listing_page(records)).encode('utf-8')
+    codec = get_codec()
+    number = 20
+
+    print("%d records, %s codec" % (records, codec.name))
+    print("%-12s %12s" % ("coding", "bytes"))
+    print("%-12s %12d" % ("identity", len(page_bytes)))
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31)
+    print("%-12s %12d" % ("gzip", len(gzip.compress(page_bytes) +
+                                      gzip.flush())))
+    try:
+        import brotli
+        print("%-12s %12d" % ("br", len(brotli.compress(page_bytes))))
+    except ImportError:
+        print("%-12s %12s" % ("br", "n/a"))
+
+    def full():
+        return codec.decode(page_bytes)['result']
+
+    def trimmed():
+        return _trim_records(codec.decode(page_bytes)['result'],
+                             RECORD_FIELDS)
+
+    print("")
+    print("%-12s %12s %12s" % ("records", "decode, ms", "kept, KiB"))
+    for name, func in [('full', full), ('trimmed', trimmed)]:
+        print("%-12s %12.2f %12d" % (name, bench(func, number) * 1000,
+                                     deep_size(func()) // 1024))
+
+
+if __name__ == '__main__':
+    main()
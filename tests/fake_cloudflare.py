@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+In-process fake of the CloudFlare API for tests that need a real
+HTTP server. It keeps zones and DNS records in memory.
+"""
+import datetime
+import gzip
+import io
+import json
+import re
+import threading
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+API_PREFIX = '/client/v4'
+
+_ZONES = re.compile(r'^/zones$')
+_RECORDS = re.compile(r'^/zones/([^/]+)/dns_records$')
+_RECORD = re.compile(r'^/zones/([^/]+)/dns_records/([^/]+)$')
+
+
+def _record_order(record):
+    return record['name'], record['type'], record['id']
+
+
+def _gzip(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as gzip_file:
+        gzip_file.write(data)
+    return buf.getvalue()
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, result=None, result_info=None, errors=None):
+        body = {
+            'success': status < 400,
+            'errors': errors or [],
+            'messages': [],
+            'result': result
+        }
+        if result_info is not None:
+            body['result_info'] = result_info
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if self.server.api.compress and \
+                'gzip' in self.headers.get('Accept-Encoding', ''):
+            data = _gzip(data)
+            self.send_header('Content-Encoding', 'gzip')
+        self.server.api.count_bytes(len(data))
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def _dispatch(self, method):
+        api = self.server.api
+        url = urlparse(self.path)
+        path = url.path[len(API_PREFIX):]
+        query = dict((key, values[0])
+                     for key, values in parse_qs(url.query).items())
+        api.count(method, path)
+        try:
+            status, result, result_info = api.handle(method, path, query,
+                                                     self._body())
+        except KeyError:
+            self._reply(404, errors=[{'code': 7003,
+                                      'message': 'Could not route'}])
+            return
+        self._reply(status, result, result_info)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+class FakeCloudFlare(object):
+    """
+    Fake CloudFlare API served on localhost.
+
+    Use as a context manager, ``endpoint`` is the API endpoint
+    to pass to CloudFlare().
+    """
+    def __init__(self):
+        self.zones = {}
+        """zone name -> zone id"""
+        self.records = {}
+        """zone id -> {record id -> record}"""
+        self.requests = {}
+        """(method, path without query) -> number of requests"""
+        self.compress = False
+        """gzip responses if the client accepts it"""
+        self.bytes_sent = 0
+        """total size of response bodies"""
+        self._modified = datetime.datetime(2016, 7, 1)
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.api = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self.endpoint = 'http://127.0.0.1:%d%s' % \
+            (self._server.server_address[1], API_PREFIX)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    @property
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    def count(self, method, path):
+        key = (method, re.sub(r'/[0-9a-f]{32}', '/<id>', path))
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def count_bytes(self, size):
+        with self._lock:
+            self.bytes_sent += size
+
+    def _touch(self, record):
+        """
+        Set modified_on of a record. Every change gets a later time.
+        """
+        now = max(datetime.datetime.utcnow(),
+                  self._modified + datetime.timedelta(microseconds=1))
+        self._modified = now
+        record['modified_on'] = now.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+    def add_zone(self, name):
+        zone_id = uuid.uuid4().hex
+        with self._lock:
+            self.zones[name] = zone_id
+            self.records[zone_id] = {}
+        return zone_id
+
+    def add_record(self, zone_id, name, content, record_type='A', ttl=1):
+        record_id = uuid.uuid4().hex
+        record = {
+            'id': record_id,
+            'zone_id': zone_id,
+            'name': name,
+            'type': record_type,
+            'content': content,
+            'ttl': ttl,
+            'proxied': False
+        }
+        with self._lock:
+            self._touch(record)
+            self.records[zone_id][record_id] = record
+        return record
+
+    def handle(self, method, path, query, body):
+        with self._lock:
+            if _ZONES.match(path) and method == 'GET':
+                result = [{'id': zone_id, 'name': name}
+                          for name, zone_id in sorted(self.zones.items())
+                          if query.get('name', name) == name]
+                return self._page(result, query)
+
+            match = _RECORDS.match(path)
+            if match:
+                records = self.records[match.group(1)]
+                if method == 'GET':
+                    result = [dict(record)
+                              for record in sorted(records.values(),
+                                                   key=_record_order)
+                              if query.get('name', record['name']) ==
+                              record['name'] and
+                              query.get('type', record['type']) ==
+                              record['type']]
+                    if 'order' in query:
+                        result.sort(key=lambda r: r[query['order']],
+                                    reverse=query.get('direction') == 'desc')
+                    return self._page(result, query)
+                if method == 'POST':
+                    record = dict(body, id=uuid.uuid4().hex,
+                                  zone_id=match.group(1))
+                    self._touch(record)
+                    records[record['id']] = record
+                    return 200, dict(record), None
+
+            match = _RECORD.match(path)
+            if match:
+                records = self.records[match.group(1)]
+                record = records[match.group(2)]
+                if method == 'GET':
+                    return 200, dict(record), None
+                if method == 'PUT':
+                    record.update(body)
+                    self._touch(record)
+                    return 200, dict(record), None
+                if method == 'DELETE':
+                    del records[match.group(2)]
+                    return 200, {'id': match.group(2)}, None
+
+        raise KeyError(path)
+
+    @staticmethod
+    def _page(result, query):
+        page = int(query.get('page', 1))
+        per_page = int(query.get('per_page', 20))
+        total_pages = (len(result) + per_page - 1) // per_page
+        chunk = result[(page - 1) * per_page:page * per_page]
+        return 200, chunk, {
+            'page': page,
+            'per_page': per_page,
+            'count': len(chunk),
+            'total_count': len(result),
+            'total_pages': total_pages
+        }
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Record and replay CloudFlare API interactions.
+
+RecordingProxy is a local HTTP server that forwards requests
+to the real API and saves every interaction to a fixture file.
+Point a client to it once::
+
+    with RecordingProxy('tests/fixtures/zone.json') as proxy:
+        cf = CloudFlare(email, auth_key, api_endpoint=proxy.endpoint)
+        list(cf.list_dns_records(cf.get_zone_id('twindb.com')))
+
+ReplayServer serves the saved responses from localhost, optionally
+delayed by a latency model, so the whole client - sessions, retries,
+pagination - runs against realistic traffic without network::
+
+    with ReplayServer('tests/fixtures/zone.json',
+                      latency=LogNormalLatency(0.05, 0.5)) as server:
+        cf = CloudFlare(email, auth_key, api_endpoint=server.endpoint)
+
+Credentials are never saved: fixtures keep the method, path, request
+body and the response status, a few headers, body and time it took.
+"""
+import json
+import math
+import random
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from twindb_cloudflare.session import SessionPool
+from twindb_cloudflare.twindb_cloudflare import CF_API_ENDPOINT
+
+API_PREFIX = '/client/v4'
+
+RECORDED_HEADERS = ('Content-Type', 'ETag', 'Retry-After', 'CF-RAY')
+"""Response headers saved to fixtures"""
+
+FORWARDED_HEADERS = ('X-Auth-Email', 'X-Auth-Key', 'Content-Type',
+                     'If-None-Match')
+"""Request headers passed to the real API"""
+
+
+def load_fixture(path):
+    """
+    Read interactions from a fixture file
+
+    :param path: path to the fixture
+    :return: list of interactions
+    """
+    with open(path) as fixture:
+        return json.load(fixture)
+
+
+def save_fixture(path, interactions):
+    """
+    Write interactions to a fixture file
+
+    :param path: path to the fixture
+    :param interactions: list of interactions
+    """
+    with open(path, 'w') as fixture:
+        json.dump(interactions, fixture, indent=2, sort_keys=True)
+
+
+class ConstantLatency(object):
+    """
+    Delay every response by the same time
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def delay(self, interaction):
+        return self.seconds
+
+
+class RecordedLatency(object):
+    """
+    Delay responses by the time they took when recorded
+    """
+    def __init__(self, scale=1.0):
+        """
+        :param scale: multiply recorded times by this factor
+        """
+        self.scale = scale
+
+    def delay(self, interaction):
+        return interaction.get('elapsed', 0) * self.scale
+
+
+class LogNormalLatency(object):
+    """
+    Random delays with a long tail, the way API latency usually looks
+    """
+    def __init__(self, median, sigma, seed=None):
+        """
+        :param median: median delay in seconds
+        :param sigma: spread, 0.5 gives p99 about 3.2 times the median
+        :param seed: seed of the random generator
+        """
+        self._mu = math.log(median)
+        self._sigma = sigma
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, interaction):
+        with self._lock:
+            return self._random.lognormvariate(self._mu, self._sigma)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, headers, data = self.server.app.handle(
+            method, self.path[len(API_PREFIX):], self.headers, body)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+class _LocalServer(object):
+    """
+    Base class of servers on localhost. Use as a context manager,
+    ``endpoint`` is the API endpoint to pass to CloudFlare().
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.app = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self.endpoint = 'http://127.0.0.1:%d%s' % \
+            (self._server.server_address[1], API_PREFIX)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def handle(self, method, path, headers, body):
+        raise NotImplementedError()
+
+
+def _decode_body(data):
+    if not data:
+        return None
+    try:
+        return json.loads(data.decode('utf-8'))
+    except ValueError:
+        return data.decode('utf-8', 'replace')
+
+
+def _encode_body(body):
+    if body is None:
+        return b''
+    if isinstance(body, (dict, list)):
+        return json.dumps(body).encode('utf-8')
+    return body.encode('utf-8')
+
+
+class RecordingProxy(_LocalServer):
+    """
+    Forward requests to the real API and record the interactions.
+    The fixture is written when the proxy stops.
+    """
+    def __init__(self, path, upstream=CF_API_ENDPOINT):
+        """
+        :param path: fixture file to write
+        :param upstream: API endpoint to forward requests to
+        """
+        super(RecordingProxy, self).__init__()
+        import requests
+        self._path = path
+        self._upstream = upstream
+        # Requests are handled in threads, each borrows its own session
+        self._sessions = SessionPool(requests.Session)
+        self.interactions = []
+
+    def __exit__(self, *args):
+        super(RecordingProxy, self).__exit__(*args)
+        self._sessions.close()
+        save_fixture(self._path, self.interactions)
+
+    def handle(self, method, path, headers, body):
+        forwarded = dict((name, headers[name]) for name in FORWARDED_HEADERS
+                         if headers.get(name))
+        with self._sessions.session() as session:
+            response = session.request(method, self._upstream + path,
+                                       headers=forwarded, data=body or None)
+        recorded = dict((name, response.headers[name])
+                        for name in RECORDED_HEADERS
+                        if name in response.headers)
+        with self._lock:
+            self.interactions.append({
+                'method': method,
+                'path': path,
+                'request': _decode_body(body),
+                'status': response.status_code,
+                'headers': recorded,
+                'response': _decode_body(response.content),
+                'elapsed': response.elapsed.total_seconds()
+            })
+        return response.status_code, recorded, response.content
+
+
+class ReplayServer(_LocalServer):
+    """
+    Serve recorded responses.
+
+    Requests are matched by method and path with the query string.
+    Interactions recorded for the same request are replayed in order,
+    after the last one the sequence starts over. A request without
+    recorded interactions gets 404 and is counted in ``unmatched``.
+    """
+    def __init__(self, interactions, latency=None):
+        """
+        :param interactions: fixture file or list of interactions
+        :param latency: latency model - an object with
+                        ``delay(interaction)`` method returning seconds.
+                        No delay by default.
+        """
+        super(ReplayServer, self).__init__()
+        if not isinstance(interactions, list):
+            interactions = load_fixture(interactions)
+        self._latency = latency
+        self._interactions = {}
+        for interaction in interactions:
+            key = (interaction['method'], interaction['path'])
+            self._interactions.setdefault(key, []).append(interaction)
+        self._replayed = {}
+        self.unmatched = []
+        """(method, path) of requests that weren't recorded"""
+
+    @property
+    def replayed(self):
+        """
+        :return: number of requests answered with recorded responses
+        """
+        return sum(self._replayed.values())
+
+    def _next(self, key):
+        with self._lock:
+            recorded = self._interactions.get(key)
+            if not recorded:
+                self.unmatched.append(key)
+                return None
+            count = self._replayed.get(key, 0)
+            self._replayed[key] = count + 1
+            return recorded[count % len(recorded)]
+
+    def handle(self, method, path, headers, body):
+        interaction = self._next((method, path))
+        if interaction is None:
+            error = {
+                'success': False,
+                'errors': [{'code': 7003,
+                            'message': 'No recorded interaction for %s %s'
+                                       % (method, path)}],
+                'messages': [],
+                'result': None
+            }
+            return 404, {'Content-Type': 'application/json'}, \
+                _encode_body(error)
+
+        if self._latency is not None:
+            time.sleep(self._latency.delay(interaction))
+        return interaction['status'], dict(interaction['headers']), \
+            _encode_body(interaction['response'])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cache
+----------------------------------
+
+Tests for `twindb_cloudflare.cache` module.
+"""
+import pytest
+from twindb_cloudflare.cache import ResponseCache, zone_of
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache()
+
+
+@pytest.mark.parametrize('url,zone_id', [
+    ('/zones?name=twindb.com', None),
+    ('/zones/abc', 'abc'),
+    ('/zones/abc/dns_records?name=foo', 'abc'),
+    ('/zones/abc/dns_records/def', 'abc'),
+    ('/user', None)
+])
+def test_zone_of(url, zone_id):
+    assert zone_of(url) == zone_id
+
+
+def test_put_get(cache):
+    cache.put('/zones?name=foo', {'result': []}, etag='"x"')
+    entry = cache.get('/zones?name=foo')
+    assert entry.response == {'result': []}
+    assert entry.etag == '"x"'
+    assert entry.is_fresh()
+    assert cache.hits == 1
+
+
+def test_uncached_endpoint(cache):
+    cache.put('/user', {'result': []})
+    assert cache.get('/user') is None
+    assert cache.misses == 1
+    assert len(cache) == 0
+
+
+def test_invalidate_records_keeps_zone_listing(cache):
+    cache.put('/zones?name=foo', {})
+    cache.put('/zones/a/dns_records?name=x', {})
+    cache.put('/zones/b/dns_records?name=x', {})
+
+    cache.invalidate('/zones/a/dns_records/rec')
+
+    assert cache.get('/zones?name=foo') is not None
+    assert cache.get('/zones/a/dns_records?name=x') is None
+    assert cache.get('/zones/b/dns_records?name=x') is not None
+
+
+def test_invalidate_zone_drops_zone_listing(cache):
+    cache.put('/zones?name=foo', {})
+    cache.put('/zones/b/dns_records?name=x', {})
+
+    cache.invalidate('/zones/a')
+
+    assert cache.get('/zones?name=foo') is None
+    assert cache.get('/zones/b/dns_records?name=x') is not None
+
+
+def test_max_entries():
+    cache = ResponseCache(max_entries=2, stripes=1)
+    for name in ['a', 'b', 'c']:
+        cache.put('/zones?name=%s' % name, {})
+    assert len(cache) == 2
+    assert cache.get('/zones?name=a') is None
+
+
+def test_put_skipped_after_invalidation(cache):
+    url = '/zones/a/dns_records?name=x'
+    generation = cache.generation(url)
+    cache.invalidate('/zones/a/dns_records/rec')
+    cache.put(url, {}, generation=generation)
+    assert cache.get(url) is None
+
+    cache.put(url, {}, generation=cache.generation(url))
+    assert cache.get(url) is not None
+
+
+def test_entries_are_scoped(cache):
+    url = '/zones?name=foo'
+    cache.put(url, b'a', scope=('endpoint', 'a@a.com'))
+    cache.put(url, b'b', scope=('endpoint', 'b@b.com'))
+
+    assert cache.get(url, scope=('endpoint', 'a@a.com')).response == b'a'
+    assert cache.get(url, scope=('endpoint', 'b@b.com')).response == b'b'
+    assert cache.get(url) is None
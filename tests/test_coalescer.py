@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_coalescer
+----------------------------------
+
+Tests for `twindb_cloudflare.coalescer` module.
+"""
+import threading
+import time
+
+import mock
+import pytest
+from tests.fake_cloudflare import FakeCloudFlare
+from twindb_cloudflare.coalescer import WriteCoalescer
+from twindb_cloudflare.twindb_cloudflare import CloudFlare, \
+    CloudFlareException, NotFoundError
+
+
+def test_updates_within_window_are_merged():
+    cloudflare = mock.Mock()
+    with WriteCoalescer(cloudflare, window=0.1) as coalescer:
+        futures = [coalescer.update_dns_record('www.twindb.com',
+                                               'twindb.com', '10.0.0.%d' % i)
+                   for i in range(10)]
+        for future in futures:
+            future.result(timeout=5)
+
+    cloudflare.update_dns_record.assert_called_once_with(
+        'www.twindb.com', 'twindb.com', '10.0.0.9', record_type='A', ttl=1)
+    assert (coalescer.writes, coalescer.mutations) == (10, 1)
+
+
+def test_records_are_coalesced_separately():
+    cloudflare = mock.Mock()
+    with WriteCoalescer(cloudflare, window=0.05) as coalescer:
+        coalescer.update_dns_record('www.twindb.com', 'twindb.com', 'ip1')
+        coalescer.update_dns_record('www.twindb.com', 'twindb.com', '::1',
+                                    record_type='AAAA')
+        coalescer.update_dns_record('db.twindb.com', 'twindb.com', 'ip2')
+        coalescer.update_dns_record('www.twindb.com', 'twindb.com', 'ip3')
+
+    assert sorted(call[0][0:3] + (call[1]['record_type'],)
+                  for call in cloudflare.update_dns_record.call_args_list) \
+        == [('db.twindb.com', 'twindb.com', 'ip2', 'A'),
+            ('www.twindb.com', 'twindb.com', '::1', 'AAAA'),
+            ('www.twindb.com', 'twindb.com', 'ip3', 'A')]
+
+
+def test_one_update_per_window():
+    cloudflare = mock.Mock()
+    with WriteCoalescer(cloudflare, window=0.05) as coalescer:
+        first = coalescer.update_dns_record('www', 'zone', 'ip1')
+        first.result(timeout=5)
+        second = coalescer.update_dns_record('www', 'zone', 'ip2')
+
+    assert second.done()
+    assert [call[0][2] for call in
+            cloudflare.update_dns_record.call_args_list] == ['ip1', 'ip2']
+
+
+def test_updates_of_record_are_not_concurrent():
+    release = threading.Event()
+    calls = []
+
+    def update(name, zone, content, record_type, ttl):
+        calls.append(content)
+        release.wait()
+
+    cloudflare = mock.Mock()
+    cloudflare.update_dns_record.side_effect = update
+    coalescer = WriteCoalescer(cloudflare, window=0.01)
+    first = coalescer.update_dns_record('www', 'zone', 'ip1')
+    while not calls:
+        time.sleep(0.01)
+    second = coalescer.update_dns_record('www', 'zone', 'ip2')
+    third = coalescer.update_dns_record('www', 'zone', 'ip3')
+    time.sleep(0.05)
+
+    assert calls == ['ip1']
+    release.set()
+    coalescer.close()
+
+    assert calls == ['ip1', 'ip3']
+    assert first.done() and second.done() and third.done()
+
+
+def test_flush_sends_without_waiting():
+    cloudflare = mock.Mock()
+    coalescer = WriteCoalescer(cloudflare, window=60)
+    future = coalescer.update_dns_record('www', 'zone', 'ip')
+    coalescer.flush()
+
+    future.result(timeout=5)
+    coalescer.close()
+    assert coalescer.mutations == 1
+
+
+def test_error_reaches_every_caller():
+    with FakeCloudFlare() as server:
+        server.add_zone('twindb.com')
+        cloudflare = CloudFlare('a@a.com', 'foo',
+                                api_endpoint=server.endpoint)
+        with WriteCoalescer(cloudflare, window=0.01) as coalescer:
+            futures = [coalescer.update_dns_record('www.twindb.com',
+                                                   'twindb.com', ip)
+                       for ip in ('10.0.0.1', '10.0.0.2')]
+
+    for future in futures:
+        with pytest.raises(NotFoundError):
+            future.result()
+
+
+def test_cancelled_future_is_skipped():
+    cloudflare = mock.Mock()
+    with WriteCoalescer(cloudflare, window=0.05) as coalescer:
+        first = coalescer.update_dns_record('www', 'zone', 'ip1')
+        second = coalescer.update_dns_record('www', 'zone', 'ip2')
+        assert first.cancel()
+
+    assert first.cancelled()
+    assert second.result(timeout=5) is \
+        cloudflare.update_dns_record.return_value
+    assert coalescer.mutations == 1
+
+
+def test_cancelled_latest_update_is_not_sent():
+    cloudflare = mock.Mock()
+    with WriteCoalescer(cloudflare, window=0.05) as coalescer:
+        first = coalescer.update_dns_record('www', 'zone', 'ip1', ttl=120)
+        second = coalescer.update_dns_record('www', 'zone', 'ip2')
+        assert second.cancel()
+
+    assert first.result(timeout=5) is \
+        cloudflare.update_dns_record.return_value
+    cloudflare.update_dns_record.assert_called_once_with(
+        'www', 'zone', 'ip1', record_type='A', ttl=120)
+
+
+def test_update_is_dropped_if_all_futures_cancelled():
+    cloudflare = mock.Mock()
+    with WriteCoalescer(cloudflare, window=0.05) as coalescer:
+        assert coalescer.update_dns_record('www', 'zone', 'ip').cancel()
+
+    assert not cloudflare.update_dns_record.called
+    assert coalescer.mutations == 0
+
+
+def test_update_after_close():
+    coalescer = WriteCoalescer(mock.Mock())
+    coalescer.close()
+    with pytest.raises(CloudFlareException):
+        coalescer.update_dns_record('www', 'zone', 'ip')
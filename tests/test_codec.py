@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_codec
+----------------------------------
+
+Tests for `twindb_cloudflare.codec` module.
+"""
+import pytest
+from twindb_cloudflare.codec import get_codec, JSONCodec, CODECS
+
+
+def _installed_codecs():
+    codecs = []
+    for codec_class in CODECS:
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            pass
+    return codecs
+
+
+@pytest.mark.parametrize('codec', _installed_codecs(),
+                         ids=lambda codec: codec.name)
+def test_codec_round_trip(codec):
+    obj = {
+        u'success': True,
+        u'result': [{u'name': u'www.twindb.com', u'ttl': 1,
+                     u'content': u'привет'}]
+    }
+    data = codec.encode(obj)
+    assert isinstance(data, bytes)
+    assert codec.decode(data) == obj
+
+
+def test_json_codec_is_compact():
+    assert JSONCodec().encode({'a': [1, 2]}) == b'{"a":[1,2]}'
+
+
+def test_json_codec_raises_value_error():
+    with pytest.raises(ValueError):
+        JSONCodec().decode(b'{')
+
+
+def test_get_codec_by_name():
+    assert isinstance(get_codec('json'), JSONCodec)
+
+
+def test_get_codec_fastest():
+    assert get_codec().name == _installed_codecs()[0].name
+
+
+def test_get_codec_unknown():
+    with pytest.raises(ValueError):
+        get_codec('foo')
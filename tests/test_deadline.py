@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_deadline
+----------------------------------
+
+Tests for `twindb_cloudflare.deadline` module.
+"""
+import threading
+import time
+
+from twindb_cloudflare.deadline import Deadline, current_deadline
+
+
+def test_no_deadline():
+    assert current_deadline() is None
+
+
+def test_deadline_expires():
+    deadline = Deadline(0.01)
+    assert not deadline.expired
+    time.sleep(0.02)
+    assert deadline.expired
+    assert deadline.remaining() < 0
+
+
+def test_nested_deadline_earliest_wins():
+    with Deadline(10) as outer:
+        with Deadline(1) as inner:
+            assert current_deadline() is inner
+        with Deadline(20):
+            assert current_deadline() is outer
+        assert current_deadline() is outer
+    assert current_deadline() is None
+
+
+def test_deadline_is_per_thread():
+    seen = []
+    with Deadline(1):
+        thread = threading.Thread(target=lambda: seen.append(
+            current_deadline()))
+        thread.start()
+        thread.join()
+    assert seen == [None]
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_failover
+----------------------------------
+
+Tests for `twindb_cloudflare.failover` module.
+"""
+import time
+
+import pytest
+from twindb_cloudflare.failover import FailoverController
+from twindb_cloudflare.twindb_cloudflare import CloudFlareException
+
+
+class SimulatedHealth(object):
+    """
+    Health check with states set by the test
+    """
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.checks = []
+
+    def __call__(self, candidate):
+        self.checks.append(candidate)
+        if candidate == 'raise':
+            raise IOError('Connection refused')
+        return candidate not in self.down
+
+
+class FakeCloudFlare(object):
+    """
+    Records DNS updates. Every update costs three API calls
+    like CloudFlare.update_dns_record() does.
+    """
+    def __init__(self, fail=False):
+        self.api_calls = 0
+        self.updates = []
+        self.fail = fail
+
+    def update_dns_record(self, name, zone, content, record_type="A", ttl=1):
+        self.api_calls += 3
+        if self.fail:
+            raise CloudFlareException('error')
+        self.updates.append((name, zone, content, record_type))
+
+
+@pytest.fixture
+def health():
+    return SimulatedHealth()
+
+
+@pytest.fixture
+def cloudflare():
+    return FakeCloudFlare()
+
+
+@pytest.fixture
+def controller(cloudflare, health):
+    return FailoverController(cloudflare, 'twindb.com',
+                              {'www.twindb.com': ['10.0.0.1', '10.0.0.2'],
+                               'db.twindb.com': ['10.0.1.1', '10.0.1.2']},
+                              health, rise=2, fall=2)
+
+
+def test_no_updates_if_healthy(controller, cloudflare, health):
+    for _ in range(3):
+        assert controller.check_once() == []
+    assert cloudflare.updates == []
+    assert sorted(set(health.checks)) == ['10.0.0.1', '10.0.0.2',
+                                          '10.0.1.1', '10.0.1.2']
+
+
+def test_failover_after_fall_checks(controller, cloudflare, health):
+    health.down.add('10.0.0.1')
+
+    assert controller.check_once() == []
+    events = controller.check_once()
+
+    assert cloudflare.updates == [('www.twindb.com', 'twindb.com',
+                                   '10.0.0.2', 'A')]
+    assert len(events) == 1
+    event = events[0]
+    assert event.old_content == '10.0.0.1'
+    assert event.new_content == '10.0.0.2'
+    assert event.api_calls == 3
+    assert event.error is None
+    assert event.latency >= 0
+    assert controller.active == {'www.twindb.com': '10.0.0.2',
+                                 'db.twindb.com': '10.0.1.1'}
+    assert controller.events == events
+
+
+def test_flapping_is_debounced(controller, cloudflare, health):
+    for _ in range(5):
+        health.down.add('10.0.0.1')
+        controller.check_once()
+        health.down.discard('10.0.0.1')
+        controller.check_once()
+
+    assert cloudflare.updates == []
+
+
+def test_no_failback_when_recovered(controller, cloudflare, health):
+    health.down.add('10.0.0.1')
+    controller.check_once()
+    controller.check_once()
+    health.down.discard('10.0.0.1')
+    for _ in range(3):
+        controller.check_once()
+
+    assert len(cloudflare.updates) == 1
+    assert controller.active['www.twindb.com'] == '10.0.0.2'
+
+
+def test_down_candidate_is_not_used(controller, cloudflare, health):
+    health.down.update(['10.0.0.1', '10.0.0.2'])
+    controller.check_once()
+    controller.check_once()
+
+    assert cloudflare.updates == []
+    assert not controller.is_up('10.0.0.2')
+
+
+def test_exception_in_health_check_is_failure(cloudflare):
+    controller = FailoverController(cloudflare, 'twindb.com',
+                                    {'www.twindb.com': ['raise', '10.0.0.2']},
+                                    SimulatedHealth(), fall=1)
+    controller.check_once()
+
+    assert cloudflare.updates == [('www.twindb.com', 'twindb.com',
+                                   '10.0.0.2', 'A')]
+
+
+def test_failed_update_is_retried(health):
+    cloudflare = FakeCloudFlare(fail=True)
+    controller = FailoverController(cloudflare, 'twindb.com',
+                                    {'www.twindb.com': ['10.0.0.1',
+                                                        '10.0.0.2']},
+                                    health, fall=1)
+    health.down.add('10.0.0.1')
+    event = controller.check_once()[0]
+    assert isinstance(event.error, CloudFlareException)
+    assert controller.active['www.twindb.com'] == '10.0.0.1'
+
+    cloudflare.fail = False
+    event = controller.check_once()[0]
+    assert event.error is None
+    assert controller.active['www.twindb.com'] == '10.0.0.2'
+
+
+def test_start_stop(controller, cloudflare, health):
+    health.down.add('10.0.0.1')
+    controller._interval = 0.01
+    controller.start()
+    deadline = time.time() + 5
+    while not cloudflare.updates and time.time() < deadline:
+        time.sleep(0.01)
+    controller.stop()
+
+    assert cloudflare.updates[0][2] == '10.0.0.2'
+
+
+@pytest.mark.parametrize('active', [
+    {'www.twindb.com': '10.0.9.9'},
+    {'ftp.twindb.com': '10.0.0.1'}
+])
+def test_active_must_be_a_candidate(cloudflare, health, active):
+    with pytest.raises(CloudFlareException):
+        FailoverController(cloudflare, 'twindb.com',
+                           {'www.twindb.com': ['10.0.0.1', '10.0.0.2']},
+                           health, active=active)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_import_time
+----------------------------------
+
+Cold import of `twindb_cloudflare.twindb_cloudflare` must stay cheap.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+THRESHOLD = float(os.environ.get('TWINDB_CF_IMPORT_THRESHOLD', '0.05'))
+"""Maximum cold import time in seconds"""
+
+HEAVY_MODULES = ['requests', 'urllib3', 'concurrent.futures', 'orjson',
+                 'ujson', 'twindb_cloudflare.propagation']
+"""Modules that must not be loaded by the import"""
+
+_PROBE = """
+import sys
+import time
+started = time.time()
+import twindb_cloudflare.twindb_cloudflare
+elapsed = time.time() - started
+heavy = [name for name in %r if name in sys.modules]
+print(elapsed)
+print(','.join(heavy))
+"""
+
+
+def _cold_import():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, '-c',
+                                      _PROBE % HEAVY_MODULES],
+                                     cwd=root)
+    elapsed, heavy = output.decode('utf-8').split('\n')[:2]
+    return float(elapsed), [name for name in heavy.split(',') if name]
+
+
+def test_import_does_not_load_heavy_modules():
+    assert _cold_import()[1] == []
+
+
+@pytest.mark.skipif('coverage' in sys.modules,
+                    reason="coverage slows down imports")
+def test_import_time_below_threshold():
+    elapsed = min(_cold_import()[0] for _ in range(3))
+    assert elapsed < THRESHOLD, \
+        "Cold import took %.3f seconds, threshold is %.3f" % (elapsed,
+                                                              THRESHOLD)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_profiler
+----------------------------------
+
+Tests for `twindb_cloudflare.profiler` module.
+"""
+import json
+
+import pytest
+from tests.fake_cloudflare import FakeCloudFlare
+from tests.replay import ReplayServer
+from twindb_cloudflare.profiler import PHASES, Profiler, request_label
+from twindb_cloudflare.twindb_cloudflare import CloudFlare
+
+
+@pytest.fixture
+def zone():
+    with FakeCloudFlare() as server:
+        zone_id = server.add_zone('twindb.com')
+        server.add_record(zone_id, 'www.twindb.com', '10.0.0.1')
+        yield server
+
+
+def _stacks(profiler):
+    return dict((line.rsplit(' ', 1)[0], int(line.rsplit(' ', 1)[1]))
+                for line in profiler.collapsed().splitlines())
+
+
+def test_profiling_is_off_by_default():
+    assert CloudFlare('a@a.com', 'foo').profiler is None
+
+
+def test_request_label():
+    assert request_label('GET', '/zones?name=twindb.com') == 'GET /zones'
+    assert request_label('PUT', '/zones/%s/dns_records/%s'
+                         % ('a' * 32, 'b' * 32)) == \
+        'PUT /zones/<id>/dns_records/<id>'
+
+
+def test_phases_are_attributed_to_operations(zone):
+    cloudflare = CloudFlare('a@a.com', 'foo', api_endpoint=zone.endpoint,
+                            profile=True)
+    cloudflare.update_dns_record('www.twindb.com', 'twindb.com', '10.0.0.2')
+
+    stacks = _stacks(cloudflare.profiler)
+    prefix = 'update_dns_record;get_zone_id;GET /zones;'
+    assert prefix + 'connect' in stacks
+    assert prefix + 'ttfb' in stacks
+    for phase in ('queue', 'send', 'download', 'decode', 'other'):
+        assert prefix + phase in stacks
+    assert 'update_dns_record;get_record_id;' \
+           'GET /zones/<id>/dns_records;ttfb' in stacks
+    assert 'update_dns_record;PUT /zones/<id>/dns_records/<id>;ttfb' \
+           in stacks
+    assert all(set(stack.split(';')[-1:]) <= set(PHASES)
+               for stack in stacks)
+
+
+def test_host_changes_are_attributed_to_operations(zone):
+    zone_id = zone.zones['twindb.com']
+    zone.add_record(zone_id, 'www.twindb.com', 'fd00::1',
+                    record_type='AAAA')
+    cloudflare = CloudFlare('a@a.com', 'foo', api_endpoint=zone.endpoint,
+                            profile=True)
+    cloudflare.update_host('www.twindb.com', 'twindb.com',
+                           {'A': '10.0.0.2', 'AAAA': 'fd00::2'})
+
+    stacks = _stacks(cloudflare.profiler)
+    assert 'update_host;update_record;' \
+           'PUT /zones/<id>/dns_records/<id>;ttfb' in stacks
+    assert cloudflare.profiler.report()['operations']['update_host'][
+        'requests'] == 4
+
+
+def test_report_rolls_up_operations(zone):
+    cloudflare = CloudFlare('a@a.com', 'foo', api_endpoint=zone.endpoint,
+                            profile=True)
+    for ip in ('10.0.0.2', '10.0.0.3'):
+        cloudflare.update_dns_record('www.twindb.com', 'twindb.com', ip)
+
+    report = cloudflare.profiler.report()
+    update = report['operations']['update_dns_record']
+    assert update['calls'] == 2
+    assert update['requests'] == 6
+    assert 0 < sum(update['phases'].values()) <= update['wall']
+    assert report['operations']['get_zone_id']['requests'] == 2
+    assert report['requests']['GET /zones']['calls'] == 2
+
+
+def test_connect_is_timed_only_for_new_connections(zone):
+    cloudflare = CloudFlare('a@a.com', 'foo', api_endpoint=zone.endpoint,
+                            profile=True)
+    for _ in range(3):
+        cloudflare.get_zone_id('twindb.com')
+
+    report = cloudflare.profiler.report()['requests']['GET /zones']
+    stacks = _stacks(cloudflare.profiler)
+    assert report['calls'] == 3
+    assert stacks['get_zone_id;GET /zones;connect'] > 0
+    assert report['phases']['connect'] < report['phases']['ttfb'] * 3
+
+
+def test_retry_wait_is_recorded():
+    error = {'success': False, 'result': None,
+             'errors': [{'code': 971, 'message': 'wait'}]}
+    interactions = [
+        {'method': 'GET', 'path': '/zones?name=twindb.com', 'status': 429,
+         'headers': {'Retry-After': '0.01'}, 'response': error},
+        {'method': 'GET', 'path': '/zones?name=twindb.com', 'status': 200,
+         'headers': {}, 'response': {'success': True, 'errors': [],
+                                     'result': [{'id': 'zone-id'}]}}
+    ]
+    with ReplayServer(interactions) as server:
+        cloudflare = CloudFlare('a@a.com', 'foo', retries=1, profile=True,
+                                api_endpoint=server.endpoint)
+        cloudflare.get_zone_id('twindb.com')
+
+    report = cloudflare.profiler.report()['requests']['GET /zones']
+    assert report['calls'] == 2
+    assert report['phases']['retry_wait'] == 0.01
+
+
+def test_dump(zone, tmpdir):
+    cloudflare = CloudFlare('a@a.com', 'foo', api_endpoint=zone.endpoint,
+                            profile=True)
+    cloudflare.get_zone_id('twindb.com')
+    collapsed = str(tmpdir.join('profile.folded'))
+    report = str(tmpdir.join('profile.json'))
+
+    cloudflare.profiler.dump_collapsed(collapsed)
+    cloudflare.profiler.dump_json(report)
+
+    assert open(collapsed).read() == cloudflare.profiler.collapsed()
+    with open(report) as report_file:
+        assert json.load(report_file)['operations']['get_zone_id'][
+            'calls'] == 1
+
+
+def test_reset():
+    profiler = Profiler()
+    with profiler.operation('get_zone_id'):
+        with profiler.request('GET', '/zones') as timer:
+            timer.add('ttfb', 0.5)
+    assert profiler.collapsed().startswith('get_zone_id;GET /zones;other ')
+
+    profiler.reset()
+    assert profiler.collapsed() == ''
+    assert profiler.report() == {'operations': {}, 'requests': {}}
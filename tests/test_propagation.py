@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_propagation
+----------------------------------
+
+Tests for `twindb_cloudflare.propagation` module.
+"""
+import socket
+import struct
+import threading
+
+import pytest
+from twindb_cloudflare.propagation import build_query, parse_response, \
+    query, resolver_address, wait_for_propagation, DNSQueryError, \
+    RECORD_TYPES
+from twindb_cloudflare.twindb_cloudflare import CloudFlare
+
+
+def _encode_name(name):
+    packet = b''
+    for label in name.split('.'):
+        packet += struct.pack('!B', len(label)) + label.encode('ascii')
+    return packet + b'\0'
+
+
+def build_response(query_packet, answers, record_type='A', rcode=0):
+    """
+    Build response to a query. Answer names are compressed pointers
+    to the question.
+    """
+    query_id = struct.unpack('!H', query_packet[:2])[0]
+    header = struct.pack('!HHHHHH', query_id, 0x8180 | rcode, 1,
+                         len(answers), 0, 0)
+    packet = header + query_packet[12:]
+    for answer in answers:
+        if record_type == 'A':
+            rdata = socket.inet_pton(socket.AF_INET, answer)
+        elif record_type == 'AAAA':
+            rdata = socket.inet_pton(socket.AF_INET6, answer)
+        else:
+            rdata = _encode_name(answer)
+        packet += struct.pack('!HHHIH', 0xc00c, RECORD_TYPES[record_type],
+                              1, 300, len(rdata)) + rdata
+    return packet
+
+
+class StubDNSServer(object):
+    """
+    UDP DNS server on localhost that answers every query with
+    ``answers``. The test changes answers to simulate propagation.
+    """
+    def __init__(self, answers=(), record_type='A'):
+        self.answers = list(answers)
+        self.record_type = record_type
+        self.queries = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.settimeout(0.05)
+        self.address = '127.0.0.1:%d' % self._sock.getsockname()[1]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                data, peer = self._sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            self.queries += 1
+            self._sock.sendto(build_response(data, self.answers,
+                                             self.record_type), peer)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self._sock.close()
+
+
+@pytest.mark.parametrize('resolver,address', [
+    ('8.8.8.8', ('8.8.8.8', 53)),
+    ('127.0.0.1:5353', ('127.0.0.1', 5353)),
+    ('[::1]:5353', ('::1', 5353)),
+    ('[::1]', ('::1', 53)),
+    (('127.0.0.1', 53), ('127.0.0.1', 53))
+])
+def test_resolver_address(resolver, address):
+    assert resolver_address(resolver) == address
+
+
+@pytest.mark.parametrize('answers,record_type', [
+    (['10.0.0.1', '10.0.0.2'], 'A'),
+    (['2001:db8::1'], 'AAAA'),
+    (['lb.twindb.com'], 'CNAME'),
+    ([], 'A')
+])
+def test_parse_response(answers, record_type):
+    query_id, packet = build_query('www.twindb.com', record_type)
+    response = build_response(packet, answers, record_type)
+    assert parse_response(response, query_id, record_type) == answers
+
+
+def test_parse_response_wrong_id():
+    query_id, packet = build_query('www.twindb.com', query_id=1)
+    response = build_response(packet, ['10.0.0.1'])
+    with pytest.raises(DNSQueryError):
+        parse_response(response, 2)
+
+
+def test_parse_response_nxdomain():
+    query_id, packet = build_query('www.twindb.com')
+    assert parse_response(build_response(packet, [], rcode=3),
+                          query_id) == []
+
+
+def test_parse_response_servfail():
+    query_id, packet = build_query('www.twindb.com')
+    with pytest.raises(DNSQueryError):
+        parse_response(build_response(packet, [], rcode=2), query_id)
+
+
+def test_query_stub_server():
+    with StubDNSServer(['10.0.0.1']) as server:
+        assert query(server.address, 'www.twindb.com') == ['10.0.0.1']
+
+
+def test_query_timeout():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    try:
+        with pytest.raises(DNSQueryError):
+            query(sock.getsockname(), 'www.twindb.com', timeout=0.05)
+    finally:
+        sock.close()
+
+
+def test_wait_for_propagation():
+    with StubDNSServer(['10.0.0.2']) as fast, \
+            StubDNSServer(['10.0.0.1']) as slow:
+
+        timer = threading.Timer(0.2, lambda: setattr(slow, 'answers',
+                                                     ['10.0.0.2']))
+        timer.start()
+        result = wait_for_propagation('www.twindb.com', '10.0.0.2',
+                                      resolvers=[fast.address,
+                                                 slow.address],
+                                      timeout=5, interval=0.05)
+        timer.join()
+
+    assert result[fast.address] < result[slow.address]
+    assert result[slow.address] >= 0.2
+    assert slow.queries > 1
+
+
+def test_wait_for_propagation_timeout():
+    with StubDNSServer(['10.0.0.1']) as server:
+        result = CloudFlare.wait_for_propagation('www.twindb.com',
+                                                 '10.0.0.2',
+                                                 resolvers=[server.address],
+                                                 timeout=0.3)
+    assert result == {server.address: None}
+
+
+def test_wait_for_propagation_aaaa():
+    with StubDNSServer(['2001:db8::1'], record_type='AAAA') as server:
+        result = wait_for_propagation('www.twindb.com',
+                                      '2001:0db8:0:0::1',
+                                      resolvers=[server.address],
+                                      record_type='AAAA', timeout=2)
+    assert result[server.address] is not None
+
+
+def test_wait_for_propagation_without_resolvers():
+    with pytest.raises(ValueError) as err:
+        wait_for_propagation('www.twindb.com', '10.0.0.1', resolvers=[])
+    assert 'No resolvers' in str(err.value)
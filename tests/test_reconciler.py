@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_reconciler
+----------------------------------
+
+Tests for `twindb_cloudflare.reconciler` module.
+"""
+import json
+import os
+
+import pytest
+from tests.fake_cloudflare import FakeCloudFlare
+from twindb_cloudflare.reconciler import diff_records, FleetReconciler
+
+
+def _record(record_id, name, content, record_type='A', ttl=1):
+    return {'id': record_id, 'name': name, 'type': record_type,
+            'content': content, 'ttl': ttl}
+
+
+def _desired(name, content, record_type='A', **kwargs):
+    return dict(name=name, type=record_type, content=content, **kwargs)
+
+
+def test_diff_records_no_changes():
+    current = [_record('1', 'www.twindb.com', '10.0.0.1')]
+    desired = [_desired('www.twindb.com', '10.0.0.1')]
+    assert diff_records(current, desired) == ([], [], [], 1)
+
+
+def test_diff_records_create_update():
+    current = [_record('1', 'www.twindb.com', '10.0.0.1'),
+               _record('2', 'db.twindb.com', '10.0.0.2')]
+    desired = [_desired('www.twindb.com', '10.0.0.1', ttl=300),
+               _desired('db.twindb.com', '10.0.0.3'),
+               _desired('new.twindb.com', '10.0.0.4')]
+
+    creates, updates, deletes, unchanged = diff_records(current, desired)
+
+    assert creates == [desired[2]]
+    assert sorted(updates) == [('1', desired[0]), ('2', desired[1])]
+    assert deletes == []
+    assert unchanged == 0
+
+
+def test_diff_records_multiple_values():
+    current = [_record('1', 'www.twindb.com', '10.0.0.1'),
+               _record('2', 'www.twindb.com', '10.0.0.2')]
+    desired = [_desired('www.twindb.com', '10.0.0.2'),
+               _desired('www.twindb.com', '10.0.0.3')]
+
+    assert diff_records(current, desired) == \
+        ([], [('1', desired[1])], [], 1)
+
+
+@pytest.mark.parametrize('prune,deletes', [
+    (False, []),
+    (True, ['2'])
+])
+def test_diff_records_prune(prune, deletes):
+    current = [_record('1', 'www.twindb.com', '10.0.0.1'),
+               _record('2', 'www.twindb.com', '::1', record_type='AAAA')]
+    desired = [_desired('www.twindb.com', '10.0.0.1')]
+
+    assert diff_records(current, desired, prune=prune)[2] == deletes
+
+
+def test_diff_records_large_zone():
+    current = [_record(str(i), 'host%d.twindb.com' % i, '10.0.%d.%d'
+                       % (i // 256, i % 256))
+               for i in range(20000)]
+    desired = [_desired('host%d.twindb.com' % i, '10.1.%d.%d'
+                        % (i // 256, i % 256))
+               for i in range(10000, 30000)]
+
+    creates, updates, deletes, unchanged = diff_records(current, desired,
+                                                        prune=True)
+
+    assert (len(creates), len(updates), len(deletes), unchanged) == \
+        (10000, 10000, 10000, 0)
+
+
+@pytest.fixture
+def fleet(tmpdir):
+    with FakeCloudFlare() as server:
+        for i in range(6):
+            zone = 'zone%d.com' % i
+            zone_id = server.add_zone(zone)
+            server.add_record(zone_id, 'www.' + zone, '10.0.0.1')
+            server.add_record(zone_id, 'old.' + zone, '10.0.0.9')
+            desired = [_desired('www.' + zone, '10.0.0.2'),
+                       _desired('db.' + zone, '10.0.1.1')]
+            tmpdir.join(zone + '.json').write(json.dumps(desired))
+        tmpdir.join('missing.com.json').write('[]')
+        yield server, str(tmpdir)
+
+
+def test_fleet_reconciler(fleet):
+    server, desired_dir = fleet
+    results = []
+    reconciler = FleetReconciler('a@a.com', 'foo', desired_dir,
+                                 api_endpoint=server.endpoint,
+                                 processes=2, prune=True)
+    report = reconciler.run(callback=results.append)
+
+    assert report.zones == 7
+    assert (report.created, report.updated, report.deleted) == (6, 6, 6)
+    assert list(report.errors) == ['missing.com']
+    assert report.api_calls == server.total_requests
+    assert len(results) == 7
+
+    for zone, zone_id in server.zones.items():
+        records = sorted((record['name'], record['content'])
+                         for record in server.records[zone_id].values())
+        assert records == [('db.' + zone, '10.0.1.1'),
+                           ('www.' + zone, '10.0.0.2')]
+
+
+def test_fleet_reconciler_dry_run(fleet):
+    server, desired_dir = fleet
+    report = FleetReconciler('a@a.com', 'foo', desired_dir,
+                             api_endpoint=server.endpoint,
+                             processes=2, dry_run=True).run()
+
+    assert (report.created, report.updated, report.deleted) == (6, 6, 0)
+    assert ('PUT', '/zones/<id>/dns_records/<id>') not in server.requests
+
+
+def test_fleet_reconciler_checkpoint(fleet, tmpdir):
+    server, desired_dir = fleet
+    checkpoint = str(tmpdir.join('checkpoint'))
+    with open(checkpoint, 'w') as checkpoint_file:
+        checkpoint_file.write('zone0.com\nzone1.com\n')
+
+    report = FleetReconciler('a@a.com', 'foo', desired_dir,
+                             api_endpoint=server.endpoint,
+                             processes=2, checkpoint=checkpoint).run()
+
+    assert report.skipped == 2
+    assert report.zones == 5
+    with open(checkpoint) as checkpoint_file:
+        done = checkpoint_file.read().split()
+    assert sorted(done) == ['zone%d.com' % i for i in range(6)]
+
+    report = FleetReconciler('a@a.com', 'foo', desired_dir,
+                             api_endpoint=server.endpoint,
+                             processes=2, checkpoint=checkpoint).run()
+    assert report.zones == 1
+    assert os.path.exists(checkpoint)
+
+    os.remove(os.path.join(desired_dir, 'missing.com.json'))
+    report = FleetReconciler('a@a.com', 'foo', desired_dir,
+                             api_endpoint=server.endpoint,
+                             processes=2, checkpoint=checkpoint).run()
+    assert (report.zones, report.skipped) == (0, 6)
+    assert not os.path.exists(checkpoint)
+
+    report = FleetReconciler('a@a.com', 'foo', desired_dir,
+                             api_endpoint=server.endpoint,
+                             processes=2, checkpoint=checkpoint).run()
+    assert (report.zones, report.skipped) == (6, 0)
+    assert not os.path.exists(checkpoint)
+
+
+@pytest.mark.parametrize('content', [
+    '{"name": "www.zone0.com", "type": "A", "content": "10.0.0.2"}',
+    '["www.zone0.com"]',
+    '[{"name": "www.zone0.com", "content": "10.0.0.2"}]',
+    '[{"name": 1, "type": "A"}]',
+    '[{"name": "www.zone0.com", "type": null}]',
+])
+def test_fleet_reconciler_malformed_desired_state(fleet, content):
+    server, desired_dir = fleet
+    with open(os.path.join(desired_dir, 'zone0.com.json'), 'w') as f:
+        f.write(content)
+
+    report = FleetReconciler('a@a.com', 'foo', desired_dir,
+                             api_endpoint=server.endpoint,
+                             processes=2).run()
+
+    assert report.zones == 7
+    assert sorted(report.errors) == ['missing.com', 'zone0.com']
+
+
+def test_fleet_reconciler_zone_timeout(fleet):
+    server, desired_dir = fleet
+    report = FleetReconciler('a@a.com', 'foo', desired_dir,
+                             api_endpoint=server.endpoint,
+                             processes=2, zone_timeout=0).run()
+
+    assert report.failed == 7
+    assert all(error.startswith('DeadlineExceeded')
+               for error in report.errors.values())
+    assert server.total_requests == 0
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_replay
+----------------------------------
+
+Tests for the record/replay harness in `tests.replay`.
+"""
+import threading
+import time
+
+import pytest
+from tests.fake_cloudflare import FakeCloudFlare
+from tests.replay import ConstantLatency, LogNormalLatency, \
+    RecordedLatency, RecordingProxy, ReplayServer, load_fixture
+from twindb_cloudflare.twindb_cloudflare import CloudFlare, NotFoundError
+
+
+def _list_zone(cloudflare):
+    zone_id = cloudflare.get_zone_id('twindb.com')
+    return list(cloudflare.list_dns_records(zone_id, per_page=20))
+
+
+@pytest.fixture
+def fixture_path(tmpdir):
+    path = str(tmpdir.join('zone.json'))
+    with FakeCloudFlare() as server:
+        zone_id = server.add_zone('twindb.com')
+        for i in range(50):
+            server.add_record(zone_id, 'host%02d.twindb.com' % i, '10.0.0.1')
+        with RecordingProxy(path, upstream=server.endpoint) as proxy:
+            cloudflare = CloudFlare('a@a.com', 'secret key',
+                                    api_endpoint=proxy.endpoint)
+            records = _list_zone(cloudflare)
+    assert len(records) == 50
+    return path
+
+
+def test_recording_proxy_saves_interactions(fixture_path):
+    interactions = load_fixture(fixture_path)
+
+    assert [(i['method'], i['status']) for i in interactions] == \
+        [('GET', 200)] * 4
+    assert interactions[1]['path'].endswith('per_page=20&page=1')
+    assert len(interactions[3]['response']['result']) == 10
+    assert 'secret key' not in open(fixture_path).read()
+
+
+def test_recording_proxy_handles_concurrent_requests(tmpdir):
+    path = str(tmpdir.join('concurrent.json'))
+    with FakeCloudFlare() as server:
+        server.add_zone('twindb.com')
+        with RecordingProxy(path, upstream=server.endpoint) as proxy:
+            cloudflare = CloudFlare('a@a.com', 'foo', max_sessions=8,
+                                    api_endpoint=proxy.endpoint)
+            threads = [threading.Thread(target=cloudflare.get_zone_id,
+                                        args=('twindb.com',))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    interactions = load_fixture(path)
+    assert [(i['method'], i['status']) for i in interactions] == \
+        [('GET', 200)] * 8
+
+
+def test_replay_server_runs_client(fixture_path):
+    with ReplayServer(fixture_path) as server:
+        cloudflare = CloudFlare('a@a.com', 'foo',
+                                api_endpoint=server.endpoint)
+        records = _list_zone(cloudflare)
+
+    assert [record['name'] for record in records] == \
+        ['host%02d.twindb.com' % i for i in range(50)]
+    assert server.replayed == 4
+    assert server.unmatched == []
+
+
+def test_replay_server_unmatched_request(fixture_path):
+    with ReplayServer(fixture_path) as server:
+        cloudflare = CloudFlare('a@a.com', 'foo',
+                                api_endpoint=server.endpoint)
+        with pytest.raises(NotFoundError):
+            cloudflare.get_zone_id('example.com')
+
+    assert server.unmatched == [('GET', '/zones?name=example.com')]
+
+
+def test_replay_server_replays_in_order():
+    def interaction(status, response, headers=None):
+        return {'method': 'GET', 'path': '/zones?name=twindb.com',
+                'status': status, 'headers': headers or {},
+                'response': response, 'elapsed': 0.2}
+
+    interactions = [
+        interaction(429, {'success': False, 'result': None,
+                          'errors': [{'code': 971, 'message': 'wait'}]},
+                    {'Retry-After': '0'}),
+        interaction(200, {'success': True, 'errors': [],
+                          'result': [{'id': 'zone-id'}]})
+    ]
+    with ReplayServer(interactions) as server:
+        cloudflare = CloudFlare('a@a.com', 'foo', retries=1,
+                                api_endpoint=server.endpoint)
+        assert cloudflare.get_zone_id('twindb.com') == 'zone-id'
+
+    assert cloudflare.api_calls == 2
+
+
+def test_latency_models():
+    interaction = {'elapsed': 0.2}
+    assert ConstantLatency(0.1).delay(interaction) == 0.1
+    assert RecordedLatency(scale=0.5).delay(interaction) == 0.1
+
+    def sample(seed):
+        latency = LogNormalLatency(0.05, 0.5, seed=seed)
+        return sorted(latency.delay(interaction) for _ in range(1001))
+
+    delays = sample(1)
+    assert 0.045 < delays[500] < 0.055
+    assert delays[990] > 2 * delays[500]
+    assert sample(1) == delays
+
+
+def test_replay_with_latency_at_scale(fixture_path):
+    results = []
+    with ReplayServer(fixture_path, latency=ConstantLatency(0.02)) as server:
+        cloudflare = CloudFlare('a@a.com', 'foo',
+                                api_endpoint=server.endpoint)
+
+        def worker():
+            results.append(len(_list_zone(cloudflare)))
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        started = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+
+    assert results == [50] * 20
+    assert server.replayed == 80
+    # Four sequential requests per worker, workers run in parallel
+    assert 0.08 <= elapsed < 0.08 * 20
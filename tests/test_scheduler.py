@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_scheduler
+----------------------------------
+
+Tests for `twindb_cloudflare.scheduler` module.
+"""
+import threading
+import time
+
+import mock
+import pytest
+from tests.fake_cloudflare import FakeCloudFlare
+from twindb_cloudflare.scheduler import MutationScheduler, URGENT, \
+    ROUTINE, BULK
+from twindb_cloudflare.sync import charge_api_call, TokenBucket
+from twindb_cloudflare.twindb_cloudflare import CloudFlare, \
+    CloudFlareException
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = MutationScheduler(mock.Mock(), workers=1, rate=1000,
+                                  burst=1000)
+    yield scheduler
+    scheduler.close()
+
+
+def _blocked(scheduler):
+    """
+    Occupy the only worker until the returned event is set
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    scheduler.submit('blocker', block)
+    started.wait()
+    return release
+
+
+def _run_all(scheduler, release, futures):
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+
+
+def test_urgent_change_preempts_backlog(scheduler):
+    order = []
+    release = _blocked(scheduler)
+    futures = [scheduler.submit('zone%d' % i, order.append, ('zone%d' % i,))
+               for i in range(5)]
+    futures.append(scheduler.submit('failover', order.append, ('failover',),
+                                    priority=URGENT))
+    _run_all(scheduler, release, futures)
+
+    assert order == ['failover'] + ['zone%d' % i for i in range(5)]
+
+
+def test_zone_changes_keep_submission_order(scheduler):
+    order = []
+    release = _blocked(scheduler)
+    futures = [
+        scheduler.submit('other', order.append, ('other',)),
+        scheduler.submit('zone', order.append, ('zone-1',), priority=BULK),
+        scheduler.submit('zone', order.append, ('zone-2',)),
+        scheduler.submit('zone', order.append, ('zone-3',), priority=URGENT)
+    ]
+    _run_all(scheduler, release, futures)
+
+    assert order == ['zone-1', 'zone-2', 'zone-3', 'other']
+
+
+def test_urgent_change_preempts_backlog_of_zone(scheduler):
+    order = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    scheduler.submit('zone', block, record='blocker')
+    started.wait()
+    futures = [scheduler.submit('zone', order.append, ('record%d' % i,),
+                                record='record%d' % i)
+               for i in range(5)]
+    futures.append(scheduler.submit('zone', order.append, ('failover',),
+                                    priority=URGENT, record='failover'))
+    _run_all(scheduler, release, futures)
+
+    assert order == ['failover'] + ['record%d' % i for i in range(5)]
+
+
+def test_record_changes_keep_submission_order(scheduler):
+    order = []
+    release = _blocked(scheduler)
+    futures = [
+        scheduler.submit('zone', order.append, ('other',), record='other'),
+        scheduler.submit('zone', order.append, ('www-1',), record='www'),
+        scheduler.submit('zone', order.append, ('www-2',), priority=URGENT,
+                         record='www')
+    ]
+    _run_all(scheduler, release, futures)
+
+    assert order == ['www-1', 'www-2', 'other']
+
+
+def test_zones_take_turns(scheduler):
+    order = []
+    release = _blocked(scheduler)
+    futures = [scheduler.submit('a', order.append, ('a',))
+               for _ in range(3)]
+    futures += [scheduler.submit('b', order.append, ('b',))
+                for _ in range(3)]
+    _run_all(scheduler, release, futures)
+
+    assert order == ['a', 'b', 'a', 'b', 'a', 'b']
+
+
+def test_zone_changes_never_run_concurrently():
+    running = {}
+    overlaps = []
+    lock = threading.Lock()
+
+    def change(zone):
+        with lock:
+            if running.get(zone):
+                overlaps.append(zone)
+            running[zone] = True
+        time.sleep(0.001)
+        with lock:
+            running[zone] = False
+
+    with MutationScheduler(mock.Mock(), workers=8, rate=10000,
+                           burst=100) as scheduler:
+        futures = [scheduler.submit('zone%d' % (i % 3), change,
+                                    ('zone%d' % (i % 3),))
+                   for i in range(60)]
+    assert all(future.done() for future in futures)
+    assert overlaps == []
+
+
+def test_rate_limit():
+    started = time.time()
+    with MutationScheduler(mock.Mock(), workers=4, rate=50) as scheduler:
+        futures = [scheduler.submit('zone%d' % i, time.time)
+                   for i in range(10)]
+    calls = sorted(future.result() for future in futures)
+
+    assert calls[-1] - started >= 9 / 50.0 * 0.9
+
+
+def test_rate_limit_counts_every_api_call():
+    with FakeCloudFlare() as server:
+        zone_id = server.add_zone('twindb.com')
+        for i in range(2):
+            server.add_record(zone_id, 'www%d.twindb.com' % i, '10.0.0.1')
+        cloudflare = CloudFlare('a@a.com', 'foo',
+                                api_endpoint=server.endpoint)
+        started = time.time()
+        with MutationScheduler(cloudflare, workers=1, rate=10) as scheduler:
+            futures = [scheduler.submit(zone_id,
+                                        cloudflare.update_dns_record,
+                                        ('www%d.twindb.com' % i,
+                                         'twindb.com', '10.0.0.2'))
+                       for i in range(2)]
+            for future in futures:
+                future.result(timeout=5)
+            elapsed = time.time() - started
+
+    # 2 changes of 3 API calls each, the first call is free
+    assert elapsed >= 5 / 10.0 * 0.9
+    assert server.total_requests == 6
+
+
+def test_rate_limit_counts_api_calls_of_worker_threads():
+    with FakeCloudFlare() as server:
+        zone_id = server.add_zone('twindb.com')
+        server.add_record(zone_id, 'www.twindb.com', '10.0.0.1')
+        server.add_record(zone_id, 'www.twindb.com', 'fd00::1',
+                          record_type='AAAA')
+        cloudflare = CloudFlare('a@a.com', 'foo',
+                                api_endpoint=server.endpoint)
+        started = time.time()
+        with MutationScheduler(cloudflare, workers=1, rate=5) as scheduler:
+            future = scheduler.submit(zone_id, cloudflare.update_host,
+                                      ('www.twindb.com', 'twindb.com',
+                                       {'A': '10.0.0.2',
+                                        'AAAA': 'fd00::2'}))
+            future.result(timeout=5)
+            elapsed = time.time() - started
+
+    # lookups of the zone and the records, two updates in parallel
+    assert elapsed >= 3 / 5.0 * 0.9
+    assert server.total_requests == 4
+
+
+def test_metrics(scheduler):
+    release = _blocked(scheduler)
+    futures = [scheduler.submit('zone', time.sleep, (0,)),
+               scheduler.submit('zone', time.sleep, (0,), priority=URGENT)]
+
+    assert scheduler.queue_depth == 2
+    assert scheduler.stats()[URGENT].depth == 1
+    time.sleep(0.05)
+    _run_all(scheduler, release, futures)
+
+    stats = scheduler.stats()
+    assert scheduler.queue_depth == 0
+    assert stats[URGENT].completed == 1
+    assert stats[URGENT].max_wait >= 0.05
+    assert stats[ROUTINE].submitted == 2
+    assert stats[ROUTINE].completed == 2
+    assert stats[BULK] == (0, 0, 0, 0.0, 0.0)
+
+
+def test_future_gets_exception(scheduler):
+    future = scheduler.submit('zone', int, ('foo',))
+    with pytest.raises(ValueError):
+        future.result(timeout=5)
+
+
+def test_record_methods_call_client():
+    cloudflare = mock.Mock()
+    cloudflare.update_record.return_value = {'id': 'r'}
+    with MutationScheduler(cloudflare) as scheduler:
+        future = scheduler.update_record('z', 'r', {'content': 'ip'},
+                                         priority=URGENT)
+        scheduler.delete_record('z', 'r')
+
+    assert future.result() == {'id': 'r'}
+    cloudflare.update_record.assert_called_once_with('z', 'r',
+                                                     {'content': 'ip'})
+    cloudflare.delete_record.assert_called_once_with('z', 'r')
+
+
+def test_submit_errors(scheduler):
+    with pytest.raises(CloudFlareException):
+        scheduler.submit('zone', time.time, priority=42)
+    scheduler.close()
+    with pytest.raises(CloudFlareException):
+        scheduler.submit('zone', time.time)
+
+
+def test_token_bucket_burst():
+    bucket = TokenBucket(10, burst=3)
+    started = time.time()
+    for _ in range(4):
+        bucket.acquire()
+    assert 0.09 <= time.time() - started < 0.5
+
+
+def test_token_bucket_acquire_timeout():
+    bucket = TokenBucket(10, burst=1)
+    assert bucket.acquire(timeout=0)
+    assert not bucket.acquire(timeout=0.05)
+    assert bucket.acquire(timeout=0.2)
+
+
+def test_token_bucket_throttle():
+    bucket = TokenBucket(10, burst=1)
+    charge_api_call()
+    started = time.time()
+    with bucket.throttle(prepaid=1):
+        # the prepaid call and the saved token go at once
+        for _ in range(4):
+            charge_api_call()
+    charge_api_call()
+    assert 0.19 <= time.time() - started < 0.5
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_thread_safety
+----------------------------------
+
+Stress tests of a CloudFlare instance shared by many threads.
+"""
+import threading
+
+import pytest
+from tests.fake_cloudflare import FakeCloudFlare
+from twindb_cloudflare.cache import ResponseCache
+from twindb_cloudflare.session import SessionPool
+from twindb_cloudflare.sync import AtomicCounter, StripedLock
+from twindb_cloudflare.twindb_cloudflare import CloudFlare
+
+THREADS = 200
+UPDATES = 3
+
+
+def _run_threads(target, count):
+    errors = []
+
+    def wrapper(index):
+        try:
+            target(index)
+        except Exception as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=wrapper, args=(i, ))
+               for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_atomic_counter():
+    counter = AtomicCounter()
+
+    def worker(_):
+        for _ in range(1000):
+            counter.increment()
+
+    _run_threads(worker, 50)
+    assert counter.value == 50000
+
+
+def test_striped_lock_maps_key_to_same_lock():
+    locks = StripedLock(4)
+    assert len(locks) == 4
+    assert locks.for_key('foo') is locks.for_key('foo')
+
+
+def test_session_pool_reuses_sessions():
+    class Session(object):
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    pool = SessionPool(Session, max_size=2)
+    sessions = [pool.acquire() for _ in range(3)]
+    for session in sessions:
+        pool.release(session)
+
+    assert pool.created == 3
+    assert pool.idle == 2
+    assert sessions[2].closed
+    with pool.session() as session:
+        assert session is sessions[1]
+
+
+@pytest.mark.parametrize('cache', [None, ResponseCache()],
+                         ids=['no cache', 'cache'])
+def test_shared_client_no_lost_updates(cache):
+    with FakeCloudFlare() as server:
+        zone_id = server.add_zone('twindb.com')
+        for i in range(THREADS):
+            server.add_record(zone_id, 'host%d.twindb.com' % i, '10.0.0.0')
+
+        cloudflare = CloudFlare('a@a.com', 'foo',
+                                api_endpoint=server.endpoint,
+                                cache=cache, max_sessions=THREADS)
+
+        def worker(index):
+            for update in range(UPDATES):
+                assert cloudflare.get_zone_id('twindb.com') == zone_id
+                cloudflare.update_dns_record('host%d.twindb.com' % index,
+                                             'twindb.com',
+                                             '10.0.%d.%d' % (update, index))
+
+        _run_threads(worker, THREADS)
+
+        contents = dict((record['name'], record['content'])
+                        for record in server.records[zone_id].values())
+        for i in range(THREADS):
+            assert contents['host%d.twindb.com' % i] == \
+                '10.0.%d.%d' % (UPDATES - 1, i)
+
+        assert server.requests[('PUT', '/zones/<id>/dns_records/<id>')] == \
+            THREADS * UPDATES
+        assert cloudflare.api_calls == server.total_requests
+        if cache is None:
+            assert server.total_requests == THREADS * UPDATES * 4
+        else:
+            assert server.total_requests < THREADS * UPDATES * 4
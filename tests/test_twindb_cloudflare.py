@@ -7,13 +7,22 @@ test_twindb_cloudflare
 
 Tests for `twindb_cloudflare` module.
 """
-import json
+import time
+
 import mock as mock
 import pytest
 import requests
+from tests.fake_cloudflare import FakeCloudFlare
 from twindb_cloudflare.twindb_cloudflare import CloudFlare, \
     CloudFlareException, \
-    CF_API_ENDPOINT
+    CF_API_ENDPOINT, DEFAULT_TIMEOUT, RECORD_FIELDS, api_error, \
+    AuthenticationError, \
+    CloudFlareAPIError, CloudFlareConnectionError, DeadlineExceeded, \
+    NotFoundError, RateLimitError, ServerError
+from twindb_cloudflare.cache import ResponseCache
+from twindb_cloudflare.codec import JSONCodec
+from twindb_cloudflare.deadline import current_deadline
+from twindb_cloudflare.sync import TokenBucket
 
 
 @pytest.fixture
@@ -38,24 +47,33 @@ def test_cf_init_set_attr(cloudflare):
 
 @mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
 def test_api_call_calls_request(mock_requests, cloudflare, headers):
+    session = mock_requests.Session.return_value
     api_request = '/foo'
+    for method in ['get', 'post', 'put', 'patch', 'delete']:
+        getattr(session, method).return_value.content = \
+            b'{"success": true}'
     cloudflare._api_call(api_request)
 
     for method in ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']:
         cloudflare._api_call(api_request, method=method)
 
-    mock_requests.get.assert_called_with(CF_API_ENDPOINT + api_request,
-                                         headers=headers)
-    assert mock_requests.get.call_count == 2
-
-    mock_requests.post.assert_called_once_with(CF_API_ENDPOINT + api_request,
-                                               headers=headers)
-    mock_requests.put.assert_called_once_with(CF_API_ENDPOINT + api_request,
-                                              headers=headers)
-    mock_requests.patch.assert_called_once_with(CF_API_ENDPOINT + api_request,
-                                                headers=headers)
-    mock_requests.delete.assert_called_once_with(CF_API_ENDPOINT + api_request,
-                                                 headers=headers)
+    session.get.assert_called_with(CF_API_ENDPOINT + api_request,
+                                   headers=headers,
+                                   timeout=DEFAULT_TIMEOUT)
+    assert session.get.call_count == 2
+
+    session.post.assert_called_once_with(CF_API_ENDPOINT + api_request,
+                                         headers=headers,
+                                         timeout=DEFAULT_TIMEOUT)
+    session.put.assert_called_once_with(CF_API_ENDPOINT + api_request,
+                                        headers=headers,
+                                        timeout=DEFAULT_TIMEOUT)
+    session.patch.assert_called_once_with(CF_API_ENDPOINT + api_request,
+                                          headers=headers,
+                                          timeout=DEFAULT_TIMEOUT)
+    session.delete.assert_called_once_with(CF_API_ENDPOINT + api_request,
+                                           headers=headers,
+                                           timeout=DEFAULT_TIMEOUT)
 
 
 def test_api_call_exception_if_get_data(cloudflare):
@@ -76,28 +94,36 @@ def test_api_call_exception_if_delete_data(cloudflare):
 
 @mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
 def test_api_call_calls_request_with_data(mock_requests, cloudflare, headers):
+    session = mock_requests.Session.return_value
     data = {
         'some': 'data'
     }
     api_request = '/foo'
+    for method in ['post', 'put', 'patch']:
+        getattr(session, method).return_value.content = \
+            b'{"success": true}'
 
     for method in ['POST', 'PUT', 'PATCH']:
         cloudflare._api_call(api_request, method=method, data=data)
 
-    mock_requests.post.assert_called_once_with(CF_API_ENDPOINT + api_request,
-                                               headers=headers,
-                                               data=data)
-    mock_requests.put.assert_called_once_with(CF_API_ENDPOINT + api_request,
-                                              headers=headers,
-                                              data=data)
-    mock_requests.patch.assert_called_once_with(CF_API_ENDPOINT + api_request,
-                                                headers=headers,
-                                                data=data)
+    session.post.assert_called_once_with(CF_API_ENDPOINT + api_request,
+                                         headers=headers,
+                                         timeout=DEFAULT_TIMEOUT,
+                                         data=data)
+    session.put.assert_called_once_with(CF_API_ENDPOINT + api_request,
+                                        headers=headers,
+                                        timeout=DEFAULT_TIMEOUT,
+                                        data=data)
+    session.patch.assert_called_once_with(CF_API_ENDPOINT + api_request,
+                                          headers=headers,
+                                          timeout=DEFAULT_TIMEOUT,
+                                          data=data)
 
 
 @mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
 def test_api_call_raises_exception_connection_error(mock_requests,
                                                     cloudflare):
+    session = mock_requests.Session.return_value
 
     for ex in [requests.exceptions.RequestException,
                requests.exceptions.HTTPError,
@@ -117,7 +143,7 @@ def test_api_call_raises_exception_connection_error(mock_requests,
                requests.exceptions.StreamConsumedError,
                requests.exceptions.RetryError]:
 
-        mock_requests.get.side_effect = ex('Some error')
+        session.get.side_effect = ex('Some error')
         with pytest.raises(CloudFlareException):
             cloudflare._api_call('/foo')
 
@@ -156,17 +182,15 @@ def test_exception_on_non200(mock_raise_for_status, cloudflare):
 def test_call_api_raises_exception_if_success_false(mock_requests,
                                                     api_response,
                                                     cloudflare):
+    session = mock_requests.Session.return_value
 
     class MockResponse(object):
-        _api_response = api_response
-
-        def json(self):
-            return self._api_response
+        content = JSONCodec().encode(api_response)
 
         def raise_for_status(self):
             pass
 
-    mock_requests.get.return_value = MockResponse()
+    session.get.return_value = MockResponse()
     with pytest.raises(CloudFlareException):
         cloudflare._api_call('foo')
 
@@ -254,7 +278,7 @@ def test_get_zone_exceptio_if_zone_not_found(mock_api_call, cloudflare):
                                                    u'total_count': 0,
                                                    u'total_pages': 0},
                                   u'success': True}
-    with pytest.raises(CloudFlareException):
+    with pytest.raises(NotFoundError):
         cloudflare.get_zone_id('foo')
 
 
@@ -298,6 +322,15 @@ def test_get_record_id_returns_value(mock_api_call, cloudflare, api_response,
     assert cloudflare.get_record_id('foo', 'bar') == expected_value
 
 
+@mock.patch.object(CloudFlare, '_api_call')
+def test_get_record_id_filters_by_type(mock_api_call, cloudflare):
+    mock_api_call.return_value = {'success': True, 'result': [{'id': 'r'}]}
+
+    assert cloudflare.get_record_id('foo', 'bar', record_type='AAAA') == 'r'
+    mock_api_call.assert_called_once_with('/zones/bar/dns_records'
+                                          '?name=foo&type=AAAA')
+
+
 @mock.patch.object(CloudFlare, '_api_call')
 def test_get_record_exception_if_zone_not_found(mock_api_call, cloudflare):
     mock_api_call.return_value = {u'errors': [],
@@ -328,6 +361,8 @@ def test_update_record_updates_record(mock_api_call, mock_get_record_id,
     mock_get_record_id.return_value = 'some_record_id'
     mock_get_zone_id.return_value = 'some_zone_id'
     cloudflare.update_dns_record('name', 'zone', 'ip', 'a', 123)
+    mock_get_record_id.assert_called_once_with('name', 'some_zone_id',
+                                               record_type='a')
     data = {
         "id": 'some_record_id',
         "name": 'name',
@@ -338,7 +373,7 @@ def test_update_record_updates_record(mock_api_call, mock_get_record_id,
     mock_api_call.assert_called_once_with("/zones/some_zone_id/"
                                           "dns_records/some_record_id",
                                           method="PUT",
-                                          data=json.dumps(data))
+                                          data=JSONCodec().encode(data))
 
 
 @mock.patch.object(CloudFlare, 'get_zone_id')
@@ -365,7 +400,7 @@ def test_create_record_creates_record(mock_api_call,
     }
     mock_api_call.assert_called_once_with("/zones/zone_id/dns_records",
                                           method="POST",
-                                          data=json.dumps(request))
+                                          data=JSONCodec().encode(request))
 
 
 @mock.patch.object(CloudFlare, 'get_zone_id')
@@ -380,3 +415,571 @@ def test_delete_record_deletes_record(mock_api_call, mock_get_record_id,
     mock_api_call.assert_called_once_with("/zones/some_zone_id/"
                                           "dns_records/some_record_id",
                                           method="DELETE")
+
+
+class CachedResponse(object):
+    status_code = 200
+
+    def __init__(self, api_response, etag=None, status_code=200):
+        self.content = JSONCodec().encode(api_response)
+        self.headers = {'ETag': etag} if etag else {}
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        pass
+
+
+@mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
+def test_api_call_returns_cached_response(mock_requests):
+    session = mock_requests.Session.return_value
+    cloudflare = CloudFlare("a@a.com", "foo", cache=ResponseCache())
+    session.get.return_value = CachedResponse({'success': True,
+                                               'result': [1]})
+    url = '/zones/zone_id/dns_records?name=foo'
+
+    assert cloudflare._api_call(url)['result'] == [1]
+    assert cloudflare._api_call(url)['result'] == [1]
+    assert session.get.call_count == 1
+    assert cloudflare.api_calls == 1
+    assert cloudflare.cache.hits == 1
+
+
+@mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
+def test_cached_response_is_not_shared(mock_requests):
+    session = mock_requests.Session.return_value
+    cloudflare = CloudFlare("a@a.com", "foo", cache=ResponseCache())
+    session.get.return_value = CachedResponse({'success': True,
+                                               'result': [1]})
+    url = '/zones/zone_id/dns_records?name=foo'
+
+    cloudflare._api_call(url)['result'].append(2)
+    cloudflare._api_call(url)['result'].append(3)
+    assert cloudflare._api_call(url)['result'] == [1]
+    assert cloudflare.cache.hits == 2
+
+
+@mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
+def test_api_call_revalidates_stale_response(mock_requests, headers):
+    session = mock_requests.Session.return_value
+    cache = ResponseCache(ttls=[('dns_records', 0.01)])
+    cloudflare = CloudFlare("a@a.com", "foo", cache=cache)
+    url = '/zones/zone_id/dns_records?name=foo'
+    session.get.return_value = CachedResponse({'success': True,
+                                               'result': [1]},
+                                              etag='"abc"')
+    cloudflare._api_call(url)
+    time.sleep(0.02)
+
+    session.get.return_value = CachedResponse(None, status_code=304)
+    assert cloudflare._api_call(url)['result'] == [1]
+
+    headers['If-None-Match'] = '"abc"'
+    session.get.assert_called_with(CF_API_ENDPOINT + url,
+                                   headers=headers,
+                                   timeout=DEFAULT_TIMEOUT)
+    assert cache.revalidations == 1
+    assert cache.get(url, scope=(CF_API_ENDPOINT, 'a@a.com')).is_fresh()
+
+
+@mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
+def test_shared_cache_keeps_accounts_apart(mock_requests):
+    session = mock_requests.Session.return_value
+    cache = ResponseCache()
+    first = CloudFlare("a@a.com", "foo", cache=cache)
+    second = CloudFlare("b@b.com", "bar", cache=cache)
+    url = '/zones?name=twindb.com'
+
+    session.get.return_value = CachedResponse({'success': True,
+                                               'result': [1]})
+    assert first._api_call(url)['result'] == [1]
+    session.get.return_value = CachedResponse({'success': True,
+                                               'result': [2]})
+    assert second._api_call(url)['result'] == [2]
+    assert first._api_call(url)['result'] == [1]
+    assert session.get.call_count == 2
+
+
+@mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
+def test_api_call_mutation_invalidates_zone(mock_requests):
+    session = mock_requests.Session.return_value
+    cloudflare = CloudFlare("a@a.com", "foo", cache=ResponseCache())
+    session.get.return_value = CachedResponse({'success': True})
+    session.put.return_value = CachedResponse({'success': True})
+    zone_url = '/zones?name=twindb.com'
+    record_url = '/zones/zone_id/dns_records?name=foo'
+    cloudflare._api_call(zone_url)
+    cloudflare._api_call(record_url)
+
+    cloudflare._api_call('/zones/zone_id/dns_records/record_id',
+                         method='PUT', data='{}')
+    cloudflare._api_call(zone_url)
+    cloudflare._api_call(record_url)
+
+    assert session.get.call_count == 3
+
+
+@mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
+def test_api_call_raises_exception_if_not_json(mock_requests, cloudflare):
+    session = mock_requests.Session.return_value
+    session.get.return_value.content = b'<html></html>'
+    with pytest.raises(CloudFlareException):
+        cloudflare._api_call('/foo')
+
+
+@mock.patch.object(CloudFlare, 'get_zone_id')
+@mock.patch.object(CloudFlare, 'get_record_id')
+@mock.patch.object(CloudFlare, '_api_call')
+def test_update_record_uses_codec(mock_api_call, mock_get_record_id,
+                                  mock_get_zone_id):
+    codec = mock.Mock()
+    codec.encode.return_value = b'body'
+    cloudflare = CloudFlare("a@a.com", "foo", codec=codec)
+    cloudflare.update_dns_record('name', 'zone', 'ip')
+
+    assert mock_api_call.call_args[1]['data'] == b'body'
+
+
+@mock.patch.object(CloudFlare, '_api_call')
+def test_list_dns_records_fetches_all_pages(mock_api_call, cloudflare):
+    mock_api_call.side_effect = [
+        {'success': True, 'result': [{'id': '1'}, {'id': '2'}],
+         'result_info': {'page': 1, 'total_pages': 2}},
+        {'success': True, 'result': [{'id': '3'}],
+         'result_info': {'page': 2, 'total_pages': 2}}
+    ]
+    records = cloudflare.list_dns_records('zone_id', name='foo', per_page=2)
+
+    assert [record['id'] for record in records] == ['1', '2', '3']
+    mock_api_call.assert_called_with('/zones/zone_id/dns_records?'
+                                     'per_page=2&name=foo&page=2',
+                                     use_cache=True)
+
+
+@mock.patch.object(CloudFlare, '_api_call')
+def test_update_record_by_id(mock_api_call, cloudflare):
+    mock_api_call.return_value = {'success': True, 'result': {'id': 'r'}}
+    record = {'name': 'foo', 'type': 'A', 'content': 'ip'}
+
+    assert cloudflare.update_record('z', 'r', record) == {'id': 'r'}
+    mock_api_call.assert_called_once_with('/zones/z/dns_records/r',
+                                          method='PUT',
+                                          data=JSONCodec().encode(record))
+
+
+@pytest.fixture
+def zone_with_records():
+    with FakeCloudFlare() as server:
+        zone_id = server.add_zone('twindb.com')
+        for i in range(250):
+            server.add_record(zone_id, 'host%03d.twindb.com' % i, '10.0.0.1')
+        yield server, zone_id
+
+
+def _lookup_requests(server):
+    return server.requests[('GET', '/zones/<id>/dns_records')]
+
+
+@pytest.mark.parametrize('names,per_page,expected_requests', [
+    (['host001.twindb.com', 'host002.twindb.com', 'foo.twindb.com'], 100, 3),
+    (['host%03d.twindb.com' % i for i in range(0, 250, 10)] +
+     ['foo.twindb.com'], 100, 3),
+    (['host%03d.twindb.com' % i for i in range(200, 204)], 20, 5)
+], ids=['targeted', 'listing', 'first page then targeted'])
+def test_get_record_ids(zone_with_records, names, per_page,
+                        expected_requests):
+    server, zone_id = zone_with_records
+    records = dict((record['name'], record['id'])
+                   for record in server.records[zone_id].values())
+    cloudflare = CloudFlare("a@a.com", "foo", api_endpoint=server.endpoint)
+
+    ids, missing = cloudflare.get_record_ids(zone_id, names,
+                                             per_page=per_page)
+
+    assert missing == [name for name in names if name not in records]
+    assert ids == dict((name, records[name])
+                       for name in names if name in records)
+    assert _lookup_requests(server) == expected_requests
+
+
+def test_get_record_ids_names_differing_by_case(zone_with_records):
+    server, zone_id = zone_with_records
+    record_id = [record['id'] for record in server.records[zone_id].values()
+                 if record['name'] == 'host001.twindb.com'][0]
+    cloudflare = CloudFlare("a@a.com", "foo", api_endpoint=server.endpoint)
+    names = ['host001.twindb.com', 'HOST001.twindb.com',
+             'Host001.TwinDB.com', 'host001.twindb.com', 'foo.twindb.com']
+
+    ids, missing = cloudflare.get_record_ids(zone_id, names)
+
+    assert ids == dict((name, record_id) for name in names[:3])
+    assert missing == ['foo.twindb.com']
+
+
+@pytest.mark.parametrize('names', [
+    ['a.twindb.com', 'b.twindb.com'],
+    ['a.twindb.com', 'b.twindb.com', 'c.twindb.com', 'd.twindb.com']
+])
+def test_get_record_ids_unknown_zone(zone_with_records, names):
+    server, _ = zone_with_records
+    cloudflare = CloudFlare("a@a.com", "foo", api_endpoint=server.endpoint)
+
+    with pytest.raises(NotFoundError):
+        cloudflare.get_record_ids('0' * 32, names)
+
+
+@mock.patch.object(CloudFlare, '_api_call')
+def test_get_record_ids_targeted_query(mock_api_call, cloudflare):
+    mock_api_call.side_effect = [
+        {'success': True, 'result': [{'id': '1'}]},
+        {'success': True, 'result': []}
+    ]
+
+    assert cloudflare.get_record_ids('z', ['foo', 'bar'],
+                                     record_type='A') == ({'foo': '1'},
+                                                          ['bar'])
+    assert mock_api_call.call_args_list == [
+        mock.call('/zones/z/dns_records?name=foo&type=A'),
+        mock.call('/zones/z/dns_records?name=bar&type=A')
+    ]
+
+
+def test_list_dns_records_trims_fields(zone_with_records):
+    server, zone_id = zone_with_records
+    cloudflare = CloudFlare("a@a.com", "foo", api_endpoint=server.endpoint)
+
+    records = list(cloudflare.list_dns_records(zone_id, fields=('id',
+                                                                'name')))
+
+    assert len(records) == 250
+    assert records[0] == {'id': records[0]['id'],
+                          'name': 'host000.twindb.com'}
+
+
+def test_list_dns_records_compact_model(zone_with_records):
+    server, zone_id = zone_with_records
+    cloudflare = CloudFlare("a@a.com", "foo", api_endpoint=server.endpoint)
+
+    record = next(cloudflare.list_dns_records(zone_id, fields=RECORD_FIELDS))
+
+    assert sorted(record) == ['content', 'id', 'name', 'proxied',
+                              'ttl', 'type']
+
+
+def test_listing_is_compressed(zone_with_records):
+    server, zone_id = zone_with_records
+    cloudflare = CloudFlare("a@a.com", "foo", api_endpoint=server.endpoint)
+
+    plain = list(cloudflare.list_dns_records(zone_id))
+    plain_bytes = server.bytes_sent
+    server.compress = True
+    compressed = list(cloudflare.list_dns_records(zone_id))
+
+    assert compressed == plain
+    assert server.bytes_sent - plain_bytes < plain_bytes / 4
+
+
+def test_session_accepts_compressed_responses(cloudflare):
+    accept_encoding = cloudflare._new_session().headers['Accept-Encoding']
+
+    assert accept_encoding == \
+        requests.utils.default_headers()['Accept-Encoding']
+    assert 'gzip' in accept_encoding
+
+
+@pytest.mark.parametrize('status,codes,error_class,retryable', [
+    (429, [], RateLimitError, True),
+    (400, [10013], RateLimitError, True),
+    (403, [], AuthenticationError, False),
+    (400, [9103], AuthenticationError, False),
+    (404, [], NotFoundError, False),
+    (200, [81044], NotFoundError, False),
+    (502, [], ServerError, True),
+    (400, [1004], CloudFlareAPIError, False),
+    (None, [], CloudFlareAPIError, False)
+])
+def test_api_error_classification(status, codes, error_class, retryable):
+    err = api_error('error', status=status,
+                    errors=[{'code': code, 'message': 'foo'}
+                            for code in codes],
+                    headers={'CF-RAY': 'ray-id', 'Retry-After': '3'})
+    assert type(err) is error_class
+    assert isinstance(err, CloudFlareException)
+    assert err.is_retryable == retryable
+    assert err.status == status
+    assert err.codes == codes
+    assert err.request_id == 'ray-id'
+    assert err.retry_after == 3
+
+
+def _http_response(status, body, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = JSONCodec().encode(body)
+    response.headers.update(headers or {})
+    return response
+
+
+@mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
+def test_api_call_raises_rate_limit_error(mock_requests, cloudflare):
+    session = mock_requests.Session.return_value
+    session.get.return_value = _http_response(
+        429,
+        {'success': False, 'errors': [{'code': 971, 'message': 'wait'}]},
+        {'Retry-After': '10', 'CF-RAY': 'abc'})
+
+    with pytest.raises(RateLimitError) as exc_info:
+        cloudflare._api_call('/zones')
+
+    err = exc_info.value
+    assert (err.status, err.codes) == (429, [971])
+    assert (err.retry_after, err.request_id) == (10, 'abc')
+
+
+@mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
+def test_unsuccessful_response_keeps_status(mock_requests, cloudflare):
+    session = mock_requests.Session.return_value
+    session.get.return_value = _http_response(
+        200,
+        {'success': False, 'errors': [{'code': 1004, 'message': 'bad'}]})
+
+    with pytest.raises(CloudFlareAPIError) as exc_info:
+        cloudflare._api_call('/zones')
+
+    assert (exc_info.value.status, exc_info.value.codes) == (200, [1004])
+
+
+@mock.patch('twindb_cloudflare.twindb_cloudflare.requests')
+def test_api_call_connection_error_is_retryable(mock_requests, cloudflare):
+    session = mock_requests.Session.return_value
+    session.get.side_effect = requests.exceptions.ConnectTimeout('timeout')
+    with pytest.raises(CloudFlareConnectionError) as exc_info:
+        cloudflare._api_call('/zones')
+    assert exc_info.value.is_retryable
+
+
+@mock.patch('twindb_cloudflare.twindb_cloudflare.time.sleep')
+@mock.patch.object(CloudFlare, '_send')
+def test_api_call_retries_retryable_errors(mock_send, mock_sleep):
+    cloudflare = CloudFlare("a@a.com", "foo", retries=3, retry_delay=1)
+    mock_send.side_effect = [ServerError('error'),
+                             RateLimitError('error', retry_after=7),
+                             {'success': True}]
+
+    assert cloudflare._api_call('/zones') == {'success': True}
+    assert mock_sleep.call_args_list == [mock.call(1), mock.call(7)]
+
+
+@pytest.mark.parametrize('method,error', [
+    ('GET', AuthenticationError('error')),
+    ('POST', ServerError('error')),
+    ('GET', ServerError('error'))
+])
+@mock.patch('twindb_cloudflare.twindb_cloudflare.time.sleep')
+@mock.patch.object(CloudFlare, '_send')
+def test_api_call_does_not_retry(mock_send, mock_sleep, method, error):
+    retries = 0 if method == 'GET' and error.is_retryable else 2
+    cloudflare = CloudFlare("a@a.com", "foo", retries=retries)
+    mock_send.side_effect = error
+
+    with pytest.raises(type(error)):
+        cloudflare._api_call('/zones', method=method)
+    assert mock_send.call_count == 1
+
+
+def test_timeout_number_is_used_for_connect_and_read():
+    cloudflare = CloudFlare("a@a.com", "foo", timeout=5)
+    assert cloudflare._timeout == (5, 5)
+
+
+@mock.patch.object(CloudFlare, '_send')
+def test_deadline_cuts_request_timeout(mock_send, cloudflare):
+    mock_send.return_value = {'success': True}
+    with cloudflare.deadline(2):
+        cloudflare._api_call('/zones')
+
+    connect_timeout, read_timeout = mock_send.call_args[1]['timeout']
+    assert 1 < connect_timeout <= 2
+    assert 1 < read_timeout <= 2
+
+
+@mock.patch.object(CloudFlare, '_send')
+def test_deadline_exceeded_cancels_pending_calls(mock_send, cloudflare):
+    def slow_send(*args, **kwargs):
+        time.sleep(0.05)
+        return {'success': True, 'result': [{'id': 'some_id'}]}
+
+    mock_send.side_effect = slow_send
+    with pytest.raises(DeadlineExceeded):
+        with cloudflare.deadline(0.03):
+            cloudflare.update_dns_record('name', 'zone', 'ip')
+
+    assert mock_send.call_count == 1
+
+
+@mock.patch('twindb_cloudflare.twindb_cloudflare.time.sleep')
+@mock.patch.object(CloudFlare, '_send')
+def test_deadline_stops_retries(mock_send, mock_sleep):
+    cloudflare = CloudFlare("a@a.com", "foo", retries=5, retry_delay=1)
+    mock_send.side_effect = ServerError('error')
+
+    with pytest.raises(DeadlineExceeded) as err:
+        with cloudflare.deadline(3.5):
+            cloudflare._api_call('/zones')
+
+    # sleep() is mocked, so the third delay of 4 seconds doesn't fit
+    assert mock_sleep.call_args_list == [mock.call(1), mock.call(2)]
+    assert isinstance(err.value.__cause__, ServerError)
+
+
+@mock.patch.object(CloudFlare, '_send')
+def test_deadline_exceeded_by_clipped_timeout(mock_send, cloudflare):
+    def timed_out(*args, **kwargs):
+        time.sleep(kwargs['timeout'][1])
+        raise CloudFlareConnectionError('Read timed out')
+
+    mock_send.side_effect = timed_out
+    with pytest.raises(DeadlineExceeded) as err:
+        with cloudflare.deadline(0.03):
+            cloudflare._api_call('/zones')
+
+    assert isinstance(err.value.__cause__, CloudFlareConnectionError)
+    assert mock_send.call_count == 1
+
+
+@mock.patch.object(CloudFlare, '_send')
+def test_deadline_keeps_non_retryable_error(mock_send, cloudflare):
+    def not_found(*args, **kwargs):
+        time.sleep(kwargs['timeout'][1])
+        raise NotFoundError('not found')
+
+    mock_send.side_effect = not_found
+    with pytest.raises(NotFoundError):
+        with cloudflare.deadline(0.03):
+            cloudflare._api_call('/zones')
+
+
+@mock.patch.object(CloudFlare, '_send')
+def test_deadline_exceeded_waiting_for_rate_limit(mock_send, cloudflare):
+    mock_send.return_value = {'success': True}
+    bucket = TokenBucket(0.5, burst=1)
+    bucket.acquire()
+    started = time.time()
+    with pytest.raises(DeadlineExceeded):
+        with bucket.throttle():
+            with cloudflare.deadline(0.1):
+                cloudflare._api_call('/zones')
+
+    assert time.time() - started < 0.5
+    assert not mock_send.called
+
+
+@pytest.fixture
+def dual_stack():
+    with FakeCloudFlare() as server:
+        zone_id = server.add_zone('twindb.com')
+        server.add_record(zone_id, 'www.twindb.com', '10.0.0.1')
+        server.add_record(zone_id, 'www.twindb.com', 'fd00::1',
+                          record_type='AAAA')
+        server.add_record(zone_id, 'db.twindb.com', '10.0.0.9')
+        cloudflare = CloudFlare("a@a.com", "foo",
+                                api_endpoint=server.endpoint)
+        yield server, zone_id, cloudflare
+
+
+def _contents(server, zone_id, name):
+    return dict((record['type'], record['content'])
+                for record in server.records[zone_id].values()
+                if record['name'] == name)
+
+
+def test_update_dns_record_updates_record_of_given_type(dual_stack):
+    server, zone_id, cloudflare = dual_stack
+    cloudflare.update_dns_record('www.twindb.com', 'twindb.com', 'fd00::2',
+                                 record_type='AAAA')
+
+    assert _contents(server, zone_id, 'www.twindb.com') == \
+        {'A': '10.0.0.1', 'AAAA': 'fd00::2'}
+
+
+def test_update_host(dual_stack):
+    server, zone_id, cloudflare = dual_stack
+    results = cloudflare.update_host('www.twindb.com', 'twindb.com',
+                                     {'A': '10.0.0.2', 'AAAA': 'fd00::2'},
+                                     ttl=120)
+
+    assert sorted(results) == ['A', 'AAAA']
+    assert all(result.error is None for result in results.values())
+    assert results['AAAA'].record['content'] == 'fd00::2'
+    assert _contents(server, zone_id, 'www.twindb.com') == \
+        {'A': '10.0.0.2', 'AAAA': 'fd00::2'}
+    assert server.requests == {
+        ('GET', '/zones'): 1,
+        ('GET', '/zones/<id>/dns_records'): 1,
+        ('PUT', '/zones/<id>/dns_records/<id>'): 2
+    }
+
+
+def test_update_host_reports_missing_record(dual_stack):
+    server, zone_id, cloudflare = dual_stack
+    results = cloudflare.update_host('db.twindb.com', 'twindb.com',
+                                     {'A': '10.0.0.8', 'AAAA': 'fd00::8'})
+
+    assert results['A'].error is None
+    assert isinstance(results['AAAA'].error, NotFoundError)
+    assert results['AAAA'].record is None
+    assert _contents(server, zone_id, 'db.twindb.com') == {'A': '10.0.0.8'}
+
+
+def test_create_host(dual_stack):
+    server, zone_id, cloudflare = dual_stack
+    results = cloudflare.create_host('new.twindb.com', 'twindb.com',
+                                     {'A': '10.0.0.3', 'AAAA': 'fd00::3'})
+
+    assert results['A'].record['content'] == '10.0.0.3'
+    assert _contents(server, zone_id, 'new.twindb.com') == \
+        {'A': '10.0.0.3', 'AAAA': 'fd00::3'}
+    assert server.requests[('POST', '/zones/<id>/dns_records')] == 2
+
+
+def test_delete_host(dual_stack):
+    server, zone_id, cloudflare = dual_stack
+    results = cloudflare.delete_host('www.twindb.com', 'twindb.com')
+
+    assert [(t, r.error) for t, r in sorted(results.items())] == \
+        [('A', None), ('AAAA', None)]
+    assert _contents(server, zone_id, 'www.twindb.com') == {}
+    assert server.requests[('DELETE', '/zones/<id>/dns_records/<id>')] == 2
+
+
+@pytest.mark.parametrize('contents', [
+    {},
+    {'MX': 'mail.twindb.com'},
+    {'A': '10.0.0.1', 'CNAME': 'twindb.com'},
+    {'AAAA': 'fd00::1', 'CNAME': 'twindb.com'}
+])
+def test_host_methods_check_types(contents, cloudflare):
+    with pytest.raises(CloudFlareException):
+        cloudflare.update_host('www.twindb.com', 'twindb.com', contents)
+    with pytest.raises(CloudFlareException):
+        cloudflare.create_host('www.twindb.com', 'twindb.com', contents)
+    with pytest.raises(CloudFlareException):
+        cloudflare.delete_host('www.twindb.com', 'twindb.com',
+                               list(contents))
+
+
+def test_host_changes_keep_deadline(dual_stack):
+    server, zone_id, cloudflare = dual_stack
+    deadlines = []
+    send = cloudflare._send
+
+    def recording_send(url, **kwargs):
+        deadlines.append((kwargs['method'], current_deadline()))
+        return send(url, **kwargs)
+
+    with mock.patch.object(cloudflare, '_send', side_effect=recording_send):
+        with cloudflare.deadline(5) as deadline:
+            cloudflare.update_host('www.twindb.com', 'twindb.com',
+                                   {'A': '10.0.0.2', 'AAAA': 'fd00::2'})
+
+    assert [method for method, _ in deadlines].count('PUT') == 2
+    assert all(active is deadline for _, active in deadlines)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_watcher
+----------------------------------
+
+Tests for `twindb_cloudflare.watcher` module.
+"""
+import threading
+import time
+
+import mock
+import pytest
+from tests.fake_cloudflare import FakeCloudFlare
+from twindb_cloudflare.cache import ResponseCache
+from twindb_cloudflare.twindb_cloudflare import CloudFlare, \
+    CloudFlareConnectionError
+from twindb_cloudflare.watcher import ZoneWatcher, CREATED, MODIFIED, \
+    DELETED, record_digest
+
+
+@pytest.fixture
+def zone():
+    with FakeCloudFlare() as server:
+        zone_id = server.add_zone('twindb.com')
+        for i in range(250):
+            server.add_record(zone_id, 'host%03d.twindb.com' % i, '10.0.0.1')
+        cloudflare = CloudFlare('a@a.com', 'foo',
+                                api_endpoint=server.endpoint)
+        yield server, zone_id, cloudflare
+
+
+def _listings(server):
+    return server.requests.get(('GET', '/zones/<id>/dns_records'), 0)
+
+
+def _record_id(server, zone_id, name):
+    for record in server.records[zone_id].values():
+        if record['name'] == name:
+            return record['id']
+
+
+def test_first_poll_takes_snapshot(zone):
+    server, zone_id, cloudflare = zone
+    watcher = ZoneWatcher(cloudflare, zone_id, per_page=50)
+
+    assert watcher.poll() == []
+    assert len(watcher) == 250
+    assert _listings(server) == 5
+    assert watcher.full_scans == 1
+
+
+def test_poll_without_changes_reads_one_page(zone):
+    server, zone_id, cloudflare = zone
+    watcher = ZoneWatcher(cloudflare, zone_id, per_page=50)
+    watcher.poll()
+
+    assert watcher.poll() == []
+    assert _listings(server) == 6
+
+
+def test_poll_reports_created_and_modified(zone):
+    server, zone_id, cloudflare = zone
+    watcher = ZoneWatcher(cloudflare, zone_id, per_page=50)
+    watcher.poll()
+
+    record_id = _record_id(server, zone_id, 'host100.twindb.com')
+    cloudflare.update_record(zone_id, record_id,
+                             {'name': 'host100.twindb.com', 'type': 'A',
+                              'content': '10.0.0.2'})
+    server.add_record(zone_id, 'new.twindb.com', '10.0.0.3')
+    events = watcher.poll()
+
+    assert [(event.kind, event.record['name']) for event in events] == \
+        [(CREATED, 'new.twindb.com'), (MODIFIED, 'host100.twindb.com')]
+    assert events[1].record_id == record_id
+    assert events[1].record['content'] == '10.0.0.2'
+    assert _listings(server) == 6
+    assert watcher.full_scans == 1
+
+
+def test_rewrite_with_same_content_is_not_reported(zone):
+    server, zone_id, cloudflare = zone
+    watcher = ZoneWatcher(cloudflare, zone_id, per_page=50)
+    watcher.poll()
+
+    record_id = _record_id(server, zone_id, 'host001.twindb.com')
+    cloudflare.update_record(zone_id, record_id,
+                             {'name': 'host001.twindb.com', 'type': 'A',
+                              'content': '10.0.0.1'})
+
+    assert watcher.poll() == []
+
+
+def test_poll_reports_deleted(zone):
+    server, zone_id, cloudflare = zone
+    watcher = ZoneWatcher(cloudflare, zone_id, per_page=50)
+    watcher.poll()
+
+    record_id = _record_id(server, zone_id, 'host007.twindb.com')
+    cloudflare.delete_record(zone_id, record_id)
+    events = watcher.poll()
+
+    assert [(event.kind, event.record_id, event.record['name'])
+            for event in events] == \
+        [(DELETED, record_id, 'host007.twindb.com')]
+    assert len(watcher) == 249
+    assert watcher.full_scans == 2
+
+
+def test_unsorted_page_falls_back_to_full_scan(zone):
+    server, zone_id, cloudflare = zone
+    watcher = ZoneWatcher(cloudflare, zone_id, per_page=50)
+    watcher.poll()
+    server.add_record(zone_id, 'new.twindb.com', '10.0.0.3')
+    dns_records_page = cloudflare.dns_records_page
+
+    def ascending(*args, **kwargs):
+        records, result_info = dns_records_page(*args, **kwargs)
+        return records[::-1], result_info
+
+    with mock.patch.object(cloudflare, 'dns_records_page',
+                           side_effect=ascending):
+        events = watcher.poll()
+
+    assert [(event.kind, event.record['name']) for event in events] == \
+        [(CREATED, 'new.twindb.com')]
+    assert watcher.full_scans == 2
+
+
+def test_poll_bypasses_response_cache(zone):
+    server, zone_id, _ = zone
+    cloudflare = CloudFlare('a@a.com', 'foo', api_endpoint=server.endpoint,
+                            cache=ResponseCache())
+    watcher = ZoneWatcher(cloudflare, zone_id, per_page=50)
+    watcher.poll()
+    watcher.poll()
+    server.add_record(zone_id, 'new.twindb.com', '10.0.0.3')
+
+    assert [event.record['name'] for event in watcher.poll()] == \
+        ['new.twindb.com']
+    assert cloudflare.cache.hits == 0
+
+
+def test_record_digest():
+    record = {'id': '1', 'name': 'www', 'type': 'A', 'content': 'ip',
+              'ttl': 1, 'modified_on': 'today'}
+
+    assert len(record_digest(record)) == 8
+    assert record_digest(record) == \
+        record_digest(dict(record, id='2', modified_on='tomorrow'))
+    assert record_digest(record) != record_digest(dict(record, ttl=120))
+
+
+def test_background_polling(zone):
+    server, zone_id, cloudflare = zone
+    events = []
+    created = threading.Event()
+
+    def callback(event):
+        events.append(event)
+        created.set()
+
+    watcher = ZoneWatcher(cloudflare, zone_id, interval=0.01,
+                          callback=callback)
+    watcher.start()
+    try:
+        while not watcher.full_scans:
+            created.wait(0.01)
+        server.add_record(zone_id, 'new.twindb.com', '10.0.0.3')
+        assert created.wait(5)
+    finally:
+        watcher.stop()
+
+    assert [(event.kind, event.record['name']) for event in events] == \
+        [(CREATED, 'new.twindb.com')]
+
+
+def test_background_polling_keeps_last_error():
+    cloudflare = mock.Mock()
+    cloudflare.list_dns_records.side_effect = \
+        CloudFlareConnectionError('Connection refused')
+    watcher = ZoneWatcher(cloudflare, 'zone_id', interval=0.01,
+                          callback=mock.Mock())
+    watcher.start()
+    try:
+        while watcher.last_error is None:
+            time.sleep(0.01)
+    finally:
+        watcher.stop()
+
+    assert isinstance(watcher.last_error, CloudFlareConnectionError)
+    assert watcher.full_scans == 0
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of CloudFlare API responses to GET requests.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from twindb_cloudflare.sync import AtomicCounter, StripedLock
+
+DEFAULT_TTLS = [
+    (r'^/zones\?', 300),
+    (r'^/zones/[^/?]+/dns_records', 30),
+]
+"""Default cache TTLs. List of (regular expression, seconds)."""
+
+_ZONE_URL = re.compile(r'^/zones/([^/?]+)')
+
+
+def zone_of(url):
+    """
+    Get zone identifier from API url
+
+    :param url: API endpoint, like "/zones/<zone_id>/dns_records"
+    :return: zone identifier or None if the url isn't for a particular zone
+    """
+    match = _ZONE_URL.match(url)
+    if match:
+        return match.group(1)
+    return None
+
+
+class CacheEntry(object):
+    """
+    Cached response
+    """
+    def __init__(self, response, etag, expires, zone_id):
+        self.response = response
+        """Response body"""
+        self.etag = etag
+        """ETag header of the response or None"""
+        self.expires = expires
+        """Time when the entry must be revalidated"""
+        self.zone_id = zone_id
+        """Zone identifier the response belongs to"""
+
+    def is_fresh(self, now=None):
+        """
+        :return: True if the entry can be used without revalidation
+        """
+        return (now or time.time()) < self.expires
+
+
+class ResponseCache(object):
+    """
+    Cache of API responses with per endpoint TTLs.
+
+    An endpoint is cached if it matches one of the TTL regular expressions.
+    Expired entries with an ETag are kept for conditional revalidation.
+    Entries of a zone are dropped when the zone is changed.
+
+    The cache is safe to share between threads. Entries are spread over
+    ``stripes`` shards with a lock each, so concurrent lookups of different
+    endpoints rarely wait for each other.
+
+    Entries are kept per scope. Clients that share a cache pass their
+    API endpoint and e-mail as the scope, so one account never gets
+    responses cached for another one.
+    """
+    def __init__(self, ttls=None, max_entries=1024, stripes=16):
+        """
+        ResponseCache constructor
+
+        :param ttls: list of (regular expression, seconds).
+                     The first expression that matches url sets the TTL.
+                     DEFAULT_TTLS by default.
+        :param max_entries: maximum number of cached responses.
+                            Every shard keeps up to max_entries / stripes
+                            of them.
+        :param stripes: number of shards
+        """
+        if ttls is None:
+            ttls = DEFAULT_TTLS
+        self._ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self._locks = StripedLock(stripes)
+        self._shards = [OrderedDict() for _ in range(stripes)]
+        self._shard_size = max(1, max_entries // stripes)
+        self._generations = {}
+        self._generations_lock = threading.Lock()
+
+        self._hits = AtomicCounter()
+        self._misses = AtomicCounter()
+        self._revalidations = AtomicCounter()
+
+    @property
+    def hits(self):
+        """
+        :return: number of lookups that found a fresh entry
+        """
+        return self._hits.value
+
+    @property
+    def misses(self):
+        """
+        :return: number of lookups that found no entry or a stale one
+        """
+        return self._misses.value
+
+    @property
+    def revalidations(self):
+        """
+        :return: number of requests answered with 304 Not Modified
+        """
+        return self._revalidations.value
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def ttl(self, url):
+        """
+        :param url: API endpoint
+        :return: number of seconds to cache the endpoint for. 0 if the
+                 endpoint is not cached.
+        """
+        for pattern, ttl in self._ttls:
+            if pattern.search(url):
+                return ttl
+        return 0
+
+    def generation(self, url):
+        """
+        Get generation of the zone of url. The generation changes
+        every time the zone's entries are invalidated.
+
+        :param url: API endpoint
+        :return: generation number
+        """
+        return self._generations.get(zone_of(url), 0)
+
+    def get(self, url, scope=None):
+        """
+        Find cached response
+
+        :param url: API endpoint
+        :param scope: hashable owner of the entry, e.g. (endpoint, e-mail)
+        :return: CacheEntry or None. The entry may be stale, check
+                 is_fresh() before using it.
+        """
+        key = (scope, url)
+        index = self._locks.index(key)
+        with self._locks[index]:
+            entry = self._shards[index].get(key)
+        if entry is not None and entry.is_fresh():
+            self._hits.increment()
+        else:
+            self._misses.increment()
+        return entry
+
+    def put(self, url, response, etag=None, generation=None, scope=None):
+        """
+        Save response in cache
+
+        :param url: API endpoint
+        :param response: response body
+        :param etag: ETag header of the response
+        :param generation: zone generation when the request was sent.
+                           If the zone was invalidated since then,
+                           the response may be outdated and isn't saved.
+        :param scope: hashable owner of the entry, e.g. (endpoint, e-mail)
+        """
+        ttl = self.ttl(url)
+        if ttl <= 0:
+            return
+        entry = CacheEntry(response, etag, time.time() + ttl, zone_of(url))
+        key = (scope, url)
+        index = self._locks.index(key)
+        with self._locks[index]:
+            if generation is not None and \
+                    generation != self.generation(url):
+                return
+            shard = self._shards[index]
+            shard.pop(key, None)
+            shard[key] = entry
+            while len(shard) > self._shard_size:
+                shard.popitem(last=False)
+
+    def refresh(self, url, scope=None):
+        """
+        Extend life of a revalidated entry
+
+        :param url: API endpoint
+        :param scope: hashable owner of the entry, e.g. (endpoint, e-mail)
+        :return: the refreshed CacheEntry or None
+        """
+        key = (scope, url)
+        index = self._locks.index(key)
+        with self._locks[index]:
+            entry = self._shards[index].get(key)
+            if entry is not None:
+                entry.expires = time.time() + self.ttl(url)
+        self._revalidations.increment()
+        return entry
+
+    def invalidate(self, url):
+        """
+        Drop entries changed by a mutation of url.
+
+        A change of a zone's records drops all cached responses of the zone.
+        A change of a zone itself also drops cached zone listings.
+
+        :param url: API endpoint of the mutation
+        """
+        zone_id = zone_of(url)
+        zones = set([zone_id])
+        if zone_id is not None and \
+                url.split('?')[0].rstrip('/') == '/zones/' + zone_id:
+            zones.add(None)
+
+        with self._generations_lock:
+            for zone in zones:
+                self._generations[zone] = self._generations.get(zone, 0) + 1
+
+        for index, shard in enumerate(self._shards):
+            with self._locks[index]:
+                drop = [key for key, entry in shard.items()
+                        if entry.zone_id in zones]
+                for key in drop:
+                    del shard[key]
+
+    def clear(self):
+        """
+        Drop all entries
+        """
+        for index, shard in enumerate(self._shards):
+            with self._locks[index]:
+                shard.clear()
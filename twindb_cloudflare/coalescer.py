@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Write coalescing for rapidly changing records.
+
+A flapping health check may update the same record many times a second
+while only the last value matters. The coalescer holds updates of each
+record for a short window and sends only the latest one.
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from twindb_cloudflare.sync import AtomicCounter
+from twindb_cloudflare.twindb_cloudflare import CloudFlareException
+
+
+class _PendingWrite(object):
+    """
+    Updates of a record held in a window as (future, content, ttl)
+    in the order they were made
+    """
+    __slots__ = ('updates', 'deferred')
+
+    def __init__(self):
+        self.updates = []
+        self.deferred = False
+
+
+class WriteCoalescer(object):
+    """
+    Merge updates of a record made within a window into one update.
+
+    The window of a record starts with its first update. When it ends,
+    the latest content is sent with CloudFlare.update_dns_record().
+    Updates of one record are never sent concurrently: if the previous
+    update is still in flight, the next one waits for it.
+    """
+    def __init__(self, cloudflare, window=0.5, workers=4):
+        """
+        :param cloudflare: CloudFlare instance
+        :param window: seconds to hold updates of a record
+        :param workers: number of updates sent concurrently
+        """
+        self._cloudflare = cloudflare
+        self._window = window
+        self._executor = ThreadPoolExecutor(workers)
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._due = []
+        self._sequence = itertools.count()
+        self._in_flight = set()
+        self._closed = False
+        self._writes = AtomicCounter()
+        self._mutations = AtomicCounter()
+        self._thread = threading.Thread(target=self._run,
+                                        name="cloudflare-coalescer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def writes(self):
+        """
+        :return: number of updates requested
+        """
+        return self._writes.value
+
+    @property
+    def mutations(self):
+        """
+        :return: number of updates sent to API
+        """
+        return self._mutations.value
+
+    def update_dns_record(self, name, zone, content, record_type="A", ttl=1):
+        """
+        Update DNS record when the window of the record ends
+
+        :param name: domain name
+        :param zone: zone name
+        :param content: content of DNS record
+        :param record_type: DNS record type. "A" by default
+        :param ttl: TTL of DNS record. 1 by default
+        :return: concurrent.futures.Future. It is done when this update
+                 or a later update of the same record is applied.
+                 The future can be cancelled until the update is sent.
+                 The latest update whose future isn't cancelled is sent,
+                 if all futures of a record are cancelled, nothing is.
+        :raise: CloudFlareException if the coalescer is closed
+        """
+        key = (zone, name, record_type)
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise CloudFlareException("Write coalescer is closed")
+            write = self._pending.get(key)
+            if write is None:
+                write = self._pending[key] = _PendingWrite()
+                heapq.heappush(self._due, (time.time() + self._window,
+                                           next(self._sequence), key,
+                                           write))
+                self._cond.notify_all()
+            write.updates.append((future, content, ttl))
+        self._writes.increment()
+        return future
+
+    def flush(self):
+        """
+        Send all held updates now, don't wait for their windows to end
+        """
+        with self._cond:
+            for key in list(self._pending):
+                self._dispatch(key)
+
+    def close(self):
+        """
+        Send held updates and wait until all updates are applied
+        """
+        with self._cond:
+            self._closed = True
+            for key in list(self._pending):
+                self._dispatch(key)
+            while self._pending or self._in_flight:
+                self._cond.wait()
+            self._cond.notify_all()
+        self._thread.join()
+        self._executor.shutdown()
+
+    def _dispatch(self, key):
+        if key in self._in_flight:
+            self._pending[key].deferred = True
+            return
+        write = self._pending.pop(key)
+        self._in_flight.add(key)
+        self._executor.submit(self._apply, key, write)
+
+    def _apply(self, key, write):
+        zone, name, record_type = key
+        updates = [update for update in write.updates
+                   if update[0].set_running_or_notify_cancel()]
+        futures = [future for future, _, _ in updates]
+        try:
+            if updates:
+                _, content, ttl = updates[-1]
+                self._mutations.increment()
+                result = self._cloudflare.update_dns_record(
+                    name, zone, content, record_type=record_type, ttl=ttl)
+        except Exception as err:
+            for future in futures:
+                future.set_exception(err)
+        else:
+            for future in futures:
+                future.set_result(result)
+        finally:
+            with self._cond:
+                self._in_flight.discard(key)
+                pending = self._pending.get(key)
+                if pending is not None and pending.deferred:
+                    self._dispatch(key)
+                self._cond.notify_all()
+
+    def _run(self):
+        with self._cond:
+            while not self._closed or self._due:
+                if not self._due:
+                    self._cond.wait()
+                    continue
+                due, _, key, write = self._due[0]
+                delay = due - time.time()
+                if delay > 0 and not self._closed:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._due)
+                if self._pending.get(key) is write:
+                    self._dispatch(key)
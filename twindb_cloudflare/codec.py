@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+JSON codecs for API requests and responses.
+
+A codec encodes request bodies straight to bytes and decodes response
+bodies from bytes, so nothing is converted to str on the way.
+The stdlib codec is always available, faster ones are used only
+if their module is installed.
+"""
+import json
+
+
+class JSONCodec(object):
+    """
+    Codec based on the standard json module
+    """
+    name = 'json'
+
+    def encode(self, obj):
+        """
+        Serialize object
+
+        :param obj: JSON-serializable object
+        :return: UTF-8 encoded JSON document
+        :rtype: bytes
+        """
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data):
+        """
+        Deserialize JSON document
+
+        :param data: UTF-8 encoded JSON document
+        :type data: bytes
+        :return: decoded object
+        :raise: ValueError if data is not a valid JSON document
+        """
+        return json.loads(data.decode('utf-8'))
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    Codec based on orjson. orjson must be installed.
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def encode(self, obj):
+        return self._orjson.dumps(obj)
+
+    def decode(self, data):
+        return self._orjson.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    """
+    Codec based on ujson. ujson must be installed.
+    """
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._ujson = ujson
+
+    def encode(self, obj):
+        return self._ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+    def decode(self, data):
+        return self._ujson.loads(data)
+
+
+CODECS = [OrjsonCodec, UjsonCodec, JSONCodec]
+"""Known codecs, fastest first"""
+
+
+def get_codec(name=None):
+    """
+    Get codec by name
+
+    :param name: codec name - "orjson", "ujson" or "json".
+                 If None, the fastest installed codec is returned.
+    :return: codec instance
+    :raise: ValueError if the codec is unknown
+    :raise: ImportError if the codec module is not installed
+    """
+    if name is None:
+        for codec_class in CODECS:
+            try:
+                return codec_class()
+            except ImportError:
+                pass
+
+    for codec_class in CODECS:
+        if codec_class.name == name:
+            return codec_class()
+
+    raise ValueError("Unknown JSON codec %r" % name)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Deadlines for groups of API calls.
+
+A deadline is a point in time by which a whole operation must finish.
+While a deadline is active in a thread, every API call of that thread
+gets only the time that is left: request timeouts are cut down to it,
+retries stop when it passes and calls not started yet fail right away.
+"""
+import threading
+import time
+
+_local = threading.local()
+
+
+def _active():
+    try:
+        return _local.deadlines
+    except AttributeError:
+        _local.deadlines = []
+        return _local.deadlines
+
+
+class Deadline(object):
+    """
+    Time budget of an operation.
+
+    Use it as a context manager to make it active in the current thread.
+    Deadlines can be nested, the earliest one wins. The same deadline
+    may be entered in several threads to share the budget with workers.
+    """
+    def __init__(self, seconds):
+        """
+        :param seconds: time budget in seconds
+        """
+        self.seconds = seconds
+        self.expires = time.time() + seconds
+
+    def remaining(self):
+        """
+        :return: seconds left, zero or negative if the deadline passed
+        """
+        return self.expires - time.time()
+
+    @property
+    def expired(self):
+        """
+        :return: True if the deadline passed
+        """
+        return self.remaining() <= 0
+
+    def __enter__(self):
+        _active().append(self)
+        return self
+
+    def __exit__(self, *args):
+        _active().remove(self)
+
+
+def current_deadline():
+    """
+    Get the earliest deadline active in the current thread
+
+    :return: Deadline or None
+    """
+    deadlines = _active()
+    if not deadlines:
+        return None
+    return min(deadlines, key=lambda deadline: deadline.expires)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+DNS failover controller.
+
+The controller watches a pool of candidate IP addresses for every DNS
+record and moves the record to a healthy candidate when the address it
+currently points to goes down.
+"""
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from twindb_cloudflare.twindb_cloudflare import CloudFlareException
+
+FailoverEvent = namedtuple('FailoverEvent', [
+    'name',
+    'old_content',
+    'new_content',
+    'detected_at',
+    'latency',
+    'api_calls',
+    'error'
+])
+"""
+Result of a single failover.
+
+``detected_at`` is the time of the first failed health check of
+``old_content``, ``latency`` is the number of seconds between that moment
+and the completion of the DNS update, ``api_calls`` is how many CloudFlare
+API calls the update took. ``error`` is the exception if the update failed,
+None otherwise.
+"""
+
+
+class _HealthState(object):
+    """
+    Debounced health state of one candidate
+    """
+    def __init__(self):
+        self.up = True
+        self.successes = 0
+        self.failures = 0
+        self.down_since = None
+
+    def update(self, healthy, now, rise, fall):
+        if healthy:
+            self.successes += 1
+            self.failures = 0
+            if not self.up and self.successes >= rise:
+                self.up = True
+                self.down_since = None
+        else:
+            self.failures += 1
+            self.successes = 0
+            if self.failures == 1:
+                self.down_since = now
+            if self.up and self.failures >= fall:
+                self.up = False
+
+
+class FailoverController(object):
+    """
+    Moves DNS records to healthy hosts.
+
+    Every ``interval`` seconds all candidates are checked concurrently with
+    ``health_check``. A candidate is declared down after ``fall``
+    consecutive failed checks and up again after ``rise`` consecutive
+    successful ones, so a flapping host doesn't trigger DNS updates.
+
+    A record is updated only when the address it points to is down.
+    The controller doesn't fail back when the original address recovers,
+    it stays on the new one until that one fails.
+    """
+    def __init__(self, cloudflare, zone, pool, health_check,
+                 interval=10, rise=2, fall=3, active=None,
+                 record_type="A", ttl=1, workers=10):
+        """
+        FailoverController constructor
+
+        :param cloudflare: CloudFlare instance
+        :param str zone: zone name
+        :param dict pool: record name -> list of candidate contents
+                          in order of preference
+        :param health_check: callable that takes a candidate and returns
+                             True if it's healthy. An exception counts
+                             as a failed check.
+        :param interval: seconds between health check rounds
+        :param rise: successful checks to declare a candidate up
+        :param fall: failed checks to declare a candidate down
+        :param dict active: record name -> content the record points to
+                            now. The first candidate by default.
+                            The content must be one of the candidates.
+        :param record_type: DNS record type. "A" by default
+        :param ttl: TTL of DNS record. 1 by default
+        :param workers: number of concurrent health checks
+        :raise: CloudFlareException if an active content is not
+                a candidate of its record
+        """
+        self._cloudflare = cloudflare
+        self._zone = zone
+        self._pool = dict((name, list(candidates))
+                          for name, candidates in pool.items())
+        self._health_check = health_check
+        self._interval = interval
+        self._rise = rise
+        self._fall = fall
+        self._record_type = record_type
+        self._ttl = ttl
+        self._workers = workers
+
+        self._active = dict((name, candidates[0])
+                            for name, candidates in self._pool.items())
+        if active:
+            for name, content in active.items():
+                if content not in self._pool.get(name, ()):
+                    raise CloudFlareException(
+                        "%s is not a candidate of %s" % (content, name))
+            self._active.update(active)
+
+        self._health = {}
+        for candidates in self._pool.values():
+            for candidate in candidates:
+                self._health[candidate] = _HealthState()
+
+        self._events = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def active(self):
+        """
+        :return: dictionary record name -> content it points to
+        """
+        with self._lock:
+            return dict(self._active)
+
+    @property
+    def events(self):
+        """
+        :return: list of FailoverEvent, oldest first
+        """
+        with self._lock:
+            return list(self._events)
+
+    def is_up(self, candidate):
+        """
+        :param candidate: candidate content
+        :return: debounced health state of the candidate
+        """
+        return self._health[candidate].up
+
+    def _check(self, candidate):
+        try:
+            return bool(self._health_check(candidate))
+        except Exception:
+            return False
+
+    def check_once(self):
+        """
+        Run one round of health checks and fail over records
+        whose active candidate is down.
+
+        :return: list of FailoverEvent issued in this round
+        """
+        candidates = sorted(self._health)
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            results = list(executor.map(self._check, candidates))
+
+        now = time.time()
+        for candidate, healthy in zip(candidates, results):
+            self._health[candidate].update(healthy, now,
+                                           self._rise, self._fall)
+
+        events = []
+        for name in sorted(self._pool):
+            event = self._failover(name)
+            if event:
+                events.append(event)
+
+        with self._lock:
+            self._events.extend(events)
+        return events
+
+    def _failover(self, name):
+        current = self._active[name]
+        state = self._health[current]
+        if state.up:
+            return None
+
+        for candidate in self._pool[name]:
+            if candidate != current and self._health[candidate].up:
+                break
+        else:
+            return None
+
+        calls_before = self._cloudflare.api_calls
+        error = None
+        try:
+            self._cloudflare.update_dns_record(name, self._zone, candidate,
+                                               record_type=self._record_type,
+                                               ttl=self._ttl)
+            with self._lock:
+                self._active[name] = candidate
+        except CloudFlareException as err:
+            error = err
+
+        return FailoverEvent(name=name,
+                             old_content=current,
+                             new_content=candidate,
+                             detected_at=state.down_since,
+                             latency=time.time() - state.down_since,
+                             api_calls=self._cloudflare.api_calls -
+                             calls_before,
+                             error=error)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            self.check_once()
+            self._stop.wait(max(0, self._interval -
+                                (time.time() - started)))
+
+    def start(self):
+        """
+        Start checking candidates every ``interval`` seconds
+        in a background thread.
+        """
+        if self._thread is not None:
+            raise CloudFlareException("Failover controller already started")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="cloudflare-failover")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread and wait until it exits.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling of API calls.
+
+With ``CloudFlare(..., profile=True)`` every request is split into
+phases and the time is attributed to the stack of client operations
+that made it, e.g. ``update_dns_record;get_zone_id;GET /zones``.
+
+Phases of a request:
+
+* queue - waiting for an HTTP session
+* connect - name resolution and TCP connect, only on new connections
+* tls - TLS handshake, only on new HTTPS connections
+* send - sending the request
+* ttfb - waiting for the response headers
+* download - reading the response body
+* decode - decoding JSON
+* other - everything else in the client and requests
+* retry_wait - sleeping before a retry
+
+The report is available as a collapsed-stack file for flamegraph.pl
+or speedscope, or as JSON.
+"""
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+PHASES = ('queue', 'connect', 'tls', 'send', 'ttfb', 'download', 'decode',
+          'other', 'retry_wait')
+"""Phases of a request in the order they happen"""
+
+_local = threading.local()
+
+
+def _stack():
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+
+def current_stack():
+    """
+    :return: tuple of operations in progress in this thread,
+             the outermost first
+    """
+    return tuple(_stack())
+
+
+@contextmanager
+def continued_stack(stack):
+    """
+    Context manager that attributes requests of the current thread
+    to operations started in another thread
+
+    :param stack: operations returned by current_stack()
+    """
+    frames = _stack()
+    saved = frames[:]
+    frames[:] = stack
+    try:
+        yield
+    finally:
+        frames[:] = saved
+
+
+def current_timer():
+    """
+    :return: RequestTimer of the request in progress in this thread
+             or None
+    """
+    return getattr(_local, 'timer', None)
+
+
+def request_label(method, url):
+    """
+    Name of a request in stacks: method and path without query.
+    Identifiers are replaced with ``<id>``.
+
+    :param method: HTTP method
+    :param url: API endpoint
+    :return: label like "GET /zones/<id>/dns_records"
+    """
+    path = url.split('?', 1)[0]
+    return '%s %s' % (method, re.sub(r'/[0-9a-f]{32}', '/<id>', path))
+
+
+class RequestTimer(object):
+    """
+    Time of phases of one request
+    """
+    def __init__(self, profiler, stack):
+        self._profiler = profiler
+        self._stack = stack
+        self._started = time.time()
+        self.phases = {}
+
+    def add(self, phase, seconds):
+        """
+        Add time to a phase
+
+        :param phase: one of PHASES
+        :param seconds: time spent
+        """
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def get(self, phase):
+        """
+        :param phase: one of PHASES
+        :return: time of the phase so far
+        """
+        return self.phases.get(phase, 0.0)
+
+    @contextmanager
+    def phase(self, phase):
+        """
+        Context manager that adds its run time to a phase
+
+        :param phase: one of PHASES
+        """
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.add(phase, time.time() - started)
+
+    def __enter__(self):
+        _local.timer = self
+        return self
+
+    def __exit__(self, *args):
+        _local.timer = None
+        total = time.time() - self._started
+        self.add('other', max(0.0, total - sum(self.phases.values())))
+        self._profiler.record(self._stack, self.phases)
+
+
+class _OperationStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.requests = 0
+        self.phases = dict((phase, 0.0) for phase in PHASES)
+
+
+class Profiler(object):
+    """
+    Collects phase timings of requests made in all threads
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._operations = {}
+        self._requests = {}
+
+    @contextmanager
+    def operation(self, name):
+        """
+        Context manager for a client operation. Requests made inside
+        are attributed to it and to the enclosing operations.
+
+        :param name: operation name, e.g. "update_dns_record"
+        """
+        stack = _stack()
+        stack.append(name)
+        started = time.time()
+        try:
+            yield
+        finally:
+            stack.pop()
+            with self._lock:
+                stats = self._operations.setdefault(name, _OperationStats())
+                stats.calls += 1
+                stats.wall += time.time() - started
+
+    def request(self, method, url):
+        """
+        Start timing a request
+
+        :param method: HTTP method
+        :param url: API endpoint
+        :return: RequestTimer, a context manager
+        """
+        label = request_label(method, url)
+        return RequestTimer(self, tuple(_stack()) + (label,))
+
+    def record(self, stack, phases, request=True):
+        """
+        Add phase timings
+
+        :param stack: operation names and the request label
+        :param phases: dictionary phase -> seconds
+        :param request: if True, the timings are of a finished request.
+                        Otherwise only the time is added, e.g. a wait
+                        before a retry.
+        """
+        with self._lock:
+            for phase, seconds in phases.items():
+                key = stack + (phase,)
+                self._samples[key] = self._samples.get(key, 0.0) + seconds
+            rollups = [self._requests.setdefault(stack[-1],
+                                                 _OperationStats())]
+            for name in set(stack[:-1]):
+                rollups.append(self._operations.setdefault(
+                    name, _OperationStats()))
+            for stats in rollups:
+                if request:
+                    stats.requests += 1
+                for phase, seconds in phases.items():
+                    stats.phases[phase] += seconds
+            if request:
+                self._requests[stack[-1]].calls += 1
+            self._requests[stack[-1]].wall += sum(phases.values())
+
+    def add(self, method, url, phase, seconds):
+        """
+        Add time spent outside of a request, e.g. before a retry
+
+        :param method: HTTP method
+        :param url: API endpoint
+        :param phase: one of PHASES
+        :param seconds: time spent
+        """
+        self.record(tuple(_stack()) + (request_label(method, url),),
+                    {phase: seconds}, request=False)
+
+    def reset(self):
+        """
+        Forget collected timings
+        """
+        with self._lock:
+            self._samples.clear()
+            self._operations.clear()
+            self._requests.clear()
+
+    def collapsed(self):
+        """
+        Timings in collapsed-stack format, one ``frame;frame;... value``
+        line per stack. Values are microseconds.
+
+        :return: str
+        """
+        with self._lock:
+            samples = sorted(self._samples.items())
+        return ''.join('%s %d\n' % (';'.join(stack), round(seconds * 1e6))
+                       for stack, seconds in samples)
+
+    def report(self):
+        """
+        Timings rolled up per operation and per request. Times are
+        in seconds. ``wall`` of an operation is its total run time,
+        ``phases`` sum up the requests it made, directly or through
+        other operations.
+
+        :return: dictionary with "operations" and "requests" keys
+        """
+        def stats_dict(stats):
+            return {
+                'calls': stats.calls,
+                'wall': stats.wall,
+                'requests': stats.requests,
+                'phases': dict(stats.phases)
+            }
+
+        with self._lock:
+            return {
+                'operations': dict((name, stats_dict(stats))
+                                   for name, stats
+                                   in self._operations.items()),
+                'requests': dict((label, stats_dict(stats))
+                                 for label, stats in self._requests.items())
+            }
+
+    def dump_collapsed(self, path):
+        """
+        Write collapsed stacks to a file, e.g. for flamegraph.pl
+
+        :param path: file name
+        """
+        with open(path, 'w') as collapsed_file:
+            collapsed_file.write(self.collapsed())
+
+    def dump_json(self, path):
+        """
+        Write the JSON report to a file
+
+        :param path: file name
+        """
+        with open(path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2, sort_keys=True)
+
+
+def _timed(phase):
+    timer = current_timer()
+    if timer is None:
+        return _no_timer()
+    return timer.phase(phase)
+
+
+@contextmanager
+def _no_timer():
+    yield
+
+
+_adapter_class = None
+
+
+def timed_adapter():
+    """
+    requests transport adapter whose connections report connect, TLS,
+    send and time to first byte to the current RequestTimer
+
+    :return: HTTPAdapter instance
+    """
+    global _adapter_class
+    if _adapter_class is None:
+        _adapter_class = _build_adapter_class()
+    return _adapter_class()
+
+
+def _build_adapter_class():
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, \
+        HTTPSConnectionPool
+
+    class TimedConnectionMixin(object):
+        def _new_conn(self):
+            with _timed('connect'):
+                return super(TimedConnectionMixin, self)._new_conn()
+
+        def request(self, *args, **kwargs):
+            timer = current_timer()
+            if timer is None:
+                return super(TimedConnectionMixin, self).request(*args,
+                                                                 **kwargs)
+            before = timer.get('connect') + timer.get('tls')
+            started = time.time()
+            try:
+                return super(TimedConnectionMixin, self).request(*args,
+                                                                 **kwargs)
+            finally:
+                connecting = timer.get('connect') + timer.get('tls') - before
+                timer.add('send', time.time() - started - connecting)
+
+        def getresponse(self, *args, **kwargs):
+            with _timed('ttfb'):
+                return super(TimedConnectionMixin, self).getresponse(
+                    *args, **kwargs)
+
+    class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+        pass
+
+    class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+        def connect(self):
+            timer = current_timer()
+            if timer is None:
+                return super(TimedHTTPSConnection, self).connect()
+            before = timer.get('connect')
+            started = time.time()
+            try:
+                return super(TimedHTTPSConnection, self).connect()
+            finally:
+                tcp = timer.get('connect') - before
+                timer.add('tls', time.time() - started - tcp)
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    class TimedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super(TimedAdapter, self).init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': TimedHTTPConnectionPool,
+                'https': TimedHTTPSConnectionPool
+            }
+
+    return TimedAdapter
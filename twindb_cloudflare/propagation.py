@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+DNS propagation checks.
+
+Resolvers are queried directly over UDP, so no DNS library is needed.
+"""
+import random
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_RESOLVERS = ['1.1.1.1', '8.8.8.8', '9.9.9.9']
+"""Public resolvers to check propagation with"""
+
+RECORD_TYPES = {
+    'A': 1,
+    'NS': 2,
+    'CNAME': 5,
+    'MX': 15,
+    'TXT': 16,
+    'AAAA': 28
+}
+"""DNS record type codes"""
+
+_CLASS_IN = 1
+_FLAG_RD = 0x0100
+_FLAG_TC = 0x0200
+
+
+class DNSQueryError(Exception):
+    """
+    Exception for malformed or failed DNS responses
+    """
+    pass
+
+
+def resolver_address(resolver):
+    """
+    Convert resolver to socket address
+
+    :param resolver: "host", "host:port", "[ipv6]:port" or (host, port)
+    :return: tuple (host, port)
+    """
+    if isinstance(resolver, tuple):
+        return resolver
+    if resolver.startswith('['):
+        host, _, port = resolver[1:].partition(']')
+        return host, int(port.lstrip(':') or 53)
+    if resolver.count(':') == 1:
+        host, port = resolver.split(':')
+        return host, int(port)
+    return resolver, 53
+
+
+def build_query(name, record_type="A", query_id=None):
+    """
+    Build DNS query with recursion desired
+
+    :param name: domain name
+    :param record_type: DNS record type
+    :param query_id: 16 bit query identifier. Random by default.
+    :return: tuple (query_id, query packet)
+    """
+    if query_id is None:
+        query_id = random.randint(0, 0xffff)
+    header = struct.pack('!HHHHHH', query_id, _FLAG_RD, 1, 0, 0, 0)
+    qname = b''
+    for label in name.rstrip('.').split('.'):
+        label = label.encode('idna')
+        qname += struct.pack('!B', len(label)) + label
+    question = qname + b'\0' + struct.pack('!HH', RECORD_TYPES[record_type],
+                                           _CLASS_IN)
+    return query_id, header + question
+
+
+def _read_name(data, offset):
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        if offset >= len(data):
+            raise DNSQueryError("Truncated name")
+        length = ord(data[offset:offset + 1])
+        if length & 0xc0 == 0xc0:
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            if jumps > 64:
+                raise DNSQueryError("Name compression loop")
+            offset = struct.unpack('!H', data[offset:offset + 2])[0] & 0x3fff
+        elif length == 0:
+            offset += 1
+            break
+        else:
+            labels.append(data[offset + 1:offset + 1 + length].decode('ascii'))
+            offset += 1 + length
+    return '.'.join(labels), end if end is not None else offset
+
+
+def _rdata_to_text(data, offset, rdlength, rtype):
+    rdata = data[offset:offset + rdlength]
+    if rtype == RECORD_TYPES['A']:
+        return socket.inet_ntop(socket.AF_INET, rdata)
+    if rtype == RECORD_TYPES['AAAA']:
+        return socket.inet_ntop(socket.AF_INET6, rdata)
+    if rtype in (RECORD_TYPES['CNAME'], RECORD_TYPES['NS']):
+        return _read_name(data, offset)[0]
+    if rtype == RECORD_TYPES['MX']:
+        return _read_name(data, offset + 2)[0]
+    if rtype == RECORD_TYPES['TXT']:
+        strings = []
+        pos = 0
+        while pos < len(rdata):
+            length = ord(rdata[pos:pos + 1])
+            strings.append(rdata[pos + 1:pos + 1 + length].decode('utf-8'))
+            pos += 1 + length
+        return ''.join(strings)
+    return None
+
+
+def parse_response(data, query_id, record_type="A"):
+    """
+    Parse DNS response
+
+    :param data: response packet
+    :param query_id: identifier of the query
+    :param record_type: DNS record type to return answers of
+    :return: list of answers as text, e.g. IP addresses for A records
+    :raise: DNSQueryError if the response is malformed, truncated,
+            doesn't match the query or the resolver returned an error
+            other than NXDOMAIN.
+    """
+    if len(data) < 12:
+        raise DNSQueryError("Response is too short")
+    response_id, flags, qdcount, ancount, _, _ = \
+        struct.unpack('!HHHHHH', data[:12])
+    if response_id != query_id:
+        raise DNSQueryError("Response id %d doesn't match query id %d"
+                            % (response_id, query_id))
+    if flags & _FLAG_TC:
+        raise DNSQueryError("Response is truncated")
+    rcode = flags & 0x000f
+    if rcode == 3:
+        return []
+    if rcode != 0:
+        raise DNSQueryError("Resolver returned error code %d" % rcode)
+
+    offset = 12
+    for _ in range(qdcount):
+        offset = _read_name(data, offset)[1] + 4
+
+    rtype_wanted = RECORD_TYPES[record_type]
+    answers = []
+    for _ in range(ancount):
+        offset = _read_name(data, offset)[1]
+        rtype, _, _, rdlength = struct.unpack('!HHIH',
+                                              data[offset:offset + 10])
+        offset += 10
+        if rtype == rtype_wanted:
+            answers.append(_rdata_to_text(data, offset, rdlength, rtype))
+        offset += rdlength
+    return answers
+
+
+def query(resolver, name, record_type="A", timeout=2):
+    """
+    Query resolver over UDP
+
+    :param resolver: resolver address, see resolver_address()
+    :param name: domain name
+    :param record_type: DNS record type
+    :param timeout: seconds to wait for response
+    :return: list of answers as text
+    :raise: DNSQueryError if no valid response in time
+    """
+    host, port = resolver_address(resolver)
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    query_id, packet = build_query(name, record_type)
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect((host, port))
+        sock.send(packet)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                data = sock.recv(4096)
+            except socket.timeout:
+                raise DNSQueryError("No response from %s:%d in %s seconds"
+                                    % (host, port, timeout))
+            except socket.error as err:
+                raise DNSQueryError(err)
+            # Late responses to previous queries are skipped
+            if data[:2] == packet[:2]:
+                return parse_response(data, query_id, record_type)
+            sock.settimeout(max(0.001, deadline - time.time()))
+    finally:
+        sock.close()
+
+
+def normalize(content, record_type="A"):
+    """
+    Normalize record content for comparison
+
+    :param content: record content
+    :param record_type: DNS record type
+    :return: normalized content
+    """
+    if record_type == 'AAAA':
+        return socket.inet_ntop(socket.AF_INET6,
+                                socket.inet_pton(socket.AF_INET6, content))
+    if record_type in ('CNAME', 'NS', 'MX'):
+        return content.rstrip('.').lower()
+    return content
+
+
+def _wait_resolver(resolver, name, expected, record_type,
+                   started, deadline, interval, max_interval):
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        try:
+            answers = query(resolver, name, record_type,
+                            timeout=min(2, remaining))
+            answers = [normalize(answer, record_type) for answer in answers]
+            if expected in answers:
+                return time.time() - started
+        except DNSQueryError:
+            pass
+        time.sleep(max(0, min(interval, deadline - time.time())))
+        interval = min(interval * 2, max_interval)
+
+
+def wait_for_propagation(name, expected_content, resolvers=None,
+                         record_type="A", timeout=300,
+                         interval=0.5, max_interval=10):
+    """
+    Wait until resolvers return expected content for a DNS record.
+
+    All resolvers are polled concurrently. The polling interval
+    doubles after every attempt up to max_interval.
+
+    :param name: domain name
+    :param expected_content: content the resolvers must return,
+                             e.g. IP address for A records
+    :param resolvers: list of resolvers, see resolver_address().
+                      DEFAULT_RESOLVERS by default.
+    :param record_type: DNS record type. "A" by default
+    :param timeout: seconds to wait for all resolvers
+    :param interval: seconds between the first two queries to a resolver
+    :param max_interval: maximum seconds between queries to a resolver
+    :return: dictionary resolver -> seconds it took the resolver
+             to return expected content or None if it didn't in time
+    :raise: ValueError if the list of resolvers is empty
+    """
+    if resolvers is None:
+        resolvers = DEFAULT_RESOLVERS
+    if not resolvers:
+        raise ValueError("No resolvers given")
+    expected = normalize(expected_content, record_type)
+    started = time.time()
+    deadline = started + timeout
+    with ThreadPoolExecutor(max_workers=len(resolvers)) as executor:
+        futures = [executor.submit(_wait_resolver, resolver, name, expected,
+                                   record_type, started, deadline,
+                                   interval, max_interval)
+                   for resolver in resolvers]
+        return dict((resolver, future.result())
+                    for resolver, future in zip(resolvers, futures))
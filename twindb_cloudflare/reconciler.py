@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+Reconciler of DNS records for many zones.
+
+Desired state is a directory with a JSON file per zone. The file name
+is the zone name with ".json" suffix, the content is a list of records::
+
+    [
+        {"name": "www.twindb.com", "type": "A", "content": "10.0.0.1"},
+        {"name": "twindb.com", "type": "MX", "content": "mx.twindb.com",
+         "ttl": 3600, "priority": 10}
+    ]
+
+Zones are reconciled in a pool of worker processes. Every worker keeps
+one CloudFlare client and reads desired state of a zone only when it
+reconciles the zone.
+"""
+import glob
+import json
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+
+from twindb_cloudflare.deadline import Deadline
+from twindb_cloudflare.twindb_cloudflare import CloudFlare, \
+    CloudFlareException, CF_API_ENDPOINT, RECORD_FIELDS
+
+ZoneResult = namedtuple('ZoneResult', [
+    'zone',
+    'created',
+    'updated',
+    'deleted',
+    'unchanged',
+    'api_calls',
+    'elapsed',
+    'error',
+    'retryable'
+])
+"""
+Result of reconciling one zone. ``created``, ``updated``, ``deleted``
+and ``unchanged`` are numbers of records, ``error`` is the error
+message if the zone failed, None otherwise. ``retryable`` is True
+if the zone failed with an error that may go away on the next run.
+"""
+
+_COMPARED_FIELDS = ('content', 'ttl', 'proxied', 'priority', 'data')
+
+try:
+    _STRING_TYPES = (str, unicode)
+except NameError:  # Python 3
+    _STRING_TYPES = (str,)
+
+
+def _record_key(record):
+    return record['name'].lower().rstrip('.'), record['type'].upper()
+
+
+def _needs_update(current, desired):
+    for field in _COMPARED_FIELDS:
+        if field in desired and current.get(field) != desired[field]:
+            return True
+    return False
+
+
+def diff_records(current, desired, prune=False):
+    """
+    Compare records of a zone with desired ones.
+
+    Records are matched by name and type. If a name has several records
+    of the same type, records with the same content are matched first,
+    the rest are paired in order.
+
+    :param current: list of records as returned by API
+    :param desired: list of desired records
+    :param prune: if True, records absent from desired state are deleted
+    :return: tuple (creates, updates, deletes, unchanged). ``creates`` is
+             a list of records to create, ``updates`` - list of (record id,
+             record), ``deletes`` - list of record ids, ``unchanged`` -
+             number of records that match.
+    """
+    current_by_key = {}
+    for record in current:
+        current_by_key.setdefault(_record_key(record), []).append(record)
+    desired_by_key = {}
+    for record in desired:
+        desired_by_key.setdefault(_record_key(record), []).append(record)
+
+    creates = []
+    updates = []
+    unchanged = 0
+    for key in sorted(desired_by_key):
+        wanted = desired_by_key[key]
+        existing = current_by_key.pop(key, [])
+        unmatched = []
+        for record in wanted:
+            for candidate in existing:
+                if candidate.get('content') == record.get('content'):
+                    existing.remove(candidate)
+                    if _needs_update(candidate, record):
+                        updates.append((candidate['id'], record))
+                    else:
+                        unchanged += 1
+                    break
+            else:
+                unmatched.append(record)
+
+        for record in unmatched:
+            if existing:
+                updates.append((existing.pop(0)['id'], record))
+            else:
+                creates.append(record)
+
+        if existing:
+            current_by_key[key] = existing
+
+    deletes = []
+    if prune:
+        for records in current_by_key.values():
+            deletes.extend(record['id'] for record in records)
+
+    return creates, updates, sorted(deletes), unchanged
+
+
+def read_desired_state(path):
+    """
+    Read desired state of a zone
+
+    :param path: path to JSON file
+    :return: tuple (zone name, list of records)
+    :raise: ValueError if the file is not a list of records
+    """
+    zone = os.path.basename(path)[:-len('.json')]
+    with open(path) as desired_file:
+        desired = json.load(desired_file)
+    if not isinstance(desired, list):
+        raise ValueError("%s is not a list of records" % path)
+    for record in desired:
+        if not isinstance(record, dict) or \
+                not isinstance(record.get('name'), _STRING_TYPES) or \
+                not isinstance(record.get('type'), _STRING_TYPES):
+            raise ValueError("%s: record %r must have a string name "
+                             "and type" % (path, record))
+    return zone, desired
+
+
+def reconcile_zone(cloudflare, zone, desired, prune=False, dry_run=False):
+    """
+    Bring records of a zone to desired state
+
+    :param cloudflare: CloudFlare instance
+    :param zone: zone name
+    :param desired: list of desired records
+    :param prune: if True, records absent from desired state are deleted
+    :param dry_run: if True, only count changes
+    :return: ZoneResult
+    """
+    started = time.time()
+    calls_before = cloudflare.api_calls
+
+    zone_id = cloudflare.get_zone_id(zone)
+    current = list(cloudflare.list_dns_records(zone_id,
+                                               fields=RECORD_FIELDS))
+    creates, updates, deletes, unchanged = diff_records(current, desired,
+                                                        prune=prune)
+    if not dry_run:
+        for record_id in deletes:
+            cloudflare.delete_record(zone_id, record_id)
+        for record_id, record in updates:
+            cloudflare.update_record(zone_id, record_id, record)
+        for record in creates:
+            cloudflare.create_record(zone_id, record)
+
+    return ZoneResult(zone=zone,
+                      created=len(creates),
+                      updated=len(updates),
+                      deleted=len(deletes),
+                      unchanged=unchanged,
+                      api_calls=cloudflare.api_calls - calls_before,
+                      elapsed=time.time() - started,
+                      error=None,
+                      retryable=False)
+
+
+_worker_client = None
+_worker_options = None
+
+
+_worker_zone_timeout = None
+
+
+def _init_worker(email, auth_key, api_endpoint, options, zone_timeout):
+    global _worker_client, _worker_options, _worker_zone_timeout
+    _worker_client = CloudFlare(email, auth_key, api_endpoint=api_endpoint)
+    _worker_options = options
+    _worker_zone_timeout = zone_timeout
+
+
+def _reconcile_path(path):
+    started = time.time()
+    calls_before = _worker_client.api_calls
+    zone = os.path.basename(path)[:-len('.json')]
+    try:
+        zone, desired = read_desired_state(path)
+        if _worker_zone_timeout is None:
+            return reconcile_zone(_worker_client, zone, desired,
+                                  **_worker_options)
+        with Deadline(_worker_zone_timeout):
+            return reconcile_zone(_worker_client, zone, desired,
+                                  **_worker_options)
+    except (CloudFlareException, IOError, ValueError) as err:
+        return ZoneResult(zone=zone, created=0, updated=0, deleted=0,
+                          unchanged=0,
+                          api_calls=_worker_client.api_calls - calls_before,
+                          elapsed=time.time() - started,
+                          error='%s: %s' % (err.__class__.__name__, err),
+                          retryable=getattr(err, 'is_retryable', False))
+
+
+class ReconcileReport(object):
+    """
+    Totals of a fleet run collected from workers
+    """
+    def __init__(self):
+        self.zones = 0
+        """Number of reconciled zones"""
+        self.skipped = 0
+        """Number of zones skipped because of the checkpoint"""
+        self.created = 0
+        self.updated = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.api_calls = 0
+        self.elapsed = 0.0
+        """Wall time of the run in seconds"""
+        self.zone_time = 0.0
+        """Sum of the time workers spent on zones in seconds"""
+        self.errors = {}
+        """zone name -> error message"""
+        self.retryable = []
+        """Failed zones that may succeed on the next run"""
+
+    def add(self, result):
+        """
+        Account result of a zone
+
+        :param result: ZoneResult
+        """
+        self.zones += 1
+        self.created += result.created
+        self.updated += result.updated
+        self.deleted += result.deleted
+        self.unchanged += result.unchanged
+        self.api_calls += result.api_calls
+        self.zone_time += result.elapsed
+        if result.error:
+            self.errors[result.zone] = result.error
+            if result.retryable:
+                self.retryable.append(result.zone)
+
+    @property
+    def failed(self):
+        """
+        :return: number of zones that failed
+        """
+        return len(self.errors)
+
+
+class FleetReconciler(object):
+    """
+    Reconciles all zones from a desired state directory in parallel.
+
+    If a checkpoint file is given, every successfully reconciled zone
+    is appended to it. A restarted run skips zones from the checkpoint,
+    so an interrupted run can be resumed. A run without failed zones
+    removes the checkpoint, the next run reconciles all zones again.
+    """
+    def __init__(self, email, auth_key, desired_dir,
+                 api_endpoint=CF_API_ENDPOINT, processes=None,
+                 checkpoint=None, prune=False, dry_run=False,
+                 zone_timeout=None):
+        """
+        FleetReconciler constructor
+
+        :param str email: CloudFlare e-mail
+        :param str auth_key: CloudFlare authentication key
+        :param desired_dir: directory with desired state files
+        :param str api_endpoint: CloudFlare API endpoint
+        :param processes: number of worker processes.
+                          Number of CPUs by default.
+        :param checkpoint: path to checkpoint file or None
+        :param prune: if True, records absent from desired state are deleted
+        :param dry_run: if True, only count changes
+        :param zone_timeout: seconds a worker may spend on one zone.
+                             API calls of a zone that runs out of time
+                             are not sent and the zone fails.
+        """
+        self._email = email
+        self._auth_key = auth_key
+        self._desired_dir = desired_dir
+        self._api_endpoint = api_endpoint
+        self._processes = processes
+        self._checkpoint = checkpoint
+        self._options = {'prune': prune, 'dry_run': dry_run}
+        self._zone_timeout = zone_timeout
+
+    def _done_zones(self):
+        if not self._checkpoint or not os.path.exists(self._checkpoint):
+            return set()
+        with open(self._checkpoint) as checkpoint_file:
+            return set(line.strip() for line in checkpoint_file
+                       if line.strip())
+
+    def run(self, callback=None):
+        """
+        Reconcile zones
+
+        :param callback: function called in the parent process
+                         with ZoneResult of every zone
+        :return: ReconcileReport
+        """
+        started = time.time()
+        report = ReconcileReport()
+        done = self._done_zones()
+        paths = []
+        for path in sorted(glob.glob(os.path.join(self._desired_dir,
+                                                  '*.json'))):
+            if os.path.basename(path)[:-len('.json')] in done:
+                report.skipped += 1
+            else:
+                paths.append(path)
+
+        checkpoint_file = None
+        if self._checkpoint:
+            checkpoint_file = open(self._checkpoint, 'a')
+        pool = multiprocessing.Pool(self._processes,
+                                    initializer=_init_worker,
+                                    initargs=(self._email, self._auth_key,
+                                              self._api_endpoint,
+                                              self._options,
+                                              self._zone_timeout))
+        try:
+            for result in pool.imap_unordered(_reconcile_path, paths):
+                report.add(result)
+                if checkpoint_file and not result.error:
+                    checkpoint_file.write(result.zone + '\n')
+                    checkpoint_file.flush()
+                if callback:
+                    callback(result)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            if checkpoint_file:
+                checkpoint_file.close()
+
+        if self._checkpoint and not report.errors and \
+                os.path.exists(self._checkpoint):
+            os.remove(self._checkpoint)
+        report.elapsed = time.time() - started
+        return report
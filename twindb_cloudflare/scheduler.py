@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+Mutation scheduler.
+
+Changes of mixed urgency go through one queue in front of the client:
+urgent failover updates don't wait behind thousands of routine reconcile
+updates, changes to one record are applied in the order they were
+submitted and zones share the API rate limit fairly.
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+from twindb_cloudflare.sync import TokenBucket
+from twindb_cloudflare.twindb_cloudflare import CloudFlareException
+
+URGENT = 0
+ROUTINE = 1
+BULK = 2
+PRIORITIES = (URGENT, ROUTINE, BULK)
+"""Priority classes, most urgent first"""
+
+DEFAULT_RATE = 4.0
+"""API calls per second. CloudFlare allows 1200 calls in 5 minutes."""
+
+PriorityStats = namedtuple('PriorityStats', [
+    'depth',
+    'submitted',
+    'completed',
+    'mean_wait',
+    'max_wait'
+])
+"""
+Metrics of one priority class. ``depth`` is the number of queued
+changes, ``mean_wait`` and ``max_wait`` are seconds between submission
+and the start of the API call, rate limiting included.
+"""
+
+
+class _Mutation(object):
+    __slots__ = ('future', 'func', 'args', 'kwargs', 'priority', 'record',
+                 'sequence', 'submitted')
+
+    def __init__(self, func, args, kwargs, priority, record, sequence):
+        self.future = Future()
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.record = record
+        self.sequence = sequence
+        self.submitted = time.time()
+
+
+class _RecordQueue(object):
+    """
+    Changes of one record in submission order
+    """
+    def __init__(self):
+        self.pending = deque()
+        self.counts = [0] * len(PRIORITIES)
+        self.head_key = None
+
+    @property
+    def priority(self):
+        for priority in PRIORITIES:
+            if self.counts[priority]:
+                return priority
+
+
+class _ZoneQueue(object):
+    """
+    Changes of one zone. The next change is the first queued change
+    of the record with the most urgent change, so an urgent change
+    goes ahead of other records, but never ahead of earlier changes
+    of its own record.
+    """
+    def __init__(self, zone_id):
+        self.zone_id = zone_id
+        self.records = {}
+        self.heads = []
+        self.size = 0
+        self.counts = [0] * len(PRIORITIES)
+        self.busy = False
+        self.ready_key = None
+
+    @property
+    def priority(self):
+        for priority in PRIORITIES:
+            if self.counts[priority]:
+                return priority
+
+    def append(self, mutation):
+        record = self.records.get(mutation.record)
+        if record is None:
+            record = self.records[mutation.record] = _RecordQueue()
+        record.pending.append(mutation)
+        record.counts[mutation.priority] += 1
+        self.counts[mutation.priority] += 1
+        self.size += 1
+        if record.head_key is None or \
+                mutation.priority < record.head_key[0]:
+            self._push_head(mutation.record, record)
+
+    def popleft(self):
+        while True:
+            head_key = heapq.heappop(self.heads)
+            record = self.records.get(head_key[2])
+            if record is not None and record.head_key == head_key:
+                break
+        mutation = record.pending.popleft()
+        record.counts[mutation.priority] -= 1
+        self.counts[mutation.priority] -= 1
+        self.size -= 1
+        if record.pending:
+            self._push_head(mutation.record, record)
+        else:
+            del self.records[mutation.record]
+        return mutation
+
+    def _push_head(self, key, record):
+        record.head_key = (record.priority, record.pending[0].sequence, key)
+        heapq.heappush(self.heads, record.head_key)
+
+
+class _PriorityMetrics(object):
+    def __init__(self):
+        self.depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class MutationScheduler(object):
+    """
+    Apply changes with worker threads, most urgent zone first.
+
+    Changes of a zone run one at a time. Changes of one record run
+    in submission order, so a record is never updated out of order.
+    A zone runs with the priority of its most urgent queued change:
+    an urgent change moves its zone ahead of every less urgent zone and
+    goes ahead of queued changes of other records of the zone, earlier
+    changes of the same record still go first. Zones of the same
+    priority take turns.
+
+    One rate limiter is shared by all workers. A change takes a token
+    before it starts, so the most urgent zone is picked when the token
+    is there. The first API call of the change uses that token, every
+    further call of the change, e.g. the lookups of
+    CloudFlare.update_dns_record(), takes one more.
+    """
+    def __init__(self, cloudflare, workers=4, rate=DEFAULT_RATE, burst=1):
+        """
+        :param cloudflare: CloudFlare instance
+        :param workers: number of worker threads
+        :param rate: API calls per second
+        :param burst: number of calls that may go at once after idle time
+        """
+        self._cloudflare = cloudflare
+        self._bucket = TokenBucket(rate, burst)
+        self._cond = threading.Condition()
+        self._zones = {}
+        self._ready = []
+        self._turns = itertools.count()
+        self._sequence = itertools.count()
+        self._metrics = dict((priority, _PriorityMetrics())
+                             for priority in PRIORITIES)
+        self._closed = False
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._run,
+                                      name="cloudflare-scheduler-%d" % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def queue_depth(self):
+        """
+        :return: number of queued changes
+        """
+        with self._cond:
+            return sum(metrics.depth for metrics in self._metrics.values())
+
+    def stats(self):
+        """
+        :return: dictionary priority -> PriorityStats
+        """
+        with self._cond:
+            return dict((priority, PriorityStats(
+                depth=metrics.depth,
+                submitted=metrics.submitted,
+                completed=metrics.completed,
+                mean_wait=metrics.total_wait / metrics.completed
+                if metrics.completed else 0.0,
+                max_wait=metrics.max_wait))
+                for priority, metrics in self._metrics.items())
+
+    def submit(self, zone_id, func, args=(), kwargs=None, priority=ROUTINE,
+               record=None):
+        """
+        Queue a change
+
+        :param zone_id: zone the change belongs to
+        :param func: callable that makes the change
+        :param args: positional arguments of func
+        :param kwargs: keyword arguments of func
+        :param priority: URGENT, ROUTINE or BULK
+        :param record: hashable identifier of the record the change
+                       touches, e.g. record id. Changes of one record
+                       run in submission order. Changes without it
+                       keep their order among themselves.
+        :return: concurrent.futures.Future with the result of func
+        :raise: CloudFlareException if the priority is unknown
+                or the scheduler is closed
+        """
+        if priority not in PRIORITIES:
+            raise CloudFlareException("Unknown priority %r" % priority)
+        with self._cond:
+            if self._closed:
+                raise CloudFlareException("Mutation scheduler is closed")
+            mutation = _Mutation(func, args, kwargs or {}, priority, record,
+                                 next(self._sequence))
+            zone = self._zones.get(zone_id)
+            if zone is None:
+                zone = self._zones[zone_id] = _ZoneQueue(zone_id)
+            zone.append(mutation)
+            self._metrics[priority].depth += 1
+            self._metrics[priority].submitted += 1
+            if zone.ready_key is None or priority < zone.ready_key[0]:
+                self._make_ready(zone)
+        return mutation.future
+
+    def create_record(self, zone_id, record, priority=ROUTINE):
+        """
+        Queue CloudFlare.create_record()
+
+        :return: Future with the created record
+        """
+        return self.submit(zone_id, self._cloudflare.create_record,
+                           (zone_id, record), priority=priority,
+                           record=(record.get('name'), record.get('type')))
+
+    def update_record(self, zone_id, record_id, record, priority=ROUTINE):
+        """
+        Queue CloudFlare.update_record()
+
+        :return: Future with the updated record
+        """
+        return self.submit(zone_id, self._cloudflare.update_record,
+                           (zone_id, record_id, record), priority=priority,
+                           record=record_id)
+
+    def delete_record(self, zone_id, record_id, priority=ROUTINE):
+        """
+        Queue CloudFlare.delete_record()
+
+        :return: Future with the API result
+        """
+        return self.submit(zone_id, self._cloudflare.delete_record,
+                           (zone_id, record_id), priority=priority,
+                           record=record_id)
+
+    def close(self, wait=True):
+        """
+        Stop accepting changes. Queued changes are still applied.
+
+        :param wait: if True, wait until all queued changes are applied
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _make_ready(self, zone):
+        if zone.busy or not zone.size:
+            return
+        zone.ready_key = (zone.priority, next(self._turns))
+        heapq.heappush(self._ready, zone.ready_key + (zone.zone_id,))
+        self._cond.notify()
+
+    def _is_stale(self, entry):
+        zone = self._zones.get(entry[2])
+        return zone is None or zone.busy or zone.ready_key != entry[:2]
+
+    def _has_ready(self):
+        while self._ready and self._is_stale(self._ready[0]):
+            heapq.heappop(self._ready)
+        return bool(self._ready)
+
+    def _pop(self):
+        if not self._has_ready():
+            return None
+        zone = self._zones[heapq.heappop(self._ready)[2]]
+        zone.busy = True
+        zone.ready_key = None
+        mutation = zone.popleft()
+        self._metrics[mutation.priority].depth -= 1
+        return zone, mutation
+
+    def _done(self, zone, mutation, started):
+        with self._cond:
+            metrics = self._metrics[mutation.priority]
+            wait = started - mutation.submitted
+            metrics.completed += 1
+            metrics.total_wait += wait
+            metrics.max_wait = max(metrics.max_wait, wait)
+            zone.busy = False
+            if zone.size:
+                self._make_ready(zone)
+            else:
+                del self._zones[zone.zone_id]
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._has_ready():
+                    if self._closed and not self._zones:
+                        return
+                    self._cond.wait()
+
+            self._bucket.acquire()
+            with self._cond:
+                popped = self._pop()
+            if popped is None:
+                self._bucket.refund()
+                continue
+
+            zone, mutation = popped
+            started = time.time()
+            future = mutation.future
+            if not future.set_running_or_notify_cancel():
+                self._bucket.refund()
+            else:
+                try:
+                    with self._bucket.throttle(prepaid=1):
+                        result = mutation.func(*mutation.args,
+                                               **mutation.kwargs)
+                except Exception as err:
+                    future.set_exception(err)
+                else:
+                    future.set_result(result)
+            self._done(zone, mutation, started)
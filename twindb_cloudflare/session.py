@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of HTTP sessions.
+
+requests.Session is not safe to use from several threads at once,
+so every API call borrows a session from the pool for its duration.
+Sessions keep their connections open between calls.
+"""
+import threading
+from contextlib import contextmanager
+
+
+class SessionPool(object):
+    """
+    Thread-safe pool of HTTP sessions.
+
+    A session is created when a thread finds the pool empty.
+    At most ``max_size`` idle sessions are kept, others are closed
+    when returned.
+    """
+    def __init__(self, factory, max_size=10):
+        """
+        SessionPool constructor
+
+        :param factory: callable that creates a new session
+        :param max_size: maximum number of idle sessions
+        """
+        self._factory = factory
+        self._max_size = max_size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._created = 0
+
+    @property
+    def created(self):
+        """
+        :return: number of sessions created by the pool
+        """
+        return self._created
+
+    @property
+    def idle(self):
+        """
+        :return: number of idle sessions in the pool
+        """
+        return len(self._idle)
+
+    def acquire(self):
+        """
+        Take a session from the pool or create a new one
+
+        :return: session
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        return self._factory()
+
+    def release(self, session):
+        """
+        Return a session to the pool
+
+        :param session: session taken by acquire()
+        """
+        with self._lock:
+            if len(self._idle) < self._max_size:
+                self._idle.append(session)
+                return
+        session.close()
+
+    @contextmanager
+    def session(self):
+        """
+        Context manager that borrows a session from the pool
+        """
+        session = self.acquire()
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def close(self):
+        """
+        Close all idle sessions
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.close()
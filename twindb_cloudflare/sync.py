@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Synchronization primitives shared by thread-safe classes of the package.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+def charge_api_call(timeout=None):
+    """
+    Take a token for an API call if the current thread is throttled
+    with TokenBucket.throttle(). Waits until a token is available.
+
+    :param timeout: seconds to wait at most, no limit if None
+    :return: False if no token became available within timeout,
+             True otherwise
+    """
+    throttle = current_throttle()
+    if throttle is None:
+        return True
+    return throttle.charge(timeout)
+
+
+def current_throttle():
+    """
+    :return: rate limit of API calls of the current thread or None
+    """
+    return getattr(_local, 'throttle', None)
+
+
+@contextmanager
+def throttled(throttle):
+    """
+    Context manager that makes the current thread share a rate limit,
+    e.g. one returned by current_throttle() in another thread
+
+    :param throttle: rate limit or None
+    """
+    previous = current_throttle()
+    _local.throttle = throttle
+    try:
+        yield
+    finally:
+        _local.throttle = previous
+
+
+class AtomicCounter(object):
+    """
+    Integer counter that can be incremented from many threads
+    """
+    def __init__(self, value=0):
+        self._value = value
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        """
+        :return: current value
+        """
+        return self._value
+
+    def increment(self, delta=1):
+        """
+        Add delta to the counter
+
+        :param delta: increment, 1 by default
+        :return: new value
+        """
+        with self._lock:
+            self._value += delta
+            return self._value
+
+    def __repr__(self):
+        return 'AtomicCounter(%d)' % self._value
+
+
+class StripedLock(object):
+    """
+    Fixed set of locks. A key is always mapped to the same lock,
+    so threads working on different keys rarely wait for each other.
+    """
+    def __init__(self, stripes=16):
+        """
+        :param stripes: number of locks
+        """
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __len__(self):
+        return len(self._locks)
+
+    def index(self, key):
+        """
+        :param key: hashable key
+        :return: index of the lock for key
+        """
+        return hash(key) % len(self._locks)
+
+    def for_key(self, key):
+        """
+        :param key: hashable key
+        :return: lock for key
+        """
+        return self._locks[self.index(key)]
+
+    def __getitem__(self, index):
+        return self._locks[index]
+
+
+class TokenBucket(object):
+    """
+    Rate limiter. Tokens are added at ``rate`` per second up to
+    ``burst``, every acquire() takes one.
+    """
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: tokens per second
+        :param burst: maximum number of tokens saved up
+        """
+        self._rate = float(rate)
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self._burst,
+                           self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """
+        Take a token, wait until one is available
+
+        :param timeout: seconds to wait at most, no limit if None
+        :return: True if a token was taken, False if none became
+                 available within timeout
+        """
+        end = None if timeout is None else time.time() + timeout
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                delay = (1 - self._tokens) / self._rate
+            if end is not None and now + delay > end:
+                return False
+            time.sleep(delay)
+
+    def refund(self):
+        """
+        Return a token that wasn't used
+        """
+        with self._lock:
+            self._tokens = min(self._burst, self._tokens + 1)
+
+    @contextmanager
+    def throttle(self, prepaid=0):
+        """
+        Context manager that makes every API call of the current thread
+        take a token from the bucket
+
+        :param prepaid: number of calls paid for with tokens
+                        acquired in advance
+        """
+        with throttled(_Throttle(self, prepaid)):
+            yield
+
+
+class _Throttle(object):
+    def __init__(self, bucket, prepaid):
+        self.bucket = bucket
+        self.prepaid = prepaid
+        self._lock = threading.Lock()
+
+    def charge(self, timeout=None):
+        with self._lock:
+            if self.prepaid > 0:
+                self.prepaid -= 1
+                return True
+        return self.bucket.acquire(timeout)
@@ -1,23 +1,302 @@
 # -*- coding: utf-8 -*-
-import json
+import functools
+import time
+from collections import namedtuple
+from contextlib import contextmanager
 
-import requests
-from requests.exceptions import RequestException
+try:
+    from urllib.parse import urlencode
+except ImportError:  # Python 2
+    from urllib import urlencode
+
+from twindb_cloudflare.codec import JSONCodec
+from twindb_cloudflare.deadline import Deadline, current_deadline
+from twindb_cloudflare.session import SessionPool
+from twindb_cloudflare.sync import AtomicCounter, charge_api_call, \
+    current_throttle, throttled
 
 CF_API_ENDPOINT = "https://api.cloudflare.com/client/v4"
 
+DEFAULT_TIMEOUT = (3.05, 30)
+"""Default (connect, read) timeouts of API requests in seconds"""
+
+TARGETED_LOOKUP_MAX = 3
+"""get_record_ids() looks up this many names or fewer
+with a filtered query each"""
+
+# requests is imported on first API call, see _requests().
+# Importing the module costs more than most short-lived callers spend
+# on anything else.
+requests = None
+_RequestException = None
+
+
+def _requests():
+    """
+    Import requests on first use
+
+    :return: requests module
+    """
+    global requests
+    if requests is None:
+        import requests as requests_module
+        requests = requests_module
+    return requests
+
+
+def _request_exception():
+    """
+    :return: requests.exceptions.RequestException class
+    """
+    global _RequestException
+    if _RequestException is None:
+        from requests.exceptions import RequestException
+        _RequestException = RequestException
+    return _RequestException
+
+
+RECORD_FIELDS = ('id', 'name', 'type', 'content', 'ttl', 'proxied',
+                 'priority', 'data')
+"""Fields of the compact record model: everything needed to look up,
+compare and rewrite a record"""
+
+
+HOST_RECORD_TYPES = ("A", "AAAA", "CNAME")
+"""Record types managed by the host methods"""
+
+HostRecordResult = namedtuple('HostRecordResult', ['record_type', 'record',
+                                                   'error'])
+"""
+Result of a host method for one record type. ``record`` is the record
+returned by API, None for deleted records or if the change failed.
+``error`` is the CloudFlareException if the change failed, None otherwise.
+"""
+
+
+def _trim_records(records, fields):
+    """
+    Keep only given fields of records
+
+    :param records: list of records as returned by API
+    :param fields: fields to keep. Fields a record doesn't have
+                   are skipped.
+    :return: list of trimmed records
+    """
+    return [dict([(field, record[field]) for field in fields
+                  if field in record])
+            for record in records]
+
+
+def _record_lookup_url(zone_id, name, record_type=None):
+    """
+    :return: API endpoint that finds records of a name
+    """
+    url = "/zones/%s/dns_records?name=%s" % (zone_id, name)
+    if record_type:
+        url += "&type=%s" % record_type
+    return url
+
+
+def _operation(func):
+    """
+    Mark a client operation. With profiling on, requests made inside
+    are attributed to it.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self._profiler is None:
+            return func(self, *args, **kwargs)
+        with self._profiler.operation(name):
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def _continued(deadline, throttle, stack):
+    """
+    Continue state of another thread in a worker thread: API calls
+    share its deadline and rate limit and, if profiling is on, are
+    attributed to its operations
+
+    :param deadline: Deadline or None
+    :param throttle: rate limit returned by current_throttle()
+    :param stack: operations returned by profiler.current_stack()
+                  or None
+    """
+    with throttled(throttle):
+        if deadline is None:
+            with _continued_stack(stack):
+                yield
+        else:
+            with deadline:
+                with _continued_stack(stack):
+                    yield
+
+
+@contextmanager
+def _continued_stack(stack):
+    if stack is None:
+        yield
+        return
+    from twindb_cloudflare.profiler import continued_stack
+    with continued_stack(stack):
+        yield
+
+
+AUTH_ERROR_CODES = frozenset([6003, 6103, 9103, 9106, 9107, 9109, 10000])
+"""CloudFlare error codes of authentication and authorization errors"""
+
+RATE_LIMIT_ERROR_CODES = frozenset([971, 10013])
+"""CloudFlare error codes of rate limited requests"""
+
+NOT_FOUND_ERROR_CODES = frozenset([1001, 7003, 81044])
+"""CloudFlare error codes of missing zones and records"""
+
 
 class CloudFlareException(Exception):
     """
-    Exception for CloudFlare errors
+    Exception for CloudFlare errors.
+
+    Subclasses tell what went wrong, is_retryable tells whether
+    the same request may succeed if repeated later.
+    """
+    is_retryable = False
+    """True if repeating the request may succeed"""
+
+    def __init__(self, message="", status=None, codes=None,
+                 request_id=None, retry_after=None):
+        """
+        :param message: error message or the original exception
+        :param status: HTTP status code of the response or None
+        :param codes: list of CloudFlare error codes
+        :param request_id: CF-RAY header of the response or None
+        :param retry_after: seconds to wait before repeating
+                            the request or None
+        """
+        super(CloudFlareException, self).__init__(message)
+        self.status = status
+        self.codes = list(codes or [])
+        self.request_id = request_id
+        self.retry_after = retry_after
+
+
+class CloudFlareConnectionError(CloudFlareException):
+    """
+    Network error or timeout, API may not have received the request
+    """
+    is_retryable = True
+
+
+class CloudFlareAPIError(CloudFlareException):
+    """
+    API responded with an error
     """
     pass
 
 
+class AuthenticationError(CloudFlareAPIError):
+    """
+    Credentials are invalid or don't allow the request
+    """
+    pass
+
+
+class NotFoundError(CloudFlareAPIError):
+    """
+    Zone or record doesn't exist
+    """
+    pass
+
+
+class RateLimitError(CloudFlareAPIError):
+    """
+    Too many requests, retry_after tells when to repeat
+    """
+    is_retryable = True
+
+
+class ServerError(CloudFlareAPIError):
+    """
+    API failed to process the request (HTTP 5xx)
+    """
+    is_retryable = True
+
+
+class DeadlineExceeded(CloudFlareException):
+    """
+    Deadline of the operation passed before it finished
+    """
+    pass
+
+
+def _deadline_error(deadline, method, url, cause):
+    """
+    Make DeadlineExceeded for a request that failed with ``cause``
+    and can't be repeated within the deadline
+
+    :return: DeadlineExceeded instance chained from cause
+    """
+    err = DeadlineExceeded("Deadline of %s seconds passed during %s %s: %s"
+                           % (deadline.seconds, method, url, cause))
+    err.__cause__ = cause
+    return err
+
+
+def _error_class(status, codes):
+    codes = set(codes)
+    if status == 429 or codes & RATE_LIMIT_ERROR_CODES:
+        return RateLimitError
+    if status in (401, 403) or codes & AUTH_ERROR_CODES:
+        return AuthenticationError
+    if status == 404 or codes & NOT_FOUND_ERROR_CODES:
+        return NotFoundError
+    if status is not None and status >= 500:
+        return ServerError
+    return CloudFlareAPIError
+
+
+def _retry_after(headers):
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def api_error(message, status=None, errors=None, headers=None):
+    """
+    Create exception for an API error response
+
+    :param message: error message
+    :param status: HTTP status code
+    :param errors: "errors" list of the response
+    :param headers: response headers
+    :return: instance of a CloudFlareAPIError subclass
+    """
+    codes = []
+    for error in errors or []:
+        try:
+            codes.append(int(error['code']))
+        except (KeyError, TypeError, ValueError):
+            pass
+    headers = headers or {}
+    return _error_class(status, codes)(message,
+                                       status=status,
+                                       codes=codes,
+                                       request_id=headers.get('CF-RAY'),
+                                       retry_after=_retry_after(headers))
+
+
 class CloudFlare(object):
     """
     Class to work with CloudFlare API
     https://api.cloudflare.com/
+
+    An instance is safe to share between threads. Every API call
+    borrows an HTTP session from a pool, the response cache and
+    the counters are thread-safe.
     """
     _email = None
     """CloudFlare email"""
@@ -27,17 +306,70 @@ class CloudFlare(object):
     """
     _api_endpoint = None
     """The stable HTTPS endpoint for the latest version"""
+    _api_calls = None
+    """AtomicCounter of API calls issued by this instance"""
+    _cache = None
+    """ResponseCache for GET requests or None"""
+    _cache_scope = None
+    """Key of the client's entries in a shared cache"""
+    _codec = None
+    """JSON codec for request and response bodies"""
+    _sessions = None
+    """SessionPool of HTTP sessions"""
+    _retries = 0
+    """How many times to repeat a request that failed with
+    a retryable error"""
+    _retry_delay = 0.5
+    """Seconds to wait before the first retry"""
+    _timeout = DEFAULT_TIMEOUT
+    """(connect, read) timeouts of a request"""
 
-    def __init__(self, email, auth_key, api_endpoint=CF_API_ENDPOINT):
+    def __init__(self, email, auth_key, api_endpoint=CF_API_ENDPOINT,
+                 cache=None, codec=None, max_sessions=10,
+                 retries=0, retry_delay=0.5, timeout=DEFAULT_TIMEOUT,
+                 profile=False):
         """
         CloudFlare class constructor
         :param str email: CloudFlare e-mail
         :param str auth_key: CloudFlare authentication key
         :param str api_endpoint: CloudFlare API endpoint
+        :param cache: ResponseCache instance to cache GET responses.
+                      Responses aren't cached by default. A cache may
+                      be shared by clients of different accounts.
+        :param codec: JSON codec, see twindb_cloudflare.codec.get_codec().
+                      The stdlib json codec by default.
+        :param max_sessions: number of idle HTTP sessions to keep open.
+                             Set it to the number of threads that use
+                             the instance.
+        :param retries: how many times to repeat a request that failed
+                        with a retryable error. Not repeated by default.
+        :param retry_delay: seconds to wait before the first retry.
+                            The delay doubles with every retry unless
+                            API sends Retry-After.
+        :param timeout: seconds to wait for connection and for response
+                        data. Either a number for both or a tuple
+                        (connect, read).
+        :param profile: if True, time phases of every request,
+                        see twindb_cloudflare.profiler.
         """
         self._api_endpoint = api_endpoint
         self._auth_key = auth_key
         self._email = email
+        self._cache = cache
+        self._cache_scope = (api_endpoint, email)
+        self._codec = codec or JSONCodec()
+        self._api_calls = AtomicCounter()
+        self._sessions = SessionPool(self._new_session,
+                                     max_size=max_sessions)
+        self._retries = retries
+        self._retry_delay = retry_delay
+        if not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        self._timeout = timeout
+        self._profiler = None
+        if profile:
+            from twindb_cloudflare.profiler import Profiler
+            self._profiler = Profiler()
 
     @property
     def email(self):
@@ -57,13 +389,189 @@ class CloudFlare(object):
         """
         return self._auth_key
 
-    def _api_call(self, url, method="GET", data=None):
+    @property
+    def api_calls(self):
+        """
+        Number of API calls issued by this instance so far.
+        Failed calls are counted too.
+
+        :return: number of calls
+        """
+        return self._api_calls.value
+
+    @property
+    def cache(self):
+        """
+        :return: ResponseCache or None if responses aren't cached
+        """
+        return self._cache
+
+    @property
+    def profiler(self):
+        """
+        :return: Profiler with timings of requests if the client was
+                 created with ``profile=True``, None otherwise
+        """
+        return self._profiler
+
+    @staticmethod
+    def deadline(seconds):
+        """
+        Create a deadline for a group of API calls.
+        While the deadline is active, every call gets only the time
+        that is left and fails with DeadlineExceeded when nothing is left::
+
+            with cloudflare.deadline(5):
+                cloudflare.update_dns_record("www.twindb.com", "twindb.com",
+                                             "10.0.0.2")
+
+        :param seconds: time budget in seconds
+        :return: Deadline, a context manager
+        """
+        return Deadline(seconds)
+
+    def _new_session(self):
+        """
+        Create HTTP session for the session pool.
+
+        requests asks for compressed responses by default, including
+        brotli and zstd if their modules are installed. The body is
+        decompressed in memory when it is read.
+        """
+        session = _requests().Session()
+        if self._profiler is not None:
+            from twindb_cloudflare.profiler import timed_adapter
+            adapter = timed_adapter()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        return session
+
+    def _api_call(self, url, method="GET", data=None, use_cache=True):
         """
         Do API call
 
+        If the client has a cache, fresh cached responses to GET requests
+        are returned without calling API, stale ones are revalidated with
+        their ETag. The cache keeps response bodies, every hit is decoded
+        again, so callers may change the returned objects. Any other
+        method invalidates cached responses of the zone it changes.
+
+        :param url: API endpoint
+        :param method: HTTP method
+        :param data: request body encoded by the codec
+        :param use_cache: if False, a GET request is sent even if
+                          a fresh response is cached. The response
+                          still replaces the cached one.
+        :return json: Response from API in JSON object
+        :raise: CloudFlareException if API response is not 200
+                or error in input parameters
+        """
+        if self._cache is None:
+            return self._api_request(url, method=method, data=data)
+
+        if method != "GET":
+            try:
+                return self._api_request(url, method=method, data=data)
+            finally:
+                self._cache.invalidate(url)
+
+        generation = self._cache.generation(url)
+        if not use_cache:
+            return self._api_request(url, generation=generation)
+        entry = self._cache.get(url, scope=self._cache_scope)
+        if entry is not None and entry.is_fresh():
+            return self._codec.decode(entry.response)
+
+        return self._api_request(url, cached=entry, generation=generation)
+
+    def _api_request(self, url, method="GET", data=None,
+                     cached=None, generation=None):
+        """
+        Send request to API, repeat it if it fails with a retryable error.
+
+        POST requests aren't idempotent, they are repeated only
+        if API rejected them with RateLimitError.
+
+        If a deadline is active, the request isn't sent or repeated
+        after it passes, nor when the rate limit of the thread doesn't
+        give a token before it passes. A retryable error that happens
+        when the deadline has passed, or whose retry wouldn't fit in the
+        time left, is raised as DeadlineExceeded with the error as its
+        ``__cause__``.
+
+        :param url: API endpoint
+        :param method: HTTP method
+        :param data: request body encoded by the codec
+        :param cached: stale CacheEntry of a GET request to revalidate
+        :param generation: cache generation of the zone before the request
+        :return json: Response from API in JSON object
+        :raise: CloudFlareException if API response is not 200
+                or error in input parameters
+        """
+        deadline = current_deadline()
+        attempt = 0
+        while True:
+            timeout = self._timeout
+            if deadline is None:
+                charge_api_call()
+            else:
+                if deadline.expired:
+                    raise DeadlineExceeded("Deadline of %s seconds passed "
+                                           "before %s %s"
+                                           % (deadline.seconds, method, url))
+                if not charge_api_call(deadline.remaining()):
+                    raise DeadlineExceeded("Deadline of %s seconds passes "
+                                           "waiting for rate limit before "
+                                           "%s %s"
+                                           % (deadline.seconds, method, url))
+                remaining = deadline.remaining()
+                if remaining <= 0:
+                    raise DeadlineExceeded("Deadline of %s seconds passed "
+                                           "before %s %s"
+                                           % (deadline.seconds, method, url))
+                timeout = tuple(min(value, remaining) for value in timeout)
+            try:
+                if self._profiler is None:
+                    return self._send(url, method=method, data=data,
+                                      cached=cached, generation=generation,
+                                      timeout=timeout)
+                with self._profiler.request(method, url) as timer:
+                    return self._send(url, method=method, data=data,
+                                      cached=cached, generation=generation,
+                                      timeout=timeout, timer=timer)
+            except CloudFlareException as err:
+                if not err.is_retryable:
+                    raise
+                if deadline is not None and deadline.expired:
+                    raise _deadline_error(deadline, method, url, err)
+                if attempt >= self._retries:
+                    raise
+                if method == "POST" and not isinstance(err, RateLimitError):
+                    raise
+                if err.retry_after is not None:
+                    delay = err.retry_after
+                else:
+                    delay = self._retry_delay * 2 ** attempt
+                if deadline is not None and delay >= deadline.remaining():
+                    raise _deadline_error(deadline, method, url, err)
+                time.sleep(delay)
+                if self._profiler is not None:
+                    self._profiler.add(method, url, 'retry_wait', delay)
+                attempt += 1
+
+    def _send(self, url, method="GET", data=None,
+              cached=None, generation=None, timeout=None, timer=None):
+        """
+        Send one request to API
+
         :param url: API endpoint
         :param method: HTTP method
-        :param data: dictionary with CloudFlare parameters
+        :param data: request body encoded by the codec
+        :param cached: stale CacheEntry of a GET request to revalidate
+        :param generation: cache generation of the zone before the request
+        :param timeout: (connect, read) timeouts. The client's timeouts
+                        by default.
+        :param timer: RequestTimer to report phases to if profiling is on
         :return json: Response from API in JSON object
         :raise: CloudFlareException if API response is not 200
                 or error in input parameters
@@ -77,42 +585,107 @@ class CloudFlare(object):
                 raise CloudFlareException("Method %s does not allow data"
                                           % method)
 
+        if cached is not None and cached.etag:
+            headers['If-None-Match'] = cached.etag
+
         req_params = {
-            'headers': headers
+            'headers': headers,
+            'timeout': timeout or self._timeout
         }
         if data:
             req_params['data'] = data
+        if timer is not None:
+            # Read the body below to time the download separately
+            req_params['stream'] = True
 
         real_url = self._api_endpoint + url
+        self._api_calls.increment()
+        request_exception = _request_exception()
+        started = time.time()
         try:
-            if method == "GET":
-                r = requests.get(real_url, **req_params)
-            elif method == "POST":
-                r = requests.post(real_url, **req_params)
-            elif method == "PUT":
-                r = requests.put(real_url, **req_params)
-            elif method == "PATCH":
-                r = requests.patch(real_url, **req_params)
-            elif method == "DELETE":
-                r = requests.delete(real_url, **req_params)
-            else:
-                raise CloudFlareException("Method %s is not supported")
+            with self._sessions.session() as session:
+                if timer is not None:
+                    timer.add('queue', time.time() - started)
+                if method == "GET":
+                    r = session.get(real_url, **req_params)
+                elif method == "POST":
+                    r = session.post(real_url, **req_params)
+                elif method == "PUT":
+                    r = session.put(real_url, **req_params)
+                elif method == "PATCH":
+                    r = session.patch(real_url, **req_params)
+                elif method == "DELETE":
+                    r = session.delete(real_url, **req_params)
+                else:
+                    raise CloudFlareException("Method %s is not supported"
+                                              % method)
+
+                if timer is not None:
+                    with timer.phase('download'):
+                        r.content
+                r.raise_for_status()
+        except request_exception as err:
+            raise self._request_error(err)
 
-            r.raise_for_status()
-        except RequestException as err:
-            raise CloudFlareException(err)
-        r_json = r.json()
+        revalidated = cached is not None and r.status_code == 304
+        if revalidated:
+            self._cache.refresh(url, scope=self._cache_scope)
+            body = cached.response
+        else:
+            body = r.content
+
+        started = time.time()
+        try:
+            r_json = self._codec.decode(body)
+        except ValueError as err:
+            raise CloudFlareAPIError(err)
+        if timer is not None:
+            timer.add('decode', time.time() - started)
         try:
             if r_json['success']:
+                if self._cache is not None and method == "GET" and \
+                        not revalidated:
+                    self._cache.put(url, body,
+                                    etag=r.headers.get('ETag'),
+                                    generation=generation,
+                                    scope=self._cache_scope)
                 return r_json
             else:
                 msg = 'CloudFlare API call failed with errors'
                 if 'errors' in r_json:
                     msg += ': %r' % r_json['errors']
-                raise CloudFlareException(msg)
+                raise api_error(msg, status=getattr(r, 'status_code', None),
+                                errors=r_json.get('errors'),
+                                headers=getattr(r, 'headers', None))
         except (KeyError, TypeError) as err:
-            raise CloudFlareException(err)
+            raise CloudFlareAPIError(err)
+
+    def _request_error(self, err):
+        """
+        Convert exception raised by requests to CloudFlareException
+
+        :param err: requests.exceptions.RequestException instance
+        :return: CloudFlareException instance
+        """
+        from requests import exceptions
 
+        response = getattr(err, 'response', None)
+        if response is not None:
+            try:
+                errors = self._codec.decode(response.content)['errors']
+            except (ValueError, KeyError, TypeError):
+                errors = None
+            return api_error(err, status=response.status_code,
+                             errors=errors, headers=response.headers)
+        if isinstance(err, exceptions.HTTPError):
+            return CloudFlareAPIError(err)
+        if isinstance(err, (exceptions.ConnectionError,
+                            exceptions.Timeout,
+                            exceptions.ChunkedEncodingError)):
+            return CloudFlareConnectionError(err)
+        return CloudFlareException(err)
+
+    @_operation
     def get_zone_id(self, name):
         """
         Get zone id of a given zone
@@ -124,25 +697,229 @@ class CloudFlare(object):
         try:
             response = self._api_call("/zones?name=%s" % name)
             return response["result"][0]["id"]
-        except IndexError as err:
-            raise CloudFlareException(err)
+        except IndexError:
+            raise NotFoundError("Zone %s is not found" % name)
 
-    def get_record_id(self, domain_name, zone_id):
+    @_operation
+    def get_record_id(self, domain_name, zone_id, record_type=None):
         """
         Get record id by its name
 
         :param domain_name: DNS record name "example.com"
         :param zone_id: zone identified (returned by get_zone_id())
+        :param record_type: look up only records of this type
         :return: id of the record
         :raise: CloudFlareException if record is not found or other error
         """
         try:
-            response = self._api_call("/zones/%s/dns_records?name=%s" %
-                                      (zone_id, domain_name))
+            response = self._api_call(_record_lookup_url(zone_id,
+                                                         domain_name,
+                                                         record_type))
             return response["result"][0]["id"]
-        except IndexError as err:
-            raise CloudFlareException(err)
+        except IndexError:
+            raise NotFoundError("Record %s is not found" % domain_name)
+
+    @_operation
+    def dns_records_page(self, zone_id, page=1, per_page=100, name=None,
+                         record_type=None, fields=None, order=None,
+                         direction=None, use_cache=True):
+        """
+        Get one page of DNS records of a zone
+
+        :param zone_id: zone identifier (returned by get_zone_id())
+        :param page: page number, starting from 1
+        :param per_page: number of records on the page
+        :param name: return only records with this name
+        :param record_type: return only records of this type
+        :param fields: keep only these fields of the records
+        :param order: field to sort records by, e.g. "modified_on"
+        :param direction: sort direction - "asc" or "desc"
+        :param use_cache: if False, the page is read from API even if
+                          the client has it cached
+        :return: tuple (list of records, result_info). result_info
+                 is the pagination info from API: page, per_page,
+                 count, total_count and total_pages.
+        :raise: CloudFlareException if error
+        """
+        params = [("per_page", per_page)]
+        if name:
+            params.append(("name", name))
+        if record_type:
+            params.append(("type", record_type))
+        if order:
+            params.append(("order", order))
+        if direction:
+            params.append(("direction", direction))
+        params.append(("page", page))
+
+        response = self._api_call("/zones/%s/dns_records?%s" %
+                                  (zone_id, urlencode(params)),
+                                  use_cache=use_cache)
+        result_info = response.get("result_info") or {}
+        if fields is None:
+            return response["result"], result_info
+        return _trim_records(response["result"], fields), result_info
+
+    def _dns_records_page(self, zone_id, page, per_page=100,
+                          name=None, record_type=None, fields=None,
+                          use_cache=True):
+        """
+        Get one page of DNS records of a zone
+
+        :return: tuple (list of records, total number of pages)
+        :raise: CloudFlareException if error
+        """
+        records, result_info = self.dns_records_page(
+            zone_id, page=page, per_page=per_page, name=name,
+            record_type=record_type, fields=fields, use_cache=use_cache)
+        return records, result_info.get("total_pages", page)
+
+    def list_dns_records(self, zone_id, name=None, record_type=None,
+                         per_page=100, fields=None, use_cache=True):
+        """
+        Iterate over DNS records of a zone. Pages are fetched
+        as the iteration goes.
+
+        API always returns full records. With ``fields`` each page
+        is trimmed as soon as it is decoded, so a big zone never
+        stays in memory with all its metadata.
+
+        :param zone_id: zone identifier (returned by get_zone_id())
+        :param name: return only records with this name
+        :param record_type: return only records of this type
+        :param per_page: number of records in one API call
+        :param fields: keep only these fields of the records,
+                       e.g. RECORD_FIELDS. All fields by default.
+        :param use_cache: if False, pages are read from API even if
+                          the client has them cached
+        :return: iterator over records as returned by API
+        :raise: CloudFlareException if error
+        """
+        page = 1
+        while True:
+            records, total_pages = self._dns_records_page(
+                zone_id, page, per_page=per_page,
+                name=name, record_type=record_type, fields=fields,
+                use_cache=use_cache)
+            for record in records:
+                yield record
+            if page >= total_pages:
+                return
+            page += 1
+
+    @_operation
+    def get_record_ids(self, zone_id, names, record_type=None,
+                       per_page=100):
+        """
+        Get ids of many records of a zone at once.
+
+        A few names are looked up with a filtered query each. For more
+        names the first page of the full listing is fetched, it tells
+        the zone size. If the rest of the listing takes fewer API calls
+        than the names still not found, the whole zone is listed and
+        the names are looked up in memory. Otherwise the remaining
+        names are queried one by one.
+
+        If a name has several records, the id of the first one is returned
+        like get_record_id() does.
+
+        :param zone_id: zone identifier (returned by get_zone_id())
+        :param names: list of DNS record names
+        :param record_type: look up only records of this type
+        :param per_page: number of records in one listing API call
+        :return: tuple (dictionary name -> record id, list of names
+                 that weren't found)
+        :raise: CloudFlareException if error, e.g. NotFoundError
+                if the zone doesn't exist
+        """
+        pending = []
+        seen = set()
+        for name in names:
+            if name not in seen:
+                seen.add(name)
+                pending.append(name)
+        ids = {}
 
+        if len(pending) > TARGETED_LOOKUP_MAX:
+            wanted = {}
+            for name in pending:
+                wanted.setdefault(name.lower(), []).append(name)
+
+            def collect(records):
+                for record in records:
+                    for name in wanted.get(record["name"].lower(), ()):
+                        if name not in ids:
+                            ids[name] = record["id"]
+
+            records, total_pages = self._dns_records_page(
+                zone_id, 1, per_page=per_page, record_type=record_type)
+            collect(records)
+            pending = [name for name in pending if name not in ids]
+
+            if pending and total_pages - 1 <= len(pending):
+                for page in range(2, total_pages + 1):
+                    records, _ = self._dns_records_page(
+                        zone_id, page, per_page=per_page,
+                        record_type=record_type)
+                    collect(records)
+                return ids, [name for name in pending if name not in ids]
+
+        missing = []
+        for name in pending:
+            response = self._api_call(_record_lookup_url(zone_id, name,
+                                                         record_type))
+            if response["result"]:
+                ids[name] = response["result"][0]["id"]
+            else:
+                missing.append(name)
+        return ids, missing
+
+    @_operation
+    def create_record(self, zone_id, record):
+        """
+        Create DNS record in a zone given by its identifier
+
+        :param zone_id: zone identifier (returned by get_zone_id())
+        :param record: dictionary with record fields - name, type,
+                       content, ttl etc.
+        :return: the created record
+        :raise: CloudFlareException if error
+        """
+        url = "/zones/%s/dns_records" % zone_id
+        response = self._api_call(url, method="POST",
+                                  data=self._codec.encode(record))
+        return response["result"]
+
+    @_operation
+    def update_record(self, zone_id, record_id, record):
+        """
+        Replace DNS record given by its identifier
+
+        :param zone_id: zone identifier (returned by get_zone_id())
+        :param record_id: record identifier
+        :param record: dictionary with record fields - name, type,
+                       content, ttl etc.
+        :return: the updated record
+        :raise: CloudFlareException if error
+        """
+        url = "/zones/%s/dns_records/%s" % (zone_id, record_id)
+        response = self._api_call(url, method="PUT",
+                                  data=self._codec.encode(record))
+        return response["result"]
+
+    @_operation
+    def delete_record(self, zone_id, record_id):
+        """
+        Delete DNS record given by its identifier
+
+        :param zone_id: zone identifier (returned by get_zone_id())
+        :param record_id: record identifier
+        :raise: CloudFlareException if error
+        """
+        url = "/zones/%s/dns_records/%s" % (zone_id, record_id)
+        self._api_call(url, method="DELETE")
+
+    @_operation
     def update_dns_record(self, name, zone, content, record_type="A", ttl=1):
         """
         Update DNS record
@@ -157,7 +934,8 @@ class CloudFlare(object):
         """
         zone_id = self.get_zone_id(zone)
 
-        record_id = self.get_record_id(name, zone_id)
+        record_id = self.get_record_id(name, zone_id,
+                                       record_type=record_type)
 
         url = "/zones/%s/dns_records/%s" % (zone_id, record_id)
         data = {
@@ -168,8 +946,9 @@ class CloudFlare(object):
             "ttl": ttl
         }
 
-        self._api_call(url, method="PUT", data=json.dumps(data))
+        self._api_call(url, method="PUT", data=self._codec.encode(data))
 
+    @_operation
     def create_dns_record(self, name, zone, content,
                           data=None, record_type="A", ttl=1):
         """
@@ -207,8 +986,9 @@ class CloudFlare(object):
         if data:
             request["data"] = data
 
-        self._api_call(url, method="POST", data=json.dumps(request))
+        self._api_call(url, method="POST", data=self._codec.encode(request))
 
+    @_operation
     def delete_dns_record(self, name, zone):
         """
         Delete DNS record
@@ -223,3 +1003,207 @@ class CloudFlare(object):
         url = "/zones/%s/dns_records/%s" % (zone_id, record_id)
 
         self._api_call(url, method="DELETE")
+
+    def _host_records(self, name, zone):
+        """
+        Look up a zone and all records of a name with two API calls
+
+        :return: tuple (zone id, dictionary record type -> record)
+        """
+        zone_id = self.get_zone_id(zone)
+        records = {}
+        for record in self.list_dns_records(zone_id, name=name,
+                                            fields=RECORD_FIELDS):
+            records.setdefault(record["type"], record)
+        return zone_id, records
+
+    @staticmethod
+    def _check_host_types(record_types):
+        if not record_types:
+            raise CloudFlareException("No record types given")
+        for record_type in record_types:
+            if record_type not in HOST_RECORD_TYPES:
+                raise CloudFlareException("Record type %s is not one of %s"
+                                          % (record_type,
+                                             ", ".join(HOST_RECORD_TYPES)))
+        if "CNAME" in record_types and len(set(record_types)) > 1:
+            raise CloudFlareException("CNAME record can't be combined "
+                                      "with other record types")
+
+    def _host_changes(self, changes, results):
+        """
+        Apply changes of a host concurrently.
+
+        Worker threads continue the deadline, the rate limit and
+        the profiled operations of the calling thread.
+
+        :param changes: dictionary record type -> callable
+        :param results: dictionary record type -> HostRecordResult
+                        to add results to
+        :return: results
+        """
+        def apply_change(record_type, change):
+            try:
+                return HostRecordResult(record_type, change(), None)
+            except CloudFlareException as err:
+                return HostRecordResult(record_type, None, err)
+
+        if len(changes) == 1:
+            for record_type, change in changes.items():
+                results[record_type] = apply_change(record_type, change)
+            return results
+
+        deadline = current_deadline()
+        throttle = current_throttle()
+        stack = None
+        if self._profiler is not None:
+            from twindb_cloudflare.profiler import current_stack
+            stack = current_stack()
+
+        def apply_in_worker(record_type, change):
+            with _continued(deadline, throttle, stack):
+                return apply_change(record_type, change)
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(changes)) as executor:
+            futures = [executor.submit(apply_in_worker, record_type, change)
+                       for record_type, change in changes.items()]
+        for future in futures:
+            result = future.result()
+            results[result.record_type] = result
+        return results
+
+    @staticmethod
+    def _host_record(name, record_type, content, ttl):
+        return {
+            "name": name,
+            "type": record_type,
+            "content": content,
+            "ttl": ttl
+        }
+
+    @_operation
+    def update_host(self, name, zone, contents, ttl=1):
+        """
+        Update A, AAAA or CNAME records of a name at once.
+
+        The zone and the records are looked up once for all types,
+        the records are updated concurrently.
+
+        :param name: DNS record name - "www.twindb.com"
+        :param zone: zone name
+        :param contents: dictionary record type -> content, e.g.
+                         {"A": "10.0.0.1", "AAAA": "fd00::1"}
+        :param ttl: TTL of the records. 1 by default
+        :return: dictionary record type -> HostRecordResult. A type
+                 without a record fails with NotFoundError.
+        :raise: CloudFlareException if the zone lookup fails
+                or the record types are not supported or combine
+                CNAME with other types
+        """
+        self._check_host_types(contents)
+        zone_id, records = self._host_records(name, zone)
+
+        results = {}
+        changes = {}
+        for record_type, content in contents.items():
+            record = records.get(record_type)
+            if record is None:
+                results[record_type] = HostRecordResult(
+                    record_type, None,
+                    NotFoundError("Record %s %s is not found"
+                                  % (record_type, name)))
+                continue
+            changes[record_type] = functools.partial(
+                self.update_record, zone_id, record["id"],
+                self._host_record(name, record_type, content, ttl))
+
+        return self._host_changes(changes, results)
+
+    @_operation
+    def create_host(self, name, zone, contents, ttl=1):
+        """
+        Create A, AAAA or CNAME records of a name at once.
+
+        The zone is looked up once, the records are created concurrently.
+
+        :param name: DNS record name - "www.twindb.com"
+        :param zone: zone name
+        :param contents: dictionary record type -> content, e.g.
+                         {"A": "10.0.0.1", "AAAA": "fd00::1"}
+        :param ttl: TTL of the records. 1 by default
+        :return: dictionary record type -> HostRecordResult
+        :raise: CloudFlareException if the zone lookup fails
+                or the record types are not supported or combine
+                CNAME with other types
+        """
+        self._check_host_types(contents)
+        zone_id = self.get_zone_id(zone)
+
+        changes = dict(
+            (record_type, functools.partial(
+                self.create_record, zone_id,
+                self._host_record(name, record_type, content, ttl)))
+            for record_type, content in contents.items())
+
+        return self._host_changes(changes, {})
+
+    @_operation
+    def delete_host(self, name, zone, record_types=("A", "AAAA")):
+        """
+        Delete records of a name at once.
+
+        The zone and the records are looked up once for all types,
+        the records are deleted concurrently.
+
+        :param name: DNS record name - "www.twindb.com"
+        :param zone: zone name
+        :param record_types: types of records to delete, A and AAAA
+                             by default
+        :return: dictionary record type -> HostRecordResult. A type
+                 without a record fails with NotFoundError.
+        :raise: CloudFlareException if the zone lookup fails
+                or the record types are not supported or combine
+                CNAME with other types
+        """
+        self._check_host_types(record_types)
+        zone_id, records = self._host_records(name, zone)
+
+        results = {}
+        changes = {}
+        for record_type in record_types:
+            record = records.get(record_type)
+            if record is None:
+                results[record_type] = HostRecordResult(
+                    record_type, None,
+                    NotFoundError("Record %s %s is not found"
+                                  % (record_type, name)))
+                continue
+            changes[record_type] = functools.partial(
+                self.delete_record, zone_id, record["id"])
+
+        return self._host_changes(changes, results)
+
+    @staticmethod
+    def wait_for_propagation(name, expected_content, resolvers=None,
+                             record_type="A", timeout=300):
+        """
+        Wait until DNS resolvers see a record change
+
+        :param name: domain name
+        :param expected_content: content of DNS record. For A records that
+                                 would be IP address
+        :param resolvers: list of resolvers - "8.8.8.8", "127.0.0.1:5353".
+                          Public resolvers by default.
+        :param record_type: DNS record type. "A" by default
+        :param timeout: seconds to wait for all resolvers
+        :return: dictionary resolver -> seconds it took the resolver
+                 to return expected content or None if it didn't in time
+        :raise: ValueError if the list of resolvers is empty
+        """
+        from twindb_cloudflare import propagation
+
+        return propagation.wait_for_propagation(name, expected_content,
+                                                resolvers=resolvers,
+                                                record_type=record_type,
+                                                timeout=timeout)
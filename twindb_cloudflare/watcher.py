@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Zone change watcher.
+
+The watcher polls DNS records of a zone and reports records created,
+modified or deleted since the previous poll, e.g. by hand in the
+dashboard. Records are listed most recently modified first, so a poll
+reads only the pages with records changed after the previous one.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+from twindb_cloudflare.twindb_cloudflare import CloudFlareException, \
+    RECORD_FIELDS
+
+CREATED = 'created'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+
+WatchEvent = namedtuple('WatchEvent', ['kind', 'record_id', 'record'])
+"""
+Change of one record. ``kind`` is CREATED, MODIFIED or DELETED,
+``record`` is the record trimmed to RECORD_FIELDS and ``modified_on``.
+A deleted record has only ``id``, ``name`` and ``type``.
+"""
+
+WATCHED_FIELDS = RECORD_FIELDS + ('modified_on',)
+
+_HASHED_FIELDS = tuple(field for field in RECORD_FIELDS if field != 'id')
+
+
+def record_digest(record):
+    """
+    Hash of the record content
+
+    :param record: record as returned by API
+    :return: 8 bytes digest of the fields in RECORD_FIELDS
+    """
+    data = json.dumps([record.get(field) for field in _HASHED_FIELDS],
+                      sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).digest()[:8]
+
+
+class ZoneWatcher(object):
+    """
+    Poll records of a zone and report changes.
+
+    The first poll lists the whole zone and remembers a digest, name
+    and type of every record, not the records themselves. Next polls
+    read pages sorted by modified_on and stop at the first page
+    that ends with a record not modified since the previous poll.
+    Deleted records don't show up in such pages: when the number
+    of records in the zone doesn't match the snapshot, the whole zone
+    is listed again to find them. The zone is listed again as well
+    if a page is not sorted by modified_on, newest first.
+
+    Listings bypass the client's response cache, a cached page would
+    hide changes until it expires.
+    """
+    def __init__(self, cloudflare, zone_id, interval=60, per_page=100,
+                 callback=None):
+        """
+        :param cloudflare: CloudFlare instance
+        :param zone_id: zone identifier (returned by get_zone_id())
+        :param interval: seconds between polls of the background thread
+        :param per_page: number of records in one API call
+        :param callback: function called with every WatchEvent
+                         by the background thread
+        """
+        self._cloudflare = cloudflare
+        self._zone_id = zone_id
+        self._interval = interval
+        self._per_page = per_page
+        self._callback = callback
+        self._snapshot = {}
+        self._mark = ''
+        self._scanned = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.full_scans = 0
+        """Number of times the whole zone was listed"""
+        self.last_error = None
+        """CloudFlareException of the last failed background poll,
+        None if the last poll succeeded"""
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def poll(self):
+        """
+        Find changes since the previous poll. The first poll takes
+        the snapshot and reports nothing.
+
+        :return: list of WatchEvent
+        :raise: CloudFlareException if error
+        """
+        with self._lock:
+            if not self._scanned:
+                self._full_scan()
+                self._scanned = True
+                return []
+            events, complete = self._incremental_scan()
+            if not complete:
+                events.extend(self._full_scan())
+            return events
+
+    def _apply(self, record):
+        """
+        Update the snapshot with a listed record
+
+        :return: WatchEvent or None if the record didn't change
+        """
+        if record['modified_on'] > self._mark:
+            self._mark = record['modified_on']
+        digest = record_digest(record)
+        known = self._snapshot.get(record['id'])
+        if known is not None and known[0] == digest:
+            return None
+        self._snapshot[record['id']] = (digest, record['name'],
+                                        record['type'])
+        return WatchEvent(MODIFIED if known else CREATED,
+                          record['id'], record)
+
+    def _incremental_scan(self):
+        """
+        Read pages with records modified since the previous poll
+
+        :return: tuple (list of WatchEvent, True if the snapshot is
+                 complete). It isn't complete if the number of records
+                 changed or the pages weren't sorted.
+        """
+        mark = self._mark
+        previous = None
+        events = []
+        page = 1
+        while True:
+            records, result_info = self._cloudflare.dns_records_page(
+                self._zone_id, page=page, per_page=self._per_page,
+                fields=WATCHED_FIELDS, order='modified_on',
+                direction='desc', use_cache=False)
+            for record in records:
+                if previous is not None and \
+                        record['modified_on'] > previous:
+                    return events, False
+                previous = record['modified_on']
+                event = self._apply(record)
+                if event is not None:
+                    events.append(event)
+            if not records or records[-1]['modified_on'] < mark or \
+                    page >= result_info.get('total_pages', page):
+                break
+            page += 1
+        total_count = result_info.get('total_count', len(self._snapshot))
+        return events, total_count == len(self._snapshot)
+
+    def _full_scan(self):
+        events = []
+        seen = set()
+        for record in self._cloudflare.list_dns_records(
+                self._zone_id, per_page=self._per_page,
+                fields=WATCHED_FIELDS, use_cache=False):
+            seen.add(record['id'])
+            event = self._apply(record)
+            if event is not None:
+                events.append(event)
+        self.full_scans += 1
+
+        for record_id in [record_id for record_id in self._snapshot
+                          if record_id not in seen]:
+            _, name, record_type = self._snapshot.pop(record_id)
+            events.append(WatchEvent(DELETED, record_id,
+                                     {'id': record_id, 'name': name,
+                                      'type': record_type}))
+        return events
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                events = self.poll()
+                self.last_error = None
+            except CloudFlareException as err:
+                self.last_error = err
+                events = []
+            for event in events:
+                self._callback(event)
+            self._stop.wait(max(0, self._interval -
+                                (time.time() - started)))
+
+    def start(self):
+        """
+        Poll the zone every ``interval`` seconds in a background thread
+        and pass changes to the callback. A failed poll is retried
+        on the next round, the error is kept in ``last_error``.
+        """
+        if self._thread is not None:
+            raise CloudFlareException("Zone watcher already started")
+        if self._callback is None:
+            raise CloudFlareException("Zone watcher needs a callback")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="cloudflare-watcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread and wait until it exits.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None